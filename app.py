@@ -1,12 +1,45 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
 import re
 from datetime import datetime
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
 import io
+import tempfile
 import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from procesamiento import (
+    TOLERANCIA_MINUTOS,
+    FORMATOS_DESCARGA,
+    MEMORIA_MB_POR_DEFECTO,
+    MODOS_COINCIDENCIA,
+    COLUMNAS_TRABAJO,
+    ESTADOS_RESUMEN,
+    FILAS_POR_PAGINA,
+    armar_trabajos,
+    preparar_bases,
+    validar_coincidencias,
+    contar_coincidencias,
+    resumir_validacion,
+    indexar_consulta,
+    filtrar_consulta,
+    pagina_consulta,
+    crear_archivo_consulta,
+    notificar,
+    llave_cache,
+    ventana_en_segundos,
+    crear_archivos_descarga,
+    fechar_nombre,
+    conciliar_por_particiones,
+    directorio_estado,
+    conciliar_incremental,
+    cargar_conciliacion,
+    configurar_log,
+    medir_etapa,
+    perfilar,
+)
 
 # ========================================
 # CONFIGURACIÓN DE PÁGINA
@@ -170,313 +203,377 @@ st.markdown("""
 # FUNCIONES DE PROCESAMIENTO
 # ========================================
 
-def procesar_fecha_hora_accesspark(fecha_hora_str):
+def mostrar_lectura_archivos(resultados):
+    """Reporta los errores de lectura por archivo y una tabla con filas y tiempos"""
+    for resultado in resultados:
+        if resultado['error']:
+            st.error(f"❌ {resultado['archivo']}: {resultado['error']}")
+            if resultado['detalle']:
+                st.error(resultado['detalle'])
+    
+    with st.expander(f"⏱️ Lectura de archivos ({len(resultados)})"):
+        st.dataframe(pd.DataFrame([{
+            'Archivo': r['archivo'],
+            'Estado': '❌' if r['error'] else '✅',
+            'Filas': r['filas'],
+            'Segundos': round(r['segundos'], 2),
+            'Detalle': r['error'] or r['mensaje'],
+        } for r in resultados]), use_container_width=True)
+
+def describir_ventana(ventana):
+    """Texto de la ventana de coincidencia: ±minutos o rango de GOPASS menos ACCESSPARK"""
+    if np.ndim(ventana) == 0:
+        return f"±{ventana:g} minutos"
+    desde, hasta = ventana
+    return f"GOPASS entre {desde:g} y {hasta:g} minutos respecto al ingreso en ACCESSPARK"
+
+# ========================================
+# TRABAJOS EN SEGUNDO PLANO
+# ========================================
+
+# Validaciones simultáneas en todo el servidor; las demás esperan en cola
+TRABAJOS_SIMULTANEOS = int(os.environ.get('ACCESPARK_TRABAJOS_SIMULTANEOS', 2))
+
+# Etapas informadas por procesamiento (ver notificar) en el orden en que se muestran
+ETAPAS = {
+    'lectura': "📊 Lectura de archivos",
+    'coincidencias': "🔍 Validación de coincidencias",
+    'exportacion': "📁 Archivos de descarga",
+}
+
+# Resultados en memoria reutilizados entre recargas y sesiones (ver leer_bases):
+# cada entrada vence a los ACCESPARK_CACHE_TTL segundos y se guardan como máximo
+# ACCESPARK_CACHE_ENTRADAS por función para acotar la memoria del servidor. Las bases
+# grandes se guardan con st.cache_resource (sin copiarlas ni serializarlas; son de solo
+# lectura y se comparten entre sesiones) y los resúmenes y archivos de descarga, que son
+# pequeños o ya son bytes, con st.cache_data
+CACHE_TTL_SEGUNDOS = int(os.environ.get('ACCESPARK_CACHE_TTL', 3600))
+CACHE_MAX_ENTRADAS = int(os.environ.get('ACCESPARK_CACHE_ENTRADAS', 4))
+
+# Mediciones de cada etapa como líneas JSON en el log del servidor (ver medir_etapa)
+configurar_log()
+
+@st.cache_resource
+def obtener_pool():
+    """Pool de hilos compartido por todas las sesiones del servidor"""
+    return ThreadPoolExecutor(max_workers=TRABAJOS_SIMULTANEOS, thread_name_prefix='validacion')
+
+def ejecutar_trabajo(funcion, args, progreso, rendimiento, perfil=False):
     """
-    Procesa la columna check_in de ACCESSPARK
-    Input: '2025-02-27 14:23:00.000'
-    Output: fecha='27/02/2025', hora='14:23'
+    Ejecuta un trabajo en el pool midiendo su duración total y, si se pidió, con cProfile
+    Retorna (resultado, perfil) con perfil None o el dict de perfilar
     """
-    try:
-        if pd.isna(fecha_hora_str):
-            return None, None
-        
-        # Convertir a datetime
-        dt = pd.to_datetime(fecha_hora_str, errors='coerce')
-        if pd.isna(dt):
-            return None, None
-        
-        # NORMALIZAR al formato DD/MM/YYYY para que coincida con GOPASS
-        fecha = dt.strftime('%d/%m/%Y')
-        hora = dt.strftime('%H:%M')
-        
-        return fecha, hora
-    except:
-        return None, None
+    with medir_etapa(rendimiento, 'total'):
+        if perfil:
+            return perfilar(funcion, *args, progreso=progreso, rendimiento=rendimiento)
+        return funcion(*args, progreso=progreso, rendimiento=rendimiento), None
 
-def procesar_fecha_hora_gopass(fecha_hora_str):
+def enviar_trabajo(descripcion, funcion, *args):
     """
-    Procesa la columna Fecha de entrada de GOPASS
-    Input: '28/10/2025  2:57:50 p. m.'
-    Output: fecha='28/10/2025', hora='14:57'
+    Envía una validación al pool en segundo plano y la guarda en la sesión.
+    funcion recibe progreso=... (ver notificar) y rendimiento=... (ver medir_etapa) y
+    retorna el dict de resultado (ver ejecutar_en_memoria); el avance queda en
+    trabajo['etapas'] y las mediciones en trabajo['rendimiento']. Si la casilla de
+    perfilado está marcada, el trabajo corre con cProfile (ver perfilar).
     """
-    try:
-        if pd.isna(fecha_hora_str):
-            return None, None
-        
-        fecha_hora_str = str(fecha_hora_str).strip()
-        
-        # Intentar parsear con varios formatos
-        formatos = [
-            '%d/%m/%Y %I:%M:%S %p',  # 28/10/2025 2:57:50 p. m.
-            '%d/%m/%Y %H:%M:%S',      # 28/10/2025 14:57:50
-            '%d/%m/%Y %I:%M %p',      # 28/10/2025 2:57 p. m.
-            '%d/%m/%Y %H:%M',         # 28/10/2025 14:57
-        ]
-        
-        # Limpiar formato de AM/PM en español
-        fecha_hora_str = fecha_hora_str.replace(' a. m.', ' AM').replace(' p. m.', ' PM')
-        
-        dt = None
-        for formato in formatos:
-            try:
-                dt = pd.to_datetime(fecha_hora_str, format=formato, errors='coerce')
-                if not pd.isna(dt):
-                    break
-            except:
-                continue
-        
-        if dt is None or pd.isna(dt):
-            # Último intento con parseo automático
-            dt = pd.to_datetime(fecha_hora_str, errors='coerce')
-        
-        if pd.isna(dt):
-            return None, None
-        
-        fecha = dt.strftime('%d/%m/%Y')
-        hora = dt.strftime('%H:%M')
-        
-        return fecha, hora
-    except:
-        return None, None
+    trabajo = st.session_state.get('trabajo')
+    if trabajo is not None and not trabajo['futuro'].done():
+        st.warning("⏳ Ya hay una validación en curso; espera a que termine.")
+        return
+    
+    etapas = {}
+    rendimiento = []
+    
+    def progreso(etapa, hecho, total, detalle):
+        etapas[etapa] = (hecho, total, detalle)
+    
+    st.session_state['trabajo'] = {
+        'descripcion': descripcion,
+        'etapas': etapas,
+        'rendimiento': rendimiento,
+        'inicio': time.time(),
+        'futuro': obtener_pool().submit(
+            ejecutar_trabajo, funcion, args, progreso, rendimiento, st.session_state.get('perfilar', False)
+        ),
+    }
 
-def crear_llave(placa, fecha, hora):
-    """Crea una llave única combinando placa, fecha y hora"""
-    if pd.isna(placa) or pd.isna(fecha) or pd.isna(hora):
-        return None
-    
-    placa_limpia = str(placa).strip().upper().replace(' ', '')
-    fecha_limpia = str(fecha).strip()
-    hora_limpia = str(hora).strip()
-    
-    return f"{placa_limpia}|{fecha_limpia}|{hora_limpia}"
+def huella_trabajos(trabajos):
+    """Nombre y hash del contenido (con fuente y columnas, ver llave_cache) de cada archivo"""
+    return tuple(
+        (nombre, llave_cache(contenido, fuente, columnas))
+        for nombre, contenido, fuente, columnas in trabajos
+    )
 
-def generar_llaves_con_tolerancia(placa, fecha, hora, minutos_tolerancia=10):
+@st.cache_resource(ttl=CACHE_TTL_SEGUNDOS, max_entries=CACHE_MAX_ENTRADAS, show_spinner=False)
+def leer_bases(huella, _trabajos, _progreso=None, _rendimiento=None):
     """
-    Genera múltiples llaves con tolerancia de tiempo
-    Retorna una lista de llaves: [llave_exacta, llave_-10min, llave_-9min, ..., llave_+9min, llave_+10min]
+    Bases preparadas (ver preparar_bases) por huella de los archivos. Los argumentos
+    con guion bajo no forman parte de la llave de la caché. El resultado se comparte
+    entre sesiones: no se modifica (las etapas siguientes trabajan sobre copias).
     """
-    if pd.isna(placa) or pd.isna(fecha) or pd.isna(hora):
-        return []
-    
-    try:
-        # Convertir hora a datetime para hacer operaciones
-        hora_base = datetime.strptime(hora, '%H:%M')
-        llaves = []
-        
-        # Generar llaves con tolerancia de -10 a +10 minutos
-        for offset in range(-minutos_tolerancia, minutos_tolerancia + 1):
-            from datetime import timedelta
-            nueva_hora = hora_base + timedelta(minutes=offset)
-            hora_str = nueva_hora.strftime('%H:%M')
-            llave = crear_llave(placa, fecha, hora_str)
-            if llave:
-                llaves.append(llave)
-        
-        return llaves
-    except:
-        # Si hay error, retornar solo la llave exacta
-        llave = crear_llave(placa, fecha, hora)
-        return [llave] if llave else []
-
-def leer_archivo(archivo):
-    """Lee un archivo Excel o CSV"""
-    try:
-        nombre = archivo.name.lower()
-        if nombre.endswith('.csv'):
-            # Leer el contenido como bytes primero
-            contenido = archivo.read()
-            archivo.seek(0)
-            
-            # Intentar con diferentes encodings y separadores
-            encodings = ['utf-8', 'latin-1', 'iso-8859-1', 'cp1252', 'utf-8-sig']
-            separadores = [',', ';', '\t', '|']
-            df = None
-            
-            for encoding in encodings:
-                for sep in separadores:
-                    try:
-                        from io import StringIO
-                        texto = contenido.decode(encoding)
-                        df_temp = pd.read_csv(StringIO(texto), sep=sep, engine='python')
-                        
-                        # Verificar si la lectura fue exitosa (más de 1 columna)
-                        if len(df_temp.columns) > 1:
-                            df = df_temp
-                            st.success(f"✅ Archivo CSV leído correctamente con separador '{sep}' y encoding '{encoding}'")
-                            break
-                    except:
-                        continue
-                
-                if df is not None:
-                    break
-            
-            if df is None:
-                # Último intento con detección automática
-                archivo.seek(0)
-                df = pd.read_csv(archivo, sep=None, engine='python')
-            
-            # Limpiar nombres de columnas
-            df.columns = df.columns.str.strip()
-            return df
-        else:
-            df = pd.read_excel(archivo)
-            df.columns = df.columns.str.strip()
-            return df
-    except Exception as e:
-        st.error(f"Error al leer el archivo {archivo.name}: {str(e)}")
-        import traceback
-        st.error(traceback.format_exc())
-        return None
-
-def procesar_archivos_accesspark(archivos_accesspark, archivo_gopass):
-    """Procesa los archivos de ACCESSPARK y GOPASS"""
-    
-    # Leer y concatenar archivos de ACCESSPARK
-    dfs_accesspark = []
-    for archivo in archivos_accesspark:
-        df = leer_archivo(archivo)
-        if df is not None:
-            dfs_accesspark.append(df)
-    
-    if not dfs_accesspark:
-        st.error("No se pudo leer ningún archivo de ACCESSPARK")
-        return None, None
-    
-    df_accesspark = pd.concat(dfs_accesspark, ignore_index=True)
-    
-    # Leer archivo de GOPASS
-    df_gopass = leer_archivo(archivo_gopass)
-    if df_gopass is None:
-        return None, None
-    
-    # Verificar columnas necesarias en ACCESSPARK
-    columnas_accesspark = df_accesspark.columns.tolist()
-    st.info(f"📋 Columnas encontradas en ACCESSPARK: {columnas_accesspark}")
-    
-    if 'check_in' not in df_accesspark.columns or 'plate_in' not in df_accesspark.columns:
-        st.error(f"❌ El archivo de ACCESSPARK debe contener las columnas 'check_in' y 'plate_in'")
-        st.error(f"Columnas actuales: {', '.join(columnas_accesspark)}")
-        return None, None
-    
-    # Verificar columnas necesarias en GOPASS
-    columnas_gopass = df_gopass.columns.tolist()
-    st.info(f"📋 Columnas encontradas en GOPASS: {columnas_gopass}")
-    
-    if 'Fecha de entrada' not in df_gopass.columns or 'Placa Vehiculo' not in df_gopass.columns:
-        st.error(f"❌ El archivo de GOPASS debe contener las columnas 'Fecha de entrada' y 'Placa Vehiculo'")
-        st.error(f"Columnas actuales: {', '.join(columnas_gopass)}")
-        return None, None
-    
-    # Procesar ACCESSPARK
-    st.info("📊 Procesando archivos de ACCESSPARK...")
-    df_accesspark[['fecha_entrada', 'hora_entrada']] = df_accesspark['check_in'].apply(
-        lambda x: pd.Series(procesar_fecha_hora_accesspark(x))
-    )
-    df_accesspark['llave_exacta'] = df_accesspark.apply(
-        lambda row: crear_llave(row['plate_in'], row['fecha_entrada'], row['hora_entrada']), 
-        axis=1
-    )
-    # Generar llaves con tolerancia
-    df_accesspark['llaves_tolerancia'] = df_accesspark.apply(
-        lambda row: generar_llaves_con_tolerancia(row['plate_in'], row['fecha_entrada'], row['hora_entrada'], 10),
-        axis=1
+    bases = preparar_bases(_trabajos, progreso=_progreso, rendimiento=_rendimiento)
+    # Los DataFrames por archivo ya están unidos en cada base; no se guardan dos veces
+    bases['resultados'] = [{k: v for k, v in r.items() if k != 'df'} for r in bases['resultados']]
+    return bases
+
+@st.cache_resource(ttl=CACHE_TTL_SEGUNDOS, max_entries=CACHE_MAX_ENTRADAS, show_spinner=False)
+def validar_bases(huella, ventana, modo, placas_aproximadas, _bases, _rendimiento=None):
+    """
+    Bases validadas (ver validar_coincidencias) por huella, ventana (en segundos), modo y
+    búsqueda de placas aproximadas; de solo lectura, como las de leer_bases
+    """
+    filas = len(_bases['df_accesspark']) + len(_bases['df_gopass'])
+    with medir_etapa(_rendimiento, 'coincidencias', filas, modo=modo):
+        return validar_coincidencias(
+            _bases['df_accesspark'], _bases['df_gopass'], tuple(s / 60 for s in ventana), modo, _bases['indice'],
+            placas_aproximadas=placas_aproximadas
+        )
+
+@st.cache_data(ttl=CACHE_TTL_SEGUNDOS, max_entries=CACHE_MAX_ENTRADAS, show_spinner=False)
+def resumir_bases(huella, ventana, modo, placas_aproximadas, _df_accesspark, _df_gopass, _rendimiento=None):
+    """Resumen (ver contar_coincidencias) y estadísticas (ver resumir_validacion) de las bases validadas"""
+    with medir_etapa(_rendimiento, 'resumen', len(_df_accesspark) + len(_df_gopass)):
+        return contar_coincidencias(_df_accesspark, _df_gopass), resumir_validacion(_df_accesspark, _df_gopass)
+
+@st.cache_data(ttl=CACHE_TTL_SEGUNDOS, max_entries=CACHE_MAX_ENTRADAS, show_spinner=False)
+def exportar_bases(huella, ventana, modo, placas_aproximadas, formato, _df_accesspark, _df_gopass, _progreso=None,
+                   _rendimiento=None):
+    """Archivos de descarga (ver crear_archivos_descarga) por huella, ventana, modo, placas aproximadas y formato"""
+    with medir_etapa(_rendimiento, 'exportacion', len(_df_accesspark) + len(_df_gopass), formato=formato):
+        # Sin fecha en los nombres: se agrega al mostrar la descarga (ver mostrar_resultado)
+        return crear_archivos_descarga(_df_accesspark, _df_gopass, formato, _progreso, fechar=False)
+
+def indexar_consultas(df_accesspark, df_gopass, rendimiento=None):
+    """Índices del explorador de resultados de ambas bases validadas (ver indexar_consulta)"""
+    with medir_etapa(rendimiento, 'consulta', len(df_accesspark) + len(df_gopass)):
+        return {
+            'ACCESSPARK': indexar_consulta(df_accesspark, 'ACCESSPARK'),
+            'GOPASS': indexar_consulta(df_gopass, 'GOPASS'),
+        }
+
+def ejecutar_en_memoria(trabajos, formato, modo, ventana, placas_aproximadas=False, progreso=None, rendimiento=None):
+    """
+    Validación completa en memoria (se ejecuta en el pool, sin llamadas a Streamlit).
+    Cada etapa pasa por la caché: repetir la validación con los mismos archivos solo
+    recalcula lo que cambió (ventana, modo, placas aproximadas o formato de descarga).
+    """
+    huella = huella_trabajos(trabajos)
+    bases = leer_bases(huella, trabajos, progreso, rendimiento)
+    resultado = {
+        'resultados': bases['resultados'],
+        'error': bases['error'],
+        'avisos': [],
+        'resumen': None,
+        'estadisticas': None,
+        'consultas': None,
+        'archivos': [],
+    }
+    if bases['error']:
+        return resultado
+    
+    segundos = ventana_en_segundos(ventana)
+    notificar(progreso, 'coincidencias', 0, 1)
+    df_accesspark, df_gopass = validar_bases(huella, segundos, modo, placas_aproximadas, bases, rendimiento)
+    resultado['resumen'], resultado['estadisticas'] = resumir_bases(
+        huella, segundos, modo, placas_aproximadas, df_accesspark, df_gopass, rendimiento
     )
-    
-    # Procesar GOPASS
-    st.info("📊 Procesando archivo de GOPASS...")
-    df_gopass[['fecha_entrada', 'hora_entrada']] = df_gopass['Fecha de entrada'].apply(
-        lambda x: pd.Series(procesar_fecha_hora_gopass(x))
+    notificar(progreso, 'coincidencias', 1, 1)
+    resultado['archivos'] = exportar_bases(
+        huella, segundos, modo, placas_aproximadas, formato, df_accesspark, df_gopass, progreso, rendimiento
     )
-    df_gopass['llave_exacta'] = df_gopass.apply(
-        lambda row: crear_llave(row['Placa Vehiculo'], row['fecha_entrada'], row['hora_entrada']), 
-        axis=1
+    resultado['consultas'] = indexar_consultas(df_accesspark, df_gopass, rendimiento)
+    resultado['avisos'] = [
+        f"📋 Columnas encontradas en ACCESSPARK: {bases['df_accesspark'].columns.drop(COLUMNAS_TRABAJO).tolist()}",
+        f"📋 Columnas encontradas en GOPASS: {bases['df_gopass'].columns.drop(COLUMNAS_TRABAJO).tolist()}",
+        f"📊 Coincidencias validadas con ventana {describir_ventana(ventana)}",
+    ]
+    if placas_aproximadas:
+        resumen = resultado['resumen']
+        resultado['avisos'].append(
+            f"🔤 Encontradas con placa aproximada (posible error de lectura): "
+            f"{resumen['aproximadas_accesspark']:,} de ACCESSPARK y {resumen['aproximadas_gopass']:,} de GOPASS"
+        )
+    return resultado
+
+def ejecutar_por_particiones(origenes_accesspark, origenes_gopass, extension, mime, columnas_extra, memoria_mb,
+                             modo, ventana, progreso=None, rendimiento=None):
+    """Validación por particiones; los archivos de descarga quedan en disco"""
+    resumen = conciliar_por_particiones(
+        origenes_accesspark,
+        origenes_gopass,
+        tempfile.mkdtemp(prefix='validacion_'),
+        extension=extension,
+        memoria_mb=memoria_mb,
+        minutos_tolerancia=ventana,
+        columnas_extra=columnas_extra,
+        modo=modo,
+        progreso=progreso,
+        rendimiento=rendimiento
     )
-    # Generar llaves con tolerancia
-    df_gopass['llaves_tolerancia'] = df_gopass.apply(
-        lambda row: generar_llaves_con_tolerancia(row['Placa Vehiculo'], row['fecha_entrada'], row['hora_entrada'], 10),
-        axis=1
+    return {
+        'resultados': [],
+        'error': None,
+        'avisos': [f"💽 {resumen['particiones']} partición(es) procesadas"],
+        'resumen': resumen,
+        'estadisticas': resumen['estadisticas'],
+        'consultas': None,
+        'archivos': [
+            (f"validacion_{fuente.lower()}.{extension}", ruta, mime)
+            for fuente, ruta in resumen['rutas'].items() if os.path.exists(ruta)
+        ],
+    }
+
+def ejecutar_incremental(directorio, trabajos, formato, ventana, modo='emparejamiento', progreso=None,
+                         rendimiento=None):
+    """Agrega los archivos a una conciliación guardada y exporta su estado completo"""
+    resultados, resumen = conciliar_incremental(directorio, trabajos, ventana, progreso, rendimiento, modo)
+    with medir_etapa(rendimiento, 'carga_conciliacion') as medicion:
+        df_accesspark, df_gopass = cargar_conciliacion(directorio)
+        filas = medicion['filas'] = len(df_accesspark) + len(df_gopass)
+    
+    with medir_etapa(rendimiento, 'exportacion', filas, formato=formato):
+        archivos = crear_archivos_descarga(df_accesspark, df_gopass, formato, progreso, fechar=False)
+    
+    avisos = []
+    if resumen['omitidos']:
+        avisos.append(f"ℹ️ {resumen['omitidos']} archivo(s) ya estaban en la conciliación y se omitieron")
+    avisos.append(
+        f"🔁 Nuevos: {resumen['nuevos_accesspark']:,} ACCESSPARK y {resumen['nuevos_gopass']:,} GOPASS. "
+        f"Registros anteriores que cambiaron de estado o de contraparte: {resumen['actualizados_accesspark']:,} ACCESSPARK "
+        f"y {resumen['actualizados_gopass']:,} GOPASS"
     )
+    return {
+        'resultados': resultados,
+        'error': None,
+        'avisos': avisos,
+        'resumen': contar_coincidencias(df_accesspark, df_gopass),
+        'estadisticas': resumir_validacion(df_accesspark, df_gopass),
+        'consultas': indexar_consultas(df_accesspark, df_gopass, rendimiento),
+        'archivos': archivos,
+    }
+
+def mostrar_progreso(trabajo):
+    """Una barra por etapa con el avance real informado por el trabajo"""
+    segundos = int(time.time() - trabajo['inicio'])
+    if not trabajo['etapas']:
+        st.info(f"⏳ {trabajo['descripcion']}: en cola ({segundos} s)")
+        return
+    st.info(f"⚙️ {trabajo['descripcion']}: en curso ({segundos} s)")
+    for etapa, titulo in ETAPAS.items():
+        if etapa not in trabajo['etapas']:
+            continue
+        hecho, total, detalle = trabajo['etapas'][etapa]
+        if total:
+            st.progress(min(hecho / total, 1.0), text=f"{titulo}: {detalle or f'{hecho:,} de {total:,}'}")
+        else:
+            st.caption(f"{titulo}: {detalle or f'{hecho:,}'}")
+
+@st.fragment(run_every=1.0)
+def seguir_trabajo():
+    """Consulta el trabajo en curso cada segundo y recarga la página al terminar"""
+    trabajo = st.session_state.get('trabajo')
+    if trabajo is None:
+        return
+    if trabajo['futuro'].done():
+        st.rerun()
+    mostrar_progreso(trabajo)
+
+def mostrar_trabajo():
+    """Muestra el trabajo de la sesión: su avance mientras corre o su resultado al terminar"""
+    trabajo = st.session_state.get('trabajo')
+    if trabajo is None:
+        return
+    if not trabajo['futuro'].done():
+        seguir_trabajo()
+        return
+    
+    error = trabajo['futuro'].exception()
+    if error is not None:
+        st.error(f"❌ Error durante el procesamiento: {str(error)}")
+        return
+    
+    resultado, perfil = trabajo['futuro'].result()
+    mostrar_resultado(resultado, trabajo['rendimiento'], perfil)
+
+def mostrar_rendimiento(rendimiento, perfil=None):
+    """Panel con las mediciones de cada etapa (ver medir_etapa) y la descarga del perfil"""
+    with st.expander("⚡ Rendimiento"):
+        filas = []
+        for medicion in rendimiento:
+            detalle = [str(medicion[clave]) for clave in ('archivo', 'fuente', 'formato', 'modo') if medicion.get(clave)]
+            if 'particion' in medicion:
+                detalle.append(f"partición {medicion['particion'] + 1}")
+            if medicion.get('cache'):
+                detalle.append("desde la caché en disco")
+            filas.append({
+                'Etapa': medicion['etapa'],
+                'Detalle': ', '.join(detalle),
+                'Filas': medicion['filas'],
+                'Segundos': medicion['segundos'],
+                'Filas/s': medicion['filas_por_segundo'],
+                'Pico MB': medicion['pico_mb'],
+                'Incremento MB': medicion['incremento_mb'],
+            })
+        st.dataframe(
+            pd.DataFrame(filas).astype({'Filas': 'Int64', 'Filas/s': 'Int64'}),
+            use_container_width=True, hide_index=True
+        )
+        st.caption(
+            "Las etapas reutilizadas de la caché de resultados no aparecen. La lectura de varios "
+            "archivos y la búsqueda de coincidencias con muchas filas corren en procesos aparte: "
+            "su memoria es la de cada proceso."
+        )
+        if perfil is not None:
+            fecha_actual = datetime.now().strftime("%Y%m%d_%H%M%S")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button(
+                    "🔬 Descargar perfil (.prof)", perfil['datos'], f"perfil_{fecha_actual}.prof",
+                    mime='application/octet-stream', use_container_width=True
+                )
+            with col2:
+                st.download_button(
+                    "📄 Descargar resumen del perfil (.txt)", perfil['resumen'], f"perfil_{fecha_actual}.txt",
+                    mime='text/plain', use_container_width=True
+                )
+
+def mostrar_resultado(resultado, rendimiento=None, perfil=None):
+    """Muestra lectura, avisos, métricas, rendimiento y botones de descarga de un trabajo terminado"""
+    if resultado['resultados']:
+        mostrar_lectura_archivos(resultado['resultados'])
+    if resultado['error']:
+        st.error(resultado['error'])
+        return
+    for aviso in resultado['avisos']:
+        st.info(aviso)
+    
+    mostrar_estadisticas(resultado['estadisticas'])
+    if resultado['consultas'] is not None:
+        mostrar_explorador(resultado['consultas'])
+    if rendimiento:
+        mostrar_rendimiento(rendimiento, perfil)
     
-    # Crear conjuntos de llaves para búsqueda rápida (con tolerancia)
-    llaves_accesspark = set()
-    for llaves_list in df_accesspark['llaves_tolerancia'].dropna():
-        llaves_accesspark.update(llaves_list)
-    
-    llaves_gopass = set()
-    for llaves_list in df_gopass['llaves_tolerancia'].dropna():
-        llaves_gopass.update(llaves_list)
-    
-    # Agregar columna de coincidencias en ACCESSPARK (verificar si alguna llave con tolerancia coincide)
-    def verificar_coincidencia_accesspark(llaves_list):
-        if not llaves_list:
-            return 'Llave NO encontrada en GOPASS'
-        for llave in llaves_list:
-            if llave in llaves_gopass:
-                return 'Llave encontrada en GOPASS'
-        return 'Llave NO encontrada en GOPASS'
-    
-    df_accesspark['Estado_Validacion'] = df_accesspark['llaves_tolerancia'].apply(verificar_coincidencia_accesspark)
-    
-    # Agregar columna de coincidencias en GOPASS (verificar si alguna llave con tolerancia coincide)
-    def verificar_coincidencia_gopass(llaves_list):
-        if not llaves_list:
-            return 'Llave NO encontrada en ACCESSPARK'
-        for llave in llaves_list:
-            if llave in llaves_accesspark:
-                return 'Llave encontrada en ACCESSPARK'
-        return 'Llave NO encontrada en ACCESSPARK'
-    
-    df_gopass['Estado_Validacion'] = df_gopass['llaves_tolerancia'].apply(verificar_coincidencia_gopass)
-    
-    # Eliminar columnas temporales de llaves con tolerancia antes de exportar
-    df_accesspark_export = df_accesspark.drop(columns=['llaves_tolerancia'])
-    df_gopass_export = df_gopass.drop(columns=['llaves_tolerancia'])
-    
-    return df_accesspark_export, df_gopass_export
-
-def crear_excel_resultado(df_accesspark, df_gopass):
-    """Crea el archivo Excel con las dos hojas procesadas"""
-    output = io.BytesIO()
-    
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df_accesspark.to_excel(writer, sheet_name="ACCESSPARK_Procesado", index=False)
-        df_gopass.to_excel(writer, sheet_name="GOPASS_Procesado", index=False)
-    
-    # Aplicar formato condicional
-    output.seek(0)
-    wb = load_workbook(output)
-    
-    # Colores para el formato condicional
-    verde_fill = PatternFill(start_color='C6EFCE', end_color='C6EFCE', fill_type='solid')
-    rojo_fill = PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid')
-    
-    def aplicar_formato_validacion(ws, nombre_columna):
-        """Aplica color verde a encontradas y rojo a no encontradas"""
-        col_idx = None
-        for cell in ws[1]:
-            if cell.value == nombre_columna:
-                col_idx = cell.column
-                break
-        
-        if not col_idx:
-            return
-        
-        for row in range(2, ws.max_row + 1):
-            cell = ws.cell(row=row, column=col_idx)
-            if cell.value and 'encontrada en' in str(cell.value) and 'NO' not in str(cell.value):
-                cell.fill = verde_fill
-            elif cell.value and 'NO encontrada' in str(cell.value):
-                cell.fill = rojo_fill
-    
-    # Aplicar formato a ambas hojas
-    aplicar_formato_validacion(wb["ACCESSPARK_Procesado"], "Estado_Validacion")
-    aplicar_formato_validacion(wb["GOPASS_Procesado"], "Estado_Validacion")
-    
-    output_final = io.BytesIO()
-    wb.save(output_final)
-    output_final.seek(0)
+    st.markdown("---")
+    st.markdown('<div class="sub-header">💾 Descargar Resultados</div>', unsafe_allow_html=True)
+    
+    # Los archivos llegan sin fecha (pueden venir de la caché); se fechan al descargarlos
+    fecha_actual = datetime.now().strftime("%Y%m%d_%H%M%S")
+    for nombre_archivo, datos, mime in resultado['archivos']:
+        # En el modo por particiones los datos son la ruta del archivo en disco
+        if isinstance(datos, str):
+            with open(datos, 'rb') as f:
+                datos = f.read()
+        nombre_archivo = fechar_nombre(nombre_archivo, fecha_actual)
+        st.download_button(
+            label=f"📥 DESCARGAR {nombre_archivo}",
+            data=datos,
+            file_name=nombre_archivo,
+            mime=mime,
+            type="primary",
+            use_container_width=True
+        )
     
-    return output_final.getvalue()
+    st.success("🎉 ¡Archivo listo para descargar!")
 
 # ========================================
 # INTERFAZ PRINCIPAL
@@ -514,16 +611,33 @@ def main():
 
         st.markdown("---")
         
+        st.markdown("### ⏱️ Ventana de coincidencia")
+        if st.radio("Tipo de ventana", ["Simétrica (±)", "Asimétrica"], horizontal=True) == "Simétrica (±)":
+            ventana = st.number_input(
+                "Tolerancia (minutos)", min_value=0.0, value=float(TOLERANCIA_MINUTOS), step=0.5,
+                help="Admite fracciones: 0.5 = 30 segundos"
+            )
+        else:
+            st.caption("Minutos de GOPASS menos ACCESSPARK (negativo: el cobro antes del ingreso)")
+            desde = st.number_input("Desde (minutos)", value=0.0, step=0.5)
+            hasta = st.number_input("Hasta (minutos)", value=15.0, step=0.5)
+            if desde > hasta:
+                st.error("❌ 'Desde' no puede ser mayor que 'Hasta'")
+                desde, hasta = hasta, desde
+            ventana = (desde, hasta)
+        
+        st.markdown("---")
+        
         st.markdown("### 📝 Formato de Archivos")
         st.write("**ACCESSPARK:**")
         st.write("- Columnas: check_in, plate_in")
         st.write("- Formato fecha: YYYY-MM-DD HH:MM:SS")
-        st.write("- Tolerancia: ±10 minutos")
+        st.write(f"- Tolerancia: {describir_ventana(ventana)}")
         
         st.write("**GOPASS:**")
         st.write("- Columnas: Fecha de entrada, Placa Vehiculo")
         st.write("- Formato fecha: DD/MM/YYYY HH:MM:SS")
-        st.write("- Tolerancia: ±10 minutos")
+        st.write(f"- Tolerancia: {describir_ventana(ventana)}")
 
     # Sección de carga de archivos
     st.markdown('<div class="sub-header">📤 Carga de Archivos</div>', unsafe_allow_html=True)
@@ -558,153 +672,226 @@ def main():
         st.markdown("---")
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
+            formato = st.selectbox("📦 Formato de descarga", list(FORMATOS_DESCARGA))
+            modo = MODOS_COINCIDENCIA[st.selectbox(
+                "🔗 Modo de coincidencia", list(MODOS_COINCIDENCIA),
+                help="Uno a uno: cada cobro se empareja con una sola entrada (la más cercana), "
+                     "así los cobros duplicados quedan sin contraparte."
+            )]
+            columnas_extra = None
+            if st.checkbox("📉 Cargar solo las columnas necesarias"):
+                texto_columnas = st.text_input("Columnas adicionales a conservar (separadas por coma)")
+                columnas_extra = [c.strip() for c in texto_columnas.split(',') if c.strip()]
+            nombre_incremental = None
+            if st.checkbox("🔁 Modo incremental (agregar archivos nuevos a una conciliación guardada)"):
+                nombre_incremental = st.text_input("Nombre de la conciliación", value=datetime.now().strftime("%Y-%m"))
+                st.caption("Una conciliación guardada conserva el modo de coincidencia con que se empezó.")
+            memoria_mb = None
+            if nombre_incremental is None and st.checkbox("💽 Modo por particiones (archivos más grandes que la memoria)"):
+                memoria_mb = st.number_input(
+                    "Memoria máxima por partición (MB)", min_value=256, value=MEMORIA_MB_POR_DEFECTO, step=256
+                )
+            placas_aproximadas = False
+            if nombre_incremental is None and memoria_mb is None:
+                placas_aproximadas = st.checkbox(
+                    "🔤 Buscar también placas con errores de lectura",
+                    help="Los registros sin contraparte se vuelven a buscar aceptando caracteres que la cámara "
+                         "confunde (O/0, I/1, B/8...) o un carácter sobrante o faltante; quedan marcados como placa aproximada."
+                )
+            st.checkbox(
+                "🔬 Perfilar la ejecución (cProfile)", key='perfilar',
+                help="Agrega al panel de rendimiento la descarga del perfil para adjuntarlo a un reporte."
+            )
             if st.button("🚀 VALIDAR COBROS", type="primary", use_container_width=True):
-                process_files(archivos_accesspark, archivo_gopass)
+                if nombre_incremental is not None:
+                    procesar_incremental(
+                        archivos_accesspark, archivo_gopass, formato, columnas_extra, nombre_incremental, modo, ventana
+                    )
+                elif memoria_mb is not None:
+                    procesar_por_particiones(
+                        archivos_accesspark, archivo_gopass, formato, columnas_extra, memoria_mb, modo, ventana
+                    )
+                else:
+                    process_files(
+                        archivos_accesspark, archivo_gopass, formato, columnas_extra, modo, ventana, placas_aproximadas
+                    )
     else:
         st.markdown('<div class="warning-box">', unsafe_allow_html=True)
         st.warning("⚠️ Por favor, carga los archivos de ACCESSPARK y GOPASS para continuar con la validación.")
         st.markdown('</div>', unsafe_allow_html=True)
-
-def process_files(archivos_accesspark, archivo_gopass):
-    """Maneja el procesamiento de archivos con indicadores de progreso"""
     
-    # Barra de progreso
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    try:
-        # Paso 1: Procesar archivos
-        status_text.text("📊 Procesando archivos...")
-        progress_bar.progress(20)
-        
-        df_accesspark, df_gopass = procesar_archivos_accesspark(archivos_accesspark, archivo_gopass)
-        
-        if df_accesspark is None or df_gopass is None:
-            progress_bar.progress(0)
-            status_text.text("❌ Error en el procesamiento")
-            return
-        
-        progress_bar.progress(60)
-        status_text.text("🔍 Validando coincidencias...")
-        
-        # Paso 2: Mostrar estadísticas
-        progress_bar.progress(80)
-        status_text.text("📈 Generando estadísticas...")
-        
-        mostrar_estadisticas(df_accesspark, df_gopass)
-        
-        # Paso 3: Crear archivo de descarga
-        progress_bar.progress(90)
-        status_text.text("📁 Preparando archivo de descarga...")
-        
-        excel_data = crear_excel_resultado(df_accesspark, df_gopass)
-        
-        progress_bar.progress(100)
-        status_text.text("✅ ¡Validación completada!")
-        
-        # Botón de descarga
-        st.markdown("---")
-        st.markdown('<div class="sub-header">💾 Descargar Resultados</div>', unsafe_allow_html=True)
-        
-        fecha_actual = datetime.now().strftime("%Y%m%d_%H%M%S")
-        nombre_archivo = f"validacion_accesspark_{fecha_actual}.xlsx"
-        
-        st.download_button(
-            label="📥 DESCARGAR ARCHIVO VALIDADO",
-            data=excel_data,
-            file_name=nombre_archivo,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            type="primary",
-            use_container_width=True
-        )
-        
-        st.success("🎉 ¡Archivo listo para descargar!")
-        
-    except Exception as e:
-        st.error(f"❌ Error durante el procesamiento: {str(e)}")
-        progress_bar.progress(0)
-        status_text.text("❌ Error en el procesamiento")
+    # Avance o resultado de la última validación de la sesión (sobrevive a las recargas)
+    mostrar_trabajo()
 
-def mostrar_estadisticas(df_accesspark, df_gopass):
-    """Muestra estadísticas del procesamiento"""
-    
+def process_files(archivos_accesspark, archivo_gopass, formato='Excel (.xlsx)', columnas_extra=None,
+                  modo='emparejamiento', ventana=TOLERANCIA_MINUTOS, placas_aproximadas=False):
+    """
+    Envía la validación en memoria al pool en segundo plano.
+    Las bases leídas, validadas y exportadas quedan en caché (ver ejecutar_en_memoria):
+    repetir con los mismos archivos u otra ventana, modo o formato es inmediato o solo
+    recalcula la etapa que cambió.
+    """
+    trabajos = armar_trabajos(
+        [(archivo.name, archivo.getvalue()) for archivo in archivos_accesspark],
+        [(archivo_gopass.name, archivo_gopass.getvalue())],
+        columnas_extra
+    )
+    enviar_trabajo("Validación", ejecutar_en_memoria, trabajos, formato, modo, ventana, placas_aproximadas)
+
+def procesar_por_particiones(archivos_accesspark, archivo_gopass, formato, columnas_extra, memoria_mb,
+                             modo='emparejamiento', ventana=TOLERANCIA_MINUTOS):
+    """Envía la validación por particiones (lee por lotes y escribe el resultado en disco)"""
+    extension, mime = FORMATOS_DESCARGA[formato]
+    if extension == 'xlsx':
+        st.info("ℹ️ El modo por particiones no genera Excel; el resultado se entrega como CSV comprimido.")
+        extension, mime = FORMATOS_DESCARGA['CSV comprimido (.csv.gz)']
+    
+    enviar_trabajo(
+        "Validación por particiones", ejecutar_por_particiones,
+        [(archivo.name, io.BytesIO(archivo.getvalue())) for archivo in archivos_accesspark],
+        [(archivo_gopass.name, io.BytesIO(archivo_gopass.getvalue()))],
+        extension, mime, columnas_extra, memoria_mb, modo, ventana
+    )
+
+def procesar_incremental(archivos_accesspark, archivo_gopass, formato, columnas_extra, nombre,
+                         modo='emparejamiento', ventana=TOLERANCIA_MINUTOS):
+    """Envía la incorporación de los archivos a una conciliación guardada"""
+    trabajos = armar_trabajos(
+        [(archivo.name, archivo.getvalue()) for archivo in archivos_accesspark],
+        [(archivo_gopass.name, archivo_gopass.getvalue())],
+        columnas_extra
+    )
+    enviar_trabajo(
+        f"Conciliación incremental '{nombre}'", ejecutar_incremental,
+        directorio_estado(nombre), trabajos, formato, ventana, modo
+    )
+
+def mostrar_estadisticas(estadisticas):
+    """
+    Muestra métricas y desgloses de la validación a partir de las estadísticas ya
+    calculadas (ver resumir_validacion): solo dibuja agregados pequeños, así que no
+    depende del número de filas
+    """
+    if estadisticas is None:
+        return
     st.markdown('<div class="sub-header">📊 Estadísticas de Validación</div>', unsafe_allow_html=True)
+    mostrar_metricas("### 🅿️ Resultados ACCESSPARK", 'GOPASS', estadisticas['ACCESSPARK'])
+    mostrar_metricas("### 🎫 Resultados GOPASS", 'ACCESSPARK', estadisticas['GOPASS'])
     
-    # Métricas ACCESSPARK
-    st.markdown("### 🅿️ Resultados ACCESSPARK")
-    col1, col2, col3 = st.columns(3)
-    
-    total_accesspark = len(df_accesspark)
-    encontradas_accesspark = len(df_accesspark[df_accesspark['Estado_Validacion'].str.contains('encontrada en GOPASS', case=False, na=False) & 
-                                                ~df_accesspark['Estado_Validacion'].str.contains('NO', case=False, na=False)])
-    no_encontradas_accesspark = total_accesspark - encontradas_accesspark
-    
-    with col1:
-        st.markdown('<div class="metric-container">', unsafe_allow_html=True)
-        st.metric("📊 Total Registros", total_accesspark)
-        st.markdown('</div>', unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown('<div class="metric-container">', unsafe_allow_html=True)
-        st.metric("✅ Encontradas en GOPASS", encontradas_accesspark)
-        porcentaje = (encontradas_accesspark / total_accesspark * 100) if total_accesspark > 0 else 0
-        st.write(f"**{porcentaje:.1f}%** del total")
-        st.markdown('</div>', unsafe_allow_html=True)
-    
-    with col3:
-        st.markdown('<div class="metric-container">', unsafe_allow_html=True)
-        st.metric("❌ NO Encontradas en GOPASS", no_encontradas_accesspark)
-        porcentaje = (no_encontradas_accesspark / total_accesspark * 100) if total_accesspark > 0 else 0
-        st.write(f"**{porcentaje:.1f}%** del total")
-        st.markdown('</div>', unsafe_allow_html=True)
+    # Resumen visual
+    st.markdown("### 📈 Resumen Visual")
+    tab_estado, tab_dia, tab_hora, tab_placas = st.tabs(
+        ["Por estado", "Por día", "Por hora", "Placas sin contraparte"]
+    )
+    columnas = [estado for estado in ESTADOS_RESUMEN if estado != 'Placa aproximada']
+    if any(estadisticas[fuente]['aproximadas'] for fuente in estadisticas):
+        columnas = ESTADOS_RESUMEN
+    with tab_estado:
+        estados = pd.DataFrame({fuente: resumen['por_estado'][columnas] for fuente, resumen in estadisticas.items()})
+        st.bar_chart(estados.T, stack=True, horizontal=True)
+    for tab, desglose in ((tab_dia, 'por_dia'), (tab_hora, 'por_hora')):
+        with tab:
+            col1, col2 = st.columns(2)
+            for col, (fuente, resumen) in zip((col1, col2), estadisticas.items()):
+                col.markdown(f"#### {fuente}")
+                col.bar_chart(resumen[desglose][columnas], stack=True)
+    with tab_placas:
+        col1, col2 = st.columns(2)
+        for col, (fuente, resumen) in zip((col1, col2), estadisticas.items()):
+            col.markdown(f"#### {fuente}")
+            col.dataframe(resumen['placas_sin_contraparte'], use_container_width=True, hide_index=True)
+
+def mostrar_metricas(titulo, otra_fuente, resumen):
+    """Métricas de una fuente (ver resumir_fuente), con la tasa diaria de coincidencia como tendencia"""
+    st.markdown(titulo)
+    total = resumen['total']
+    porcentaje_encontradas = resumen['encontradas'] / total * 100 if total > 0 else 0
+    por_dia = resumen['por_dia']
+    tasa_diaria = (por_dia['Encontradas'] + por_dia['Placa aproximada']) / por_dia.sum(axis=1) * 100
     
-    # Métricas GOPASS
-    st.markdown("### 🎫 Resultados GOPASS")
     col1, col2, col3 = st.columns(3)
+    col1.metric("📊 Total Registros", f"{total:,}", border=True)
+    col2.metric(
+        f"✅ Encontradas en {otra_fuente}", f"{resumen['encontradas']:,}",
+        delta=f"{porcentaje_encontradas:.1f}% del total", delta_color='off', delta_arrow='off', border=True,
+        chart_data=tasa_diaria.round(1).tolist() if len(tasa_diaria) > 1 else None, chart_type='area',
+        help="La tendencia es el porcentaje encontrado de cada día"
+    )
+    col3.metric(
+        f"❌ NO Encontradas en {otra_fuente}", f"{resumen['no_encontradas']:,}",
+        delta=f"{100 - porcentaje_encontradas if total > 0 else 0:.1f}% del total", delta_color='off',
+        delta_arrow='off', border=True
+    )
+    if resumen['aproximadas']:
+        st.caption(f"🔤 {resumen['aproximadas']:,} de las encontradas tienen placa aproximada (posible error de lectura)")
+    if resumen['sin_fecha']:
+        st.caption(f"⚠️ {resumen['sin_fecha']:,} registros sin fecha válida no aparecen en los desgloses por día y hora")
+
+@st.fragment
+def mostrar_explorador(consultas):
+    """
+    Explorador de las bases validadas: los filtros se aplican en el servidor sobre el
+    índice de cada base (ver filtrar_consulta) y al navegador solo se envía la página
+    visible. Cambiar un filtro vuelve a ejecutar solo este fragmento; el archivo con
+    los registros filtrados se genera al pulsar la descarga.
+    """
+    st.markdown('<div class="sub-header">🔎 Explorar Resultados</div>', unsafe_allow_html=True)
+    fuente = st.radio("Base", list(consultas), horizontal=True, key='explorar_fuente')
+    consulta = consultas[fuente]
     
-    total_gopass = len(df_gopass)
-    encontradas_gopass = len(df_gopass[df_gopass['Estado_Validacion'].str.contains('encontrada en ACCESSPARK', case=False, na=False) & 
-                                        ~df_gopass['Estado_Validacion'].str.contains('NO', case=False, na=False)])
-    no_encontradas_gopass = total_gopass - encontradas_gopass
-    
-    with col1:
-        st.markdown('<div class="metric-container">', unsafe_allow_html=True)
-        st.metric("📊 Total Registros", total_gopass)
-        st.markdown('</div>', unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown('<div class="metric-container">', unsafe_allow_html=True)
-        st.metric("✅ Encontradas en ACCESSPARK", encontradas_gopass)
-        porcentaje = (encontradas_gopass / total_gopass * 100) if total_gopass > 0 else 0
-        st.write(f"**{porcentaje:.1f}%** del total")
-        st.markdown('</div>', unsafe_allow_html=True)
-    
-    with col3:
-        st.markdown('<div class="metric-container">', unsafe_allow_html=True)
-        st.metric("❌ NO Encontradas en ACCESSPARK", no_encontradas_gopass)
-        porcentaje = (no_encontradas_gopass / total_gopass * 100) if total_gopass > 0 else 0
-        st.write(f"**{porcentaje:.1f}%** del total")
-        st.markdown('</div>', unsafe_allow_html=True)
+    col1, col2, col3 = st.columns(3)
+    estados = col1.multiselect("Estado", ESTADOS_RESUMEN, default=ESTADOS_RESUMEN, key='explorar_estados')
+    prefijo_placa = col2.text_input("Placa (inicio)", key='explorar_placa')
+    desde = hasta = None
+    if consulta['primera'] is not None:
+        primera, ultima = consulta['primera'].date(), consulta['ultima'].date()
+        fechas = col3.date_input(
+            "Fechas de entrada", value=(primera, ultima), min_value=primera, max_value=ultima,
+            key=f'explorar_fechas_{fuente}'
+        )
+        # Mientras se elige el rango, date_input retorna solo la primera fecha
+        if len(fechas) == 2 and fechas != (primera, ultima):
+            desde = pd.Timestamp(fechas[0])
+            hasta = pd.Timestamp(fechas[1]) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    delta_minimo = delta_maximo = None
+    if consulta['rango_delta'] is not None:
+        minimo, maximo = np.floor(consulta['rango_delta'][0]), np.ceil(consulta['rango_delta'][1])
+        rango = st.slider(
+            "Diferencia en minutos (GOPASS menos ACCESSPARK)", minimo, maximo, (minimo, maximo), step=0.5,
+            key=f'explorar_delta_{fuente}', help="Al acotarla quedan solo los registros con pareja"
+        )
+        if rango != (minimo, maximo):
+            delta_minimo, delta_maximo = rango
     
-    # Resumen visual
-    st.markdown("### 📈 Resumen Visual")
-    col1, col2 = st.columns(2)
+    posiciones = filtrar_consulta(
+        consulta, None if set(estados) == set(ESTADOS_RESUMEN) else estados, prefijo_placa,
+        desde, hasta, delta_minimo, delta_maximo
+    )
     
-    with col1:
-        st.markdown("#### ACCESSPARK")
-        data_accesspark = {
-            'Estado': ['Encontradas', 'No Encontradas'],
-            'Cantidad': [encontradas_accesspark, no_encontradas_accesspark]
-        }
-        st.bar_chart(pd.DataFrame(data_accesspark).set_index('Estado'))
+    col1, col2, col3 = st.columns([1, 1, 2])
+    filas_por_pagina = col1.selectbox(
+        "Filas por página", [FILAS_POR_PAGINA, 5 * FILAS_POR_PAGINA, 10 * FILAS_POR_PAGINA], key='explorar_filas'
+    )
+    n_paginas = max(1, -(-len(posiciones) // filas_por_pagina))
+    pagina = col2.number_input("Página", min_value=1, max_value=n_paginas, value=1, key='explorar_pagina')
+    col3.caption(
+        f"{len(posiciones):,} de {len(consulta['df']):,} registros · página {min(pagina, n_paginas)} de "
+        f"{n_paginas:,} · ordenados por fecha de entrada; el índice es el id de fila (matched_row_id)"
+    )
+    st.dataframe(
+        pagina_consulta(consulta, posiciones, min(pagina, n_paginas) - 1, filas_por_pagina),
+        use_container_width=True
+    )
     
-    with col2:
-        st.markdown("#### GOPASS")
-        data_gopass = {
-            'Estado': ['Encontradas', 'No Encontradas'],
-            'Cantidad': [encontradas_gopass, no_encontradas_gopass]
-        }
-        st.bar_chart(pd.DataFrame(data_gopass).set_index('Estado'))
+    col1, col2 = st.columns([1, 2])
+    formato = col1.selectbox("Formato", list(FORMATOS_DESCARGA), key='explorar_formato')
+    extension, mime = FORMATOS_DESCARGA[formato]
+    col2.download_button(
+        f"📥 Descargar los {len(posiciones):,} registros filtrados",
+        data=lambda: crear_archivo_consulta(consulta, posiciones, formato),
+        file_name=fechar_nombre(f"filtrado_{fuente.lower()}.{extension}"),
+        mime=mime, on_click='ignore', disabled=len(posiciones) == 0, use_container_width=True
+    )
 
 # ========================================
 # EJECUTAR APLICACIÓN
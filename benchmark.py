@@ -0,0 +1,414 @@
+"""
+Benchmark del validador ACCESSPARK / GOPASS con datos sintéticos
+
+Genera bases con la forma de los archivos que se reciben (CSV con ';' en latin-1 y
+Excel), mide el tiempo y el pico de memoria de cada etapa (lectura, índice,
+coincidencias y exportación) para varios tamaños y guarda los resultados en JSON,
+para comparar dos versiones del código.
+
+Ejemplos:
+    python benchmark.py --filas 10000 100000 --salida base.json
+    python benchmark.py --filas 1000000 --entradas csv --exportar parquet --salida nuevo.json
+    python benchmark.py --comparar base.json nuevo.json
+
+Las mediciones de memoria leen la memoria residente del proceso (Linux, ver
+medir_etapa en procesamiento); la lectura en paralelo ocurre en procesos hijos que
+no se cuentan: --procesos 1 mide todo en el proceso principal.
+"""
+
+import os
+import io
+import gc
+import sys
+import json
+import platform
+import argparse
+import subprocess
+from datetime import datetime
+
+# Cada corrida mide la lectura en frío: sin la caché en disco de archivos preparados
+# (se fija antes de importar procesamiento para que también la vean los procesos hijos)
+os.environ['ACCESPARK_CACHE_MAX_MB'] = '0'
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from procesamiento import (
+    FILAS_MAX_EXCEL,
+    FORMATOS_DESCARGA,
+    MODOS_COINCIDENCIA,
+    MODO_POR_DEFECTO,
+    TOLERANCIA_MINUTOS,
+    armar_trabajos,
+    preparar_archivos,
+    indexar_coincidencias,
+    procesos_coincidencias,
+    validar_coincidencias,
+    contar_coincidencias,
+    crear_archivos_descarga,
+    escribir_hojas,
+    medir_etapa,
+)
+
+# ========================================
+# CONFIGURACIÓN
+# ========================================
+
+# Filas de ACCESSPARK de cada escenario (GOPASS queda con un tamaño parecido)
+TAMANOS_POR_DEFECTO = [10_000, 100_000, 1_000_000, 10_000_000]
+
+# Variantes de entrada: ambos archivos en CSV (';', latin-1) o en Excel. Excel no
+# admite más de FILAS_MAX_EXCEL filas por hoja, así que los escenarios más grandes
+# se omiten en esa variante (y en la exportación a Excel)
+ENTRADAS = ['csv', 'xlsx']
+
+# Formato de descarga medido por extensión -> etiqueta de FORMATOS_DESCARGA
+FORMATOS_POR_EXTENSION = {extension: etiqueta for etiqueta, (extension, _) in FORMATOS_DESCARGA.items()}
+
+# Parámetros de los datos sintéticos (ver generar_bases)
+PARAMETROS_POR_DEFECTO = {
+    'placas_por_fila': 0.05,     # placas distintas por fila de ACCESSPARK
+    'tasa_coincidencia': 0.85,   # ingresos de ACCESSPARK con cobro en GOPASS
+    'desfase_segundos': 60,      # adelanto del reloj de GOPASS respecto al de ACCESSPARK
+    'dispersion_segundos': 240,  # variación aleatoria (±) del cobro alrededor del ingreso
+    'tasa_duplicados': 0.01,     # cobros de GOPASS repetidos (doble cobro)
+    'tasa_huerfanos': 0.05,      # cobros de GOPASS sin ingreso en ACCESSPARK
+    'tasa_medianoche': 0.02,     # ingresos en los 10 minutos previos a la medianoche
+    'tasa_placas_sucias': 0.10,  # placas de ACCESSPARK en minúsculas o con espacios
+    'tasa_errores_ocr': 0.01,    # placas de ACCESSPARK con un carácter mal leído por la cámara
+    'dias': 30,
+}
+
+ABECEDARIO = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'), dtype=object)
+ALFANUMERICO = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'), dtype=object)
+
+# Confusiones típicas de las cámaras de placas (carácter real -> carácter leído)
+CONFUSIONES_CAMARA = {
+    '0': 'O', 'O': '0', '1': 'I', 'I': '1', '8': 'B', 'B': '8', '5': 'S', 'S': '5', '2': 'Z', 'Z': '2',
+    '6': 'G', 'G': '6',
+}
+
+# ========================================
+# DATOS SINTÉTICOS
+# ========================================
+
+def generar_placas(n, rng):
+    """n placas distintas con el formato colombiano ABC123"""
+    numeros = rng.choice(26 ** 3 * 1000, size=n, replace=False)
+    letras = numeros // 1000
+    return (
+        ABECEDARIO[letras // 676] + ABECEDARIO[letras // 26 % 26] + ABECEDARIO[letras % 26]
+        + np.array([f"{i:03d}" for i in range(1000)], dtype=object)[numeros % 1000]
+    )
+
+def leer_con_errores(placas, rng):
+    """Cada placa con un carácter mal leído: su confusión típica o, si no tiene, uno cualquiera"""
+    posiciones = rng.integers(0, 6, len(placas))
+    reemplazos = rng.choice(ALFANUMERICO, len(placas))
+    return np.array([
+        placa[:i] + CONFUSIONES_CAMARA.get(placa[i], reemplazo) + placa[i + 1:]
+        for placa, i, reemplazo in zip(placas, posiciones, reemplazos)
+    ], dtype=object)
+
+def textos_por_segundo(formato_hora):
+    """Texto de cada segundo del día (86.400 valores) para armar fechas sin strftime fila por fila"""
+    return np.array([formato_hora(s // 3600, s // 60 % 60, s % 60) for s in range(86400)], dtype=object)
+
+def hora_gopass(hora, minuto, segundo):
+    """Hora de 12 horas como en GOPASS: 2:57:50 p. m."""
+    return f"{(hora % 12) or 12}:{minuto:02d}:{segundo:02d} {'a. m.' if hora < 12 else 'p. m.'}"
+
+def formatear_momentos(segundos, formato_dia, textos_segundo):
+    """Convierte segundos desde 1970 en texto 'día hora' a partir de tablas por día y por segundo"""
+    dias, segundo_del_dia = np.divmod(segundos, 86400)
+    dias_unicos, codigos = np.unique(dias, return_inverse=True)
+    textos_dia = pd.to_datetime(dias_unicos, unit='D').strftime(formato_dia).to_numpy(dtype=object)
+    return pd.Series(textos_dia[codigos]) + ' ' + pd.Series(textos_segundo[segundo_del_dia])
+
+def generar_bases(filas, semilla=0, **parametros):
+    """
+    Genera (df_accesspark, df_gopass) sintéticos con las columnas originales de cada
+    fuente. parametros: ver PARAMETROS_POR_DEFECTO (placas, coincidencias, desfase del
+    reloj, dobles cobros, cobros huérfanos, cruces de medianoche, placas mal escritas y
+    mal leídas por la cámara)
+    """
+    p = {**PARAMETROS_POR_DEFECTO, **parametros}
+    rng = np.random.default_rng(semilla)
+    inicio = int(pd.Timestamp('2025-10-01').timestamp())
+
+    placas = generar_placas(max(10, int(filas * p['placas_por_fila'])), rng)
+    placa_a = rng.integers(0, len(placas), filas)
+    segundos_a = inicio + rng.integers(0, p['dias'] * 86400, filas)
+    # Ingresos justo antes de la medianoche: el cobro puede caer al día siguiente
+    medianoche = rng.random(filas) < p['tasa_medianoche']
+    segundos_a[medianoche] = segundos_a[medianoche] // 86400 * 86400 + 86400 - rng.integers(1, 600, medianoche.sum())
+
+    # Cobros de los ingresos con contraparte, huérfanos y dobles cobros
+    con_cobro = np.flatnonzero(rng.random(filas) < p['tasa_coincidencia'])
+    placa_g = placa_a[con_cobro]
+    segundos_g = segundos_a[con_cobro] + p['desfase_segundos'] + rng.integers(
+        -p['dispersion_segundos'], p['dispersion_segundos'] + 1, len(con_cobro)
+    )
+    huerfanos = int(len(con_cobro) * p['tasa_huerfanos'])
+    placa_g = np.concatenate([placa_g, rng.integers(0, len(placas), huerfanos)])
+    segundos_g = np.concatenate([segundos_g, inicio + rng.integers(0, p['dias'] * 86400, huerfanos)])
+    duplicados = rng.choice(len(placa_g), int(len(placa_g) * p['tasa_duplicados']), replace=False)
+    placa_g = np.concatenate([placa_g, placa_g[duplicados]])
+    segundos_g = np.concatenate([segundos_g, segundos_g[duplicados] + rng.integers(5, 120, len(duplicados))])
+    orden = rng.permutation(len(placa_g))
+    placa_g, segundos_g = placa_g[orden], segundos_g[orden]
+
+    # Placas de ACCESSPARK como las lee la cámara y las digita el operador: con un
+    # carácter confundido, en minúsculas o con espacio
+    textos_placa_a = pd.Series(placas[placa_a])
+    mal_leidas = rng.random(filas) < p['tasa_errores_ocr']
+    textos_placa_a[mal_leidas] = leer_con_errores(textos_placa_a[mal_leidas].to_numpy(dtype=object), rng)
+    sucias = rng.random(filas) < p['tasa_placas_sucias']
+    textos_placa_a[sucias] = textos_placa_a[sucias].str[:3].str.lower() + ' ' + textos_placa_a[sucias].str[3:]
+
+    df_accesspark = pd.DataFrame({
+        'id': np.arange(1, filas + 1),
+        'check_in': formatear_momentos(
+            segundos_a, '%Y-%m-%d', textos_por_segundo(lambda h, m, s: f"{h:02d}:{m:02d}:{s:02d}.000")
+        ),
+        'plate_in': textos_placa_a,
+        'sede': rng.choice(['Norte', 'Centro', 'Sur'], filas),
+    })
+    df_gopass = pd.DataFrame({
+        'Placa Vehiculo': placas[placa_g],
+        'Fecha de entrada': formatear_momentos(segundos_g, '%d/%m/%Y', textos_por_segundo(hora_gopass)),
+        'Valor': rng.choice([4500, 7000, 9500], len(placa_g)),
+    })
+    return df_accesspark, df_gopass
+
+def serializar(df, entrada):
+    """Contenido del archivo como se recibe: CSV con ';' en latin-1 o Excel"""
+    output = io.BytesIO()
+    if entrada == 'csv':
+        df.to_csv(output, sep=';', index=False, encoding='latin-1')
+    else:
+        # Fila por fila, en memoria constante, como se escriben los resultados
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'strings_to_urls': False})
+        escribir_hojas(workbook, df, 'Hoja1')
+        workbook.close()
+    return output.getvalue()
+
+# ========================================
+# MEDICIÓN
+# ========================================
+
+def serializar_bases(df_accesspark, df_gopass, entrada):
+    """Contenido de los archivos de ambas fuentes (ver serializar)"""
+    return serializar(df_accesspark, entrada), serializar(df_gopass, entrada)
+
+def medir(funcion, *args):
+    """
+    Ejecuta funcion(*args) como una etapa medida (ver medir_etapa)
+    Retorna (resultado, dict con segundos, pico_mb e incremento_mb sobre el inicio)
+    """
+    gc.collect()
+    rendimiento = []
+    with medir_etapa(rendimiento, funcion.__name__):
+        resultado = funcion(*args)
+    return resultado, {clave: rendimiento[0][clave] for clave in ('segundos', 'pico_mb', 'incremento_mb')}
+
+def unir_e_indexar(trabajos, resultados):
+    """Une los archivos preparados de cada fuente y calcula su índice (como preparar_bases)"""
+    bases = []
+    for fuente in ('ACCESSPARK', 'GOPASS'):
+        dfs = [r['df'] for (_, _, f, _), r in zip(trabajos, resultados) if f == fuente]
+        if any(df is None for df in dfs):
+            raise ValueError(next(r['error'] for r in resultados if r['df'] is None))
+        bases.append(dfs[0] if len(dfs) == 1 else pd.concat(dfs, ignore_index=True))
+    return bases[0], bases[1], indexar_coincidencias(bases[0], bases[1])
+
+def correr_escenario(filas, entrada, exportar, ventana, modo, max_procesos=None, semilla=0,
+                     placas_aproximadas=False, parametros=None):
+    """
+    Genera un escenario y mide cada etapa del pipeline
+    parametros: de los datos sintéticos (ver PARAMETROS_POR_DEFECTO); los que faltan
+    toman su valor por defecto
+    Retorna la lista de mediciones (un dict por etapa)
+    """
+    escenario = {'filas': filas, 'entrada': entrada}
+    mediciones = []
+
+    def registrar(etapa, medicion, **extra):
+        mediciones.append({**escenario, 'etapa': etapa, **medicion, **extra})
+        print(
+            f"{entrada:>5} {filas:>11,} {etapa:<22} {medicion['segundos']:>9.3f} s"
+            f"  pico {medicion['pico_mb'] or 0:>9,.1f} MB",
+            flush=True
+        )
+
+    (df_accesspark, df_gopass), medicion = medir(lambda: generar_bases(filas, semilla, **(parametros or {})))
+    registrar('generacion', medicion, filas_gopass=len(df_gopass))
+    contenidos, medicion = medir(serializar_bases, df_accesspark, df_gopass, entrada)
+    registrar('serializacion', medicion, bytes=sum(map(len, contenidos)))
+    del df_accesspark, df_gopass
+
+    trabajos = armar_trabajos(
+        [(f"accesspark.{entrada}", contenidos[0])], [(f"gopass.{entrada}", contenidos[1])]
+    )
+    del contenidos
+    resultados, medicion = medir(preparar_archivos, trabajos, max_procesos)
+    registrar('lectura', medicion)
+    (df_accesspark, df_gopass, indice), medicion = medir(unir_e_indexar, trabajos, resultados)
+    registrar('indice', medicion)
+    del trabajos, resultados
+
+    (validado_accesspark, validado_gopass), medicion = medir(
+        validar_coincidencias, df_accesspark, df_gopass, ventana, modo, indice, max_procesos, placas_aproximadas
+    )
+    resumen = contar_coincidencias(validado_accesspark, validado_gopass)
+    registrar('coincidencias', medicion, procesos=procesos_coincidencias(indice, max_procesos), **resumen)
+    del df_accesspark, df_gopass, indice
+
+    for extension in exportar:
+        if extension == 'xlsx' and filas > FILAS_MAX_EXCEL:
+            continue
+        archivos, medicion = medir(
+            crear_archivos_descarga, validado_accesspark, validado_gopass, FORMATOS_POR_EXTENSION[extension]
+        )
+        registrar(f"exportacion_{extension}", medicion, bytes=sum(len(datos) for _, datos, _ in archivos))
+        del archivos
+
+    return mediciones
+
+def version_codigo():
+    """Commit actual del repositorio (None si no es un repositorio git)"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# ========================================
+# COMPARACIÓN
+# ========================================
+
+def comparar(ruta_base, ruta_nueva):
+    """Imprime, por escenario y etapa, la razón de tiempo y de pico de memoria nueva/base"""
+    informes = []
+    for ruta in (ruta_base, ruta_nueva):
+        with open(ruta, encoding='utf-8') as f:
+            informes.append(json.load(f))
+
+    def por_llave(informe):
+        return {(m['entrada'], m['filas'], m['etapa']): m for m in informe['mediciones']}
+
+    base, nueva = por_llave(informes[0]), por_llave(informes[1])
+    print(f"base:  {ruta_base} ({informes[0]['version']}, {informes[0]['fecha']})")
+    print(f"nueva: {ruta_nueva} ({informes[1]['version']}, {informes[1]['fecha']})")
+    print(f"{'entrada':>7} {'filas':>11} {'etapa':<22} {'base s':>9} {'nueva s':>9} {'tiempo':>7} {'memoria':>8}")
+    # En el orden en que se midió la base
+    for llave in [llave for llave in base if llave in nueva]:
+        b, n = base[llave], nueva[llave]
+        razon_tiempo = n['segundos'] / b['segundos'] if b['segundos'] else float('nan')
+        razon_memoria = (
+            n['pico_mb'] / b['pico_mb'] if b.get('pico_mb') and n.get('pico_mb') else float('nan')
+        )
+        print(
+            f"{llave[0]:>7} {llave[1]:>11,} {llave[2]:<22} {b['segundos']:>9.3f} {n['segundos']:>9.3f}"
+            f" {razon_tiempo:>6.2f}x {razon_memoria:>7.2f}x"
+        )
+
+# ========================================
+# LÍNEA DE COMANDOS
+# ========================================
+
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        description="Mide el validador con datos sintéticos y guarda los resultados en JSON"
+    )
+    parser.add_argument('--filas', type=int, nargs='+', default=TAMANOS_POR_DEFECTO,
+                        help="Filas de ACCESSPARK de cada escenario")
+    parser.add_argument('--entradas', nargs='+', choices=ENTRADAS, default=ENTRADAS,
+                        help="Formatos de archivo de entrada")
+    parser.add_argument('--exportar', nargs='*', choices=list(FORMATOS_POR_EXTENSION),
+                        default=list(FORMATOS_POR_EXTENSION), help="Formatos de descarga a medir")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_MINUTOS)
+    parser.add_argument('--modo', choices=list(MODOS_COINCIDENCIA.values()), default=MODO_POR_DEFECTO)
+    parser.add_argument('--procesos', type=int,
+                        help="Procesos para leer y buscar coincidencias (1: todo en el proceso principal)")
+    parser.add_argument('--placas-aproximadas', action='store_true',
+                        help="Buscar también con errores de lectura de placa (ver validar_coincidencias)")
+    parser.add_argument('--semilla', type=int, default=0)
+    datos = parser.add_argument_group("datos sintéticos", "Ver PARAMETROS_POR_DEFECTO")
+    datos.add_argument('--placas-por-fila', type=float, default=PARAMETROS_POR_DEFECTO['placas_por_fila'],
+                       help="Placas distintas por fila de ACCESSPARK (cardinalidad de placas)")
+    datos.add_argument('--tasa-coincidencia', type=float, default=PARAMETROS_POR_DEFECTO['tasa_coincidencia'],
+                       help="Fracción de ingresos de ACCESSPARK con cobro en GOPASS")
+    datos.add_argument('--desfase-segundos', type=int, default=PARAMETROS_POR_DEFECTO['desfase_segundos'],
+                       help="Adelanto del reloj de GOPASS respecto al de ACCESSPARK")
+    datos.add_argument('--dispersion-segundos', type=int, default=PARAMETROS_POR_DEFECTO['dispersion_segundos'],
+                       help="Variación aleatoria (±) del cobro alrededor del ingreso")
+    datos.add_argument('--tasa-duplicados', type=float, default=PARAMETROS_POR_DEFECTO['tasa_duplicados'],
+                       help="Fracción de cobros de GOPASS repetidos (doble cobro)")
+    datos.add_argument('--tasa-huerfanos', type=float, default=PARAMETROS_POR_DEFECTO['tasa_huerfanos'],
+                       help="Cobros de GOPASS sin ingreso en ACCESSPARK, como fracción de los cobros")
+    datos.add_argument('--tasa-medianoche', type=float, default=PARAMETROS_POR_DEFECTO['tasa_medianoche'],
+                       help="Fracción de ingresos en los 10 minutos previos a la medianoche")
+    datos.add_argument('--tasa-placas-sucias', type=float, default=PARAMETROS_POR_DEFECTO['tasa_placas_sucias'],
+                       help="Fracción de placas de ACCESSPARK en minúsculas o con espacios")
+    datos.add_argument('--tasa-errores-ocr', type=float, default=PARAMETROS_POR_DEFECTO['tasa_errores_ocr'],
+                       help="Fracción de placas de ACCESSPARK con un carácter mal leído por la cámara")
+    datos.add_argument('--dias', type=int, default=PARAMETROS_POR_DEFECTO['dias'],
+                       help="Días que abarcan los datos")
+    parser.add_argument('--salida', help="Archivo JSON de resultados (por defecto benchmark_<fecha>.json)")
+    parser.add_argument('--comparar', nargs=2, metavar=('BASE', 'NUEVA'),
+                        help="Compara dos archivos de resultados en lugar de medir")
+    return parser
+
+def main(argumentos=None):
+    parser = crear_parser()
+    args = parser.parse_args(argumentos)
+    if args.comparar:
+        comparar(*args.comparar)
+        return 0
+    parametros = {clave: getattr(args, clave) for clave in PARAMETROS_POR_DEFECTO}
+    for clave, valor in parametros.items():
+        if clave.startswith('tasa_') and not 0 <= valor <= 1:
+            parser.error(f"--{clave.replace('_', '-')} debe estar entre 0 y 1")
+    if parametros['placas_por_fila'] <= 0 or parametros['dias'] < 1 or parametros['dispersion_segundos'] < 0:
+        parser.error("--placas-por-fila y --dias deben ser positivos y --dispersion-segundos no negativo")
+
+    informe = {
+        'version': version_codigo(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'entorno': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'plataforma': platform.platform(),
+            'nucleos': os.cpu_count(),
+        },
+        'parametros': {
+            **parametros, 'tolerancia': args.tolerancia, 'modo': args.modo,
+            'procesos': args.procesos, 'semilla': args.semilla, 'placas_aproximadas': args.placas_aproximadas,
+        },
+        'mediciones': [],
+    }
+    salida = args.salida or f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+
+    for filas in sorted(args.filas):
+        for entrada in args.entradas:
+            if entrada == 'xlsx' and filas > FILAS_MAX_EXCEL:
+                print(f"xlsx {filas:>11,} omitido: supera las {FILAS_MAX_EXCEL:,} filas de una hoja de Excel")
+                continue
+            informe['mediciones'].extend(correr_escenario(
+                filas, entrada, args.exportar, args.tolerancia, args.modo, args.procesos, args.semilla,
+                args.placas_aproximadas, parametros
+            ))
+            # Se guarda después de cada escenario: una corrida interrumpida conserva lo medido
+            with open(salida, 'w', encoding='utf-8') as f:
+                json.dump(informe, f, ensure_ascii=False, indent=1)
+
+    print(f"Resultados en {salida}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""
+Validación de cobros ACCESSPARK / GOPASS desde la línea de comandos, sin Streamlit
+
+Cada conciliación escribe sus archivos de resultado en el directorio de salida e
+imprime una línea JSON con sus estadísticas, para usarla en tareas programadas.
+
+Ejemplos:
+    python cli.py --accesspark "datos/norte/2025-10-*.csv" --gopass datos/gopass_octubre.xlsx --salida resultados
+    python cli.py --trabajos trabajos.json --formato parquet --ventana 0 15
+    python cli.py --accesspark datos/norte.csv --gopass datos/gopass.csv --perfil
+
+Cada etapa se mide (tiempo, filas por segundo y memoria) y se registra como una
+línea JSON en la salida de errores (nivel con ACCESPARK_LOG_NIVEL); las mediciones
+también quedan en la clave rendimiento de las estadísticas.
+
+trabajos.json es una lista de conciliaciones:
+    [{"nombre": "norte", "accesspark": ["datos/norte/*.csv"], "gopass": ["datos/gopass.csv"]}, ...]
+
+Con --lote, las conciliaciones de trabajos.json con los mismos archivos de GOPASS se
+hacen en un solo lote (ver conciliar_lote): GOPASS se lee una vez para todos los
+sitios, y además de la línea de cada conciliación se imprime la del lote completo.
+    python cli.py --trabajos sitios.json --lote --consolidado --salida resultados
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import traceback
+
+from procesamiento import (
+    TOLERANCIA_MINUTOS,
+    FORMATOS_DESCARGA,
+    MODOS_COINCIDENCIA,
+    MODO_POR_DEFECTO,
+    armar_trabajos,
+    conciliar_archivos,
+    conciliar_lote,
+    conciliar_por_particiones,
+    configurar_log,
+    perfilar,
+)
+
+# Formato de salida por extensión (--formato) -> etiqueta de FORMATOS_DESCARGA
+FORMATOS_POR_EXTENSION = {extension: etiqueta for etiqueta, (extension, _) in FORMATOS_DESCARGA.items()}
+
+# ========================================
+# CONCILIACIÓN
+# ========================================
+
+def expandir_rutas(patrones):
+    """Expande los patrones glob (admite **) en rutas de archivo ordenadas y sin repetir"""
+    rutas = []
+    for patron in patrones:
+        coincidencias = sorted(glob.glob(patron, recursive=True)) or ([patron] if os.path.isfile(patron) else [])
+        if not coincidencias:
+            raise FileNotFoundError(f"Ningún archivo coincide con '{patron}'")
+        rutas.extend(ruta for ruta in coincidencias if ruta not in rutas)
+    return rutas
+
+def leer_contenidos(rutas):
+    """Lista de (nombre, contenido) de cada ruta"""
+    contenidos = []
+    for ruta in rutas:
+        with open(ruta, 'rb') as f:
+            contenidos.append((os.path.basename(ruta), f.read()))
+    return contenidos
+
+def resumir_lecturas(resultados):
+    """Lectura de cada archivo (ver preparar_archivo) en forma serializable a JSON"""
+    return [
+        {'archivo': r['archivo'], 'filas': r['filas'], 'segundos': round(r['segundos'], 3), 'error': r['error']}
+        for r in resultados
+    ]
+
+def escribir_archivos(archivos, directorio_salida):
+    """Escribe los (nombre_archivo, datos, mime) en directorio_salida; retorna sus rutas"""
+    os.makedirs(directorio_salida, exist_ok=True)
+    rutas = []
+    for nombre_archivo, datos, _ in archivos:
+        ruta = os.path.join(directorio_salida, nombre_archivo)
+        with open(ruta, 'wb') as f:
+            f.write(datos)
+        rutas.append(ruta)
+    return rutas
+
+def conciliar(nombre, patrones_accesspark, patrones_gopass, directorio_salida, extension='xlsx',
+              ventana=TOLERANCIA_MINUTOS, modo=MODO_POR_DEFECTO, columnas_extra=None,
+              memoria_mb=None, max_procesos=None, placas_aproximadas=False):
+    """
+    Ejecuta una conciliación completa y escribe sus archivos en directorio_salida
+    memoria_mb: si se indica, usa el modo por particiones (ver conciliar_por_particiones)
+    placas_aproximadas: buscar también con errores de lectura de placa (solo en memoria)
+    Retorna un dict con las estadísticas (serializable a JSON)
+    """
+    inicio = time.perf_counter()
+    rutas_accesspark = expandir_rutas(patrones_accesspark)
+    rutas_gopass = expandir_rutas(patrones_gopass)
+    os.makedirs(directorio_salida, exist_ok=True)
+
+    estadisticas = {
+        'nombre': nombre,
+        'archivos_accesspark': rutas_accesspark,
+        'archivos_gopass': rutas_gopass,
+        'ventana': list(ventana) if isinstance(ventana, (list, tuple)) else ventana,
+        'modo': modo,
+        'placas_aproximadas': placas_aproximadas,
+        'rendimiento': [],
+    }
+
+    if memoria_mb is not None:
+        if extension == 'xlsx':
+            extension = 'csv.gz'
+        resumen = conciliar_por_particiones(
+            [(os.path.basename(ruta), ruta) for ruta in rutas_accesspark],
+            [(os.path.basename(ruta), ruta) for ruta in rutas_gopass],
+            directorio_salida,
+            extension=extension,
+            memoria_mb=memoria_mb,
+            minutos_tolerancia=ventana,
+            columnas_extra=columnas_extra,
+            modo=modo,
+            rendimiento=estadisticas['rendimiento'],
+            max_procesos=max_procesos
+        )
+        estadisticas['particiones'] = resumen['particiones']
+        estadisticas['salidas'] = [ruta for ruta in resumen['rutas'].values() if os.path.exists(ruta)]
+        estadisticas.update({clave: valor for clave, valor in resumen.items() if clave.startswith(('total_', 'encontradas_'))})
+    else:
+        trabajos = armar_trabajos(leer_contenidos(rutas_accesspark), leer_contenidos(rutas_gopass), columnas_extra)
+        conciliacion = conciliar_archivos(
+            trabajos, ventana, modo, FORMATOS_POR_EXTENSION[extension], max_procesos,
+            rendimiento=estadisticas['rendimiento'], placas_aproximadas=placas_aproximadas
+        )
+        estadisticas['lectura'] = resumir_lecturas(conciliacion['bases']['resultados'])
+        if conciliacion['bases']['error']:
+            raise ValueError(conciliacion['bases']['error'])
+        estadisticas.update(conciliacion['resumen'])
+
+        estadisticas['salidas'] = escribir_archivos(conciliacion['archivos'], directorio_salida)
+
+    estadisticas['segundos'] = round(time.perf_counter() - inicio, 3)
+    return estadisticas
+
+def conciliar_en_lote(nombre, grupos, patrones_gopass, directorio_salida, extension='xlsx',
+                      ventana=TOLERANCIA_MINUTOS, modo=MODO_POR_DEFECTO, columnas_extra=None,
+                      max_procesos=None, placas_aproximadas=False, consolidado=False):
+    """
+    Concilia varios grupos contra los mismos archivos de GOPASS leyéndolos una sola vez
+    (ver conciliar_lote) y escribe los archivos de cada grupo en su directorio
+    grupos: lista de (nombre, patrones de ACCESSPARK, directorio de salida)
+    consolidado: escribir también los archivos del lote completo en directorio_salida
+    Retorna una lista con las estadísticas de cada grupo y, al final, las del lote
+    """
+    inicio = time.perf_counter()
+    rutas_gopass = expandir_rutas(patrones_gopass)
+    rutas_grupos = [expandir_rutas(patrones) for _, patrones, _ in grupos]
+
+    estadisticas_lote = {
+        'nombre': nombre,
+        'conciliaciones': [nombre_grupo for nombre_grupo, _, _ in grupos],
+        'archivos_gopass': rutas_gopass,
+        'ventana': list(ventana) if isinstance(ventana, (list, tuple)) else ventana,
+        'modo': modo,
+        'placas_aproximadas': placas_aproximadas,
+        'rendimiento': [],
+    }
+    lote = conciliar_lote(
+        [(nombre_grupo, leer_contenidos(rutas)) for (nombre_grupo, _, _), rutas in zip(grupos, rutas_grupos)],
+        leer_contenidos(rutas_gopass), ventana, modo, FORMATOS_POR_EXTENSION[extension], columnas_extra,
+        max_procesos, rendimiento=estadisticas_lote['rendimiento'], placas_aproximadas=placas_aproximadas,
+        consolidado=consolidado
+    )
+    estadisticas_lote['lectura'] = resumir_lecturas(lote['resultados'])
+    if lote['error']:
+        raise ValueError(lote['error'])
+
+    lineas = []
+    for (nombre_grupo, _, directorio), rutas, grupo in zip(grupos, rutas_grupos, lote['grupos']):
+        estadisticas = {'nombre': nombre_grupo, 'lote': nombre, 'archivos_accesspark': rutas}
+        estadisticas['lectura'] = resumir_lecturas(grupo['resultados'])
+        if grupo['error']:
+            estadisticas['error'] = grupo['error']
+        else:
+            estadisticas.update(grupo['resumen'])
+            estadisticas['salidas'] = escribir_archivos(grupo['archivos'], directorio)
+        lineas.append(estadisticas)
+
+    estadisticas_lote.update(lote['resumen'])
+    estadisticas_lote['salidas'] = escribir_archivos(lote['archivos'], directorio_salida) if consolidado else []
+    estadisticas_lote['segundos'] = round(time.perf_counter() - inicio, 3)
+    lineas.append(estadisticas_lote)
+    return lineas
+
+# ========================================
+# LÍNEA DE COMANDOS
+# ========================================
+
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        description="Valida cobros de GOPASS contra los ingresos de ACCESSPARK sin interfaz gráfica"
+    )
+    parser.add_argument('--accesspark', nargs='+', metavar='PATRON',
+                        help="Archivos de ACCESSPARK (rutas o patrones glob)")
+    parser.add_argument('--gopass', nargs='+', metavar='PATRON',
+                        help="Archivos de GOPASS (rutas o patrones glob)")
+    parser.add_argument('--trabajos', metavar='JSON',
+                        help="Archivo JSON con varias conciliaciones (nombre, accesspark, gopass)")
+    parser.add_argument('--salida', default='resultados',
+                        help="Directorio de salida; con --trabajos, un subdirectorio por conciliación")
+    parser.add_argument('--formato', choices=list(FORMATOS_POR_EXTENSION), default='xlsx')
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_MINUTOS,
+                        help="Tolerancia simétrica en minutos (admite fracciones)")
+    parser.add_argument('--ventana', type=float, nargs=2, metavar=('DESDE', 'HASTA'),
+                        help="Ventana asimétrica en minutos de GOPASS menos ACCESSPARK (reemplaza --tolerancia)")
+    parser.add_argument('--modo', choices=list(MODOS_COINCIDENCIA.values()), default=MODO_POR_DEFECTO)
+    parser.add_argument('--placas-aproximadas', action='store_true',
+                        help="Buscar los registros sin contraparte admitiendo errores de lectura de placa")
+    parser.add_argument('--columnas', nargs='*', metavar='COLUMNA',
+                        help="Cargar solo las columnas necesarias más estas columnas adicionales")
+    parser.add_argument('--memoria-mb', type=int,
+                        help="Usar el modo por particiones con esta memoria máxima por partición")
+    parser.add_argument('--procesos', type=int,
+                        help="Procesos para leer los archivos y buscar coincidencias (por defecto, todos los núcleos)")
+    parser.add_argument('--lote', action='store_true',
+                        help="Con --trabajos, conciliar en un lote las que comparten archivos de GOPASS (se leen una vez)")
+    parser.add_argument('--consolidado', action='store_true',
+                        help="Con --lote, escribir también los archivos del lote completo")
+    parser.add_argument('--perfil', action='store_true',
+                        help="Ejecutar con cProfile y guardar perfil.prof en el directorio de salida")
+    return parser
+
+def main(argumentos=None):
+    parser = crear_parser()
+    args = parser.parse_args(argumentos)
+
+    if args.trabajos:
+        with open(args.trabajos, encoding='utf-8') as f:
+            conciliaciones = [
+                (t['nombre'], t['accesspark'], t['gopass'], os.path.join(args.salida, t['nombre']))
+                for t in json.load(f)
+            ]
+    elif args.accesspark and args.gopass:
+        conciliaciones = [('conciliacion', args.accesspark, args.gopass, args.salida)]
+    else:
+        parser.error("Indica --accesspark y --gopass, o --trabajos")
+
+    if args.placas_aproximadas and args.memoria_mb is not None:
+        parser.error("--placas-aproximadas no está disponible en el modo por particiones (--memoria-mb)")
+
+    if args.lote and not args.trabajos:
+        parser.error("--lote requiere --trabajos")
+    if args.lote and args.memoria_mb is not None:
+        parser.error("--lote no está disponible en el modo por particiones (--memoria-mb)")
+
+    ventana = tuple(args.ventana) if args.ventana else args.tolerancia
+    codigo_salida = 0
+    configurar_log()
+
+    if args.lote:
+        # Un lote por cada conjunto distinto de archivos de GOPASS, en el orden de trabajos.json
+        lotes = {}
+        for nombre, accesspark, gopass, directorio in conciliaciones:
+            lotes.setdefault(tuple(gopass), []).append((nombre, accesspark, directorio))
+        for numero, (gopass, grupos) in enumerate(lotes.items(), start=1):
+            nombre_lote = f"lote_{numero}"
+            directorio_lote = os.path.join(args.salida, nombre_lote)
+            argumentos_lote = (
+                nombre_lote, grupos, list(gopass), directorio_lote, args.formato, ventana, args.modo,
+                args.columnas, args.procesos, args.placas_aproximadas, args.consolidado
+            )
+            try:
+                if args.perfil:
+                    lineas, perfil = perfilar(conciliar_en_lote, *argumentos_lote)
+                    os.makedirs(directorio_lote, exist_ok=True)
+                    lineas[-1]['perfil'] = os.path.join(directorio_lote, 'perfil.prof')
+                    with open(lineas[-1]['perfil'], 'wb') as f:
+                        f.write(perfil['datos'])
+                else:
+                    lineas = conciliar_en_lote(*argumentos_lote)
+            except Exception as e:
+                lineas = [{'nombre': nombre_lote, 'error': str(e), 'detalle': traceback.format_exc()}]
+            for estadisticas in lineas:
+                if 'error' in estadisticas:
+                    codigo_salida = 1
+                print(json.dumps(estadisticas, ensure_ascii=False), flush=True)
+        return codigo_salida
+
+    for nombre, accesspark, gopass, directorio in conciliaciones:
+        argumentos_conciliar = (
+            nombre, accesspark, gopass, directorio, args.formato, ventana, args.modo,
+            args.columnas, args.memoria_mb, args.procesos, args.placas_aproximadas
+        )
+        try:
+            if args.perfil:
+                estadisticas, perfil = perfilar(conciliar, *argumentos_conciliar)
+                estadisticas['perfil'] = os.path.join(directorio, 'perfil.prof')
+                with open(estadisticas['perfil'], 'wb') as f:
+                    f.write(perfil['datos'])
+            else:
+                estadisticas = conciliar(*argumentos_conciliar)
+        except Exception as e:
+            estadisticas = {'nombre': nombre, 'error': str(e), 'detalle': traceback.format_exc()}
+            codigo_salida = 1
+        print(json.dumps(estadisticas, ensure_ascii=False), flush=True)
+
+    return codigo_salida
+
+if __name__ == '__main__':
+    sys.exit(main())
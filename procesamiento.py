@@ -0,0 +1,2571 @@
+import os
+import re
+import io
+import csv
+import codecs
+import gzip
+import hashlib
+import json
+import math
+import time
+import pstats
+import cProfile
+import logging
+import tempfile
+import threading
+import traceback
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+from openpyxl import load_workbook
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_DISPONIBLE = True
+except ImportError:
+    PYARROW_DISPONIBLE = False
+
+# Lector nativo de Excel (opcional): varias veces más rápido que openpyxl
+try:
+    import python_calamine
+    CALAMINE_DISPONIBLE = True
+except ImportError:
+    CALAMINE_DISPONIBLE = False
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# CONFIGURACIÓN
+# ========================================
+
+# Ventana de tolerancia (en minutos, admite fracciones) para considerar que dos
+# registros coinciden; la comparación se hace al segundo. Donde se recibe
+# minutos_tolerancia también se acepta una ventana asimétrica (desde, hasta) para
+# GOPASS menos ACCESSPARK, p. ej. (0, 15): el cobro hasta 15 minutos después del ingreso
+TOLERANCIA_MINUTOS = 10
+
+# Valor int64 que representa un instante nulo (mismo valor que NaT en NumPy)
+INSTANTE_NULO = np.iinfo(np.int64).min
+
+# Filas de datos por hoja de Excel (1.048.576 menos la fila de encabezado)
+FILAS_MAX_EXCEL = 1_048_575
+
+# Filas convertidas a la vez al escribir el Excel fila por fila
+FILAS_POR_BLOQUE = 50_000
+
+# Opciones de los libros de Excel generados (escritura fila por fila en memoria constante)
+OPCIONES_EXCEL = {
+    'constant_memory': True,
+    'strings_to_urls': False,
+    'nan_inf_to_errors': True,
+    'default_date_format': 'dd/mm/yyyy hh:mm:ss',
+}
+
+# Registros por página del explorador de resultados (ver pagina_consulta)
+FILAS_POR_PAGINA = 100
+
+# Formatos de descarga disponibles: etiqueta -> (extensión, tipo MIME)
+FORMATOS_DESCARGA = {
+    'Excel (.xlsx)': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'CSV comprimido (.csv.gz)': ('csv.gz', 'application/gzip'),
+    'Parquet (.parquet)': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+# Columnas requeridas por el validador en cada base
+COLUMNAS_ACCESSPARK = ['check_in', 'plate_in']
+COLUMNAS_GOPASS = ['Fecha de entrada', 'Placa Vehiculo']
+
+# Columnas (fecha, placa) de cada fuente
+COLUMNAS_FUENTE = {
+    'ACCESSPARK': COLUMNAS_ACCESSPARK,
+    'GOPASS': COLUMNAS_GOPASS,
+}
+
+# Estado_Validacion de cada fuente: (con contraparte, sin contraparte, con contraparte
+# de placa aproximada)
+ETIQUETAS_ESTADO = {
+    'ACCESSPARK': (
+        'Llave encontrada en GOPASS', 'Llave NO encontrada en GOPASS', 'Placa aproximada encontrada en GOPASS'
+    ),
+    'GOPASS': (
+        'Llave encontrada en ACCESSPARK', 'Llave NO encontrada en ACCESSPARK',
+        'Placa aproximada encontrada en ACCESSPARK'
+    ),
+}
+
+# Modos de coincidencia: cada registro con su contraparte más cercana (uno a uno)
+# o solo la existencia de alguna contraparte en la ventana
+MODOS_COINCIDENCIA = {
+    'Emparejamiento uno a uno (más cercano primero)': 'emparejamiento',
+    'Existencia de contraparte en la ventana': 'existencia',
+}
+MODO_POR_DEFECTO = 'emparejamiento'
+
+# Estados de las estadísticas, en el orden de los códigos de estado (ver codigos_estado)
+# y de ETIQUETAS_ESTADO; placas sin contraparte que se listan (las de más registros)
+ESTADOS_RESUMEN = ['Encontradas', 'No encontradas', 'Placa aproximada']
+TOP_PLACAS_SIN_CONTRAPARTE = 20
+
+# Columnas de trabajo agregadas a cada fuente al prepararla (no se exportan)
+COLUMNAS_TRABAJO = ['momento_entrada', 'placa_normalizada']
+
+# Columnas que agrega la validación: encontrada (booleana, se exporta como
+# Estado_Validacion), en el modo emparejamiento la contraparte y la diferencia (y en
+# un lote, el grupo de la contraparte de GOPASS), y con placas aproximadas la placa
+# de la contraparte
+COLUMNAS_DETALLE = ['matched_row_id', 'matched_group', 'delta_minutes', 'matched_plate']
+
+# Placas aproximadas (errores de lectura de las cámaras): solo se cambian entre sí los
+# caracteres de una misma clase de CONFUSIONES_OCR (se llevan a una forma canónica), y
+# en placas de al menos PLACA_MIN_APROXIMADA caracteres se admite además un carácter
+# sobrante o faltante si el resto coincide en forma canónica. Dos placas con un
+# carácter realmente distinto (MVC867 y MVU867) son vehículos distintos.
+CONFUSIONES_OCR = {'0': 'OQD', '1': 'IL', '8': 'B', '5': 'S', '2': 'Z', '6': 'G'}
+PLACA_MIN_APROXIMADA = 5
+# Candidatos de la otra fuente que se toman por registro y placa candidata, a cada
+# lado de su instante: acota el cruce de placas con muchos registros
+CANDIDATOS_APROXIMADOS = 2
+
+# Archivos que suman menos bytes que esto se leen en el proceso principal
+BYTES_MINIMOS_PARALELO = 20 * 1024 * 1024
+
+# Búsqueda de coincidencias en varios núcleos: por debajo de estas filas válidas (ambas
+# fuentes) no compensa arrancar el pool; cada proceso recibe varios tramos de placas
+# para repartir la carga aunque algunas placas tengan muchos más registros
+FILAS_MINIMAS_PARALELO = 2_000_000
+TRAMOS_POR_PROCESO = 4
+
+# Modo por particiones: memoria objetivo, filas por lote de lectura y cuánto ocupa
+# en memoria un byte de archivo una vez cargado en pandas (estimación conservadora)
+MEMORIA_MB_POR_DEFECTO = 2048
+FILAS_POR_LOTE = 200_000
+FACTOR_EXPANSION_MEMORIA = 6
+
+# Caché en disco de archivos ya preparados (Parquet por hash de contenido).
+# ACCESPARK_CACHE_MAX_MB=0 la desactiva. Subir VERSION_CACHE cuando cambie la
+# preparación de los archivos invalida las entradas anteriores.
+DIRECTORIO_CACHE = os.environ.get(
+    'ACCESPARK_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'accespark')
+)
+CACHE_MAX_MB = int(os.environ.get('ACCESPARK_CACHE_MAX_MB', 2048))
+VERSION_CACHE = 2
+
+# Conciliaciones incrementales: un directorio por conciliación con los eventos
+# indexados por fuente y día
+DIRECTORIO_ESTADOS = os.environ.get(
+    'ACCESPARK_ESTADOS_DIR', os.path.join(os.path.expanduser('~'), '.local', 'share', 'accespark')
+)
+
+# Intervalo con que se muestrea la memoria residente mientras se mide una etapa
+INTERVALO_MUESTREO_MEMORIA = 0.01
+
+# Separadores candidatos y bytes del inicio usados para detectar el formato de un CSV
+SEPARADORES_CSV = [',', ';', '\t', '|']
+TAMANO_MUESTRA_CSV = 64 * 1024
+
+# Bytes decodificados a la vez al verificar el encoding de un CSV leído por lotes
+TAMANO_BLOQUE_ENCODING = 8 * 1024 * 1024
+
+# Formatos de fecha/hora probados en orden sobre toda la columna
+FORMATOS_ACCESSPARK = [
+    '%Y-%m-%d %H:%M:%S.%f',   # 2025-02-27 14:23:00.000
+    '%Y-%m-%d %H:%M:%S',      # 2025-02-27 14:23:00
+    '%Y-%m-%d %H:%M',         # 2025-02-27 14:23
+]
+
+FORMATOS_GOPASS = [
+    '%d/%m/%Y %I:%M:%S %p',  # 28/10/2025 2:57:50 p. m.
+    '%d/%m/%Y %H:%M:%S',      # 28/10/2025 14:57:50
+    '%d/%m/%Y %I:%M %p',      # 28/10/2025 2:57 p. m.
+    '%d/%m/%Y %H:%M',         # 28/10/2025 14:57
+]
+
+# ========================================
+# PROGRESO
+# ========================================
+
+def notificar(progreso, etapa, hecho, total=None, detalle=''):
+    """
+    Informa el avance de una etapa ('lectura', 'coincidencias', 'exportacion') si se
+    recibió una función progreso(etapa, hecho, total, detalle); total None si no se conoce
+    """
+    if progreso is not None:
+        progreso(etapa, hecho, total, detalle)
+
+# ========================================
+# RENDIMIENTO
+# ========================================
+
+def memoria_residente_mb():
+    """Memoria residente del proceso en MB (None si el sistema no expone /proc)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def configurar_log(nivel=None):
+    """
+    Envía el log de este módulo (mediciones de etapas en JSON) a la salida de errores
+    nivel: nombre del nivel; por defecto ACCESPARK_LOG_NIVEL o INFO
+    """
+    if not logger.handlers:
+        manejador = logging.StreamHandler()
+        manejador.setFormatter(logging.Formatter('%(asctime)s %(name)s %(levelname)s %(message)s'))
+        logger.addHandler(manejador)
+    logger.setLevel((nivel or os.environ.get('ACCESPARK_LOG_NIVEL', 'INFO')).upper())
+
+@contextmanager
+def medir_etapa(rendimiento, etapa, filas=None, **contexto):
+    """
+    Mide una etapa: segundos, filas por segundo y pico de memoria residente del proceso
+    (muestreada en un hilo aparte mientras dura la etapa). La medición se agrega a
+    rendimiento (lista; None no mide nada) y se emite como una línea de log en JSON.
+    Entrega el dict de la medición: la etapa puede fijar medicion['filas'] al terminar.
+    contexto: datos adicionales de la medición (archivo, fuente, partición, ...)
+    """
+    medicion = {'etapa': etapa, **contexto, 'filas': filas}
+    if rendimiento is None:
+        yield medicion
+        return
+    
+    inicial = memoria_residente_mb()
+    pico = [inicial]
+    terminado = threading.Event()
+    
+    def muestrear():
+        while not terminado.wait(INTERVALO_MUESTREO_MEMORIA):
+            pico[0] = max(pico[0], memoria_residente_mb())
+    
+    muestreo = None
+    if inicial is not None:
+        muestreo = threading.Thread(target=muestrear, daemon=True)
+        muestreo.start()
+    inicio = time.perf_counter()
+    try:
+        yield medicion
+    finally:
+        segundos = time.perf_counter() - inicio
+        terminado.set()
+        if muestreo is not None:
+            muestreo.join()
+            pico[0] = max(pico[0], memoria_residente_mb())
+        
+        medicion['segundos'] = round(segundos, 4)
+        medicion['filas_por_segundo'] = round(medicion['filas'] / segundos) if medicion['filas'] and segundos else None
+        medicion['pico_mb'] = None if inicial is None else round(pico[0], 1)
+        medicion['incremento_mb'] = None if inicial is None else round(pico[0] - inicial, 1)
+        rendimiento.append(medicion)
+        logger.info(json.dumps({'evento': 'etapa', **medicion}, ensure_ascii=False, default=str))
+
+def perfilar(funcion, *args, **kwargs):
+    """
+    Ejecuta funcion con cProfile (solo el hilo actual; la lectura en procesos hijos no
+    queda en el perfil) y retorna (resultado, perfil), con perfil un dict con datos
+    (bytes .prof para pstats o snakeviz) y resumen (texto con las funciones de mayor
+    tiempo acumulado)
+    """
+    perfilador = cProfile.Profile()
+    try:
+        resultado = perfilador.runcall(funcion, *args, **kwargs)
+    finally:
+        with tempfile.NamedTemporaryFile(suffix='.prof', delete=False) as f:
+            ruta = f.name
+        perfilador.dump_stats(ruta)
+        with open(ruta, 'rb') as f:
+            datos = f.read()
+        os.remove(ruta)
+    
+    resumen = io.StringIO()
+    pstats.Stats(perfilador, stream=resumen).sort_stats('cumulative').print_stats(40)
+    return resultado, {'datos': datos, 'resumen': resumen.getvalue()}
+
+# ========================================
+# FECHAS Y PLACAS
+# ========================================
+
+def limpiar_am_pm(texto):
+    """Unifica espacios y convierte 'a. m.'/'p. m.' en AM/PM sobre una columna de texto"""
+    return (
+        texto.str.replace(r'\s+', ' ', regex=True)
+        .str.strip()
+        .str.replace(r'\s*a\.\s*m\.', ' AM', regex=True, case=False)
+        .str.replace(r'\s*p\.\s*m\.', ' PM', regex=True, case=False)
+    )
+
+def parsear_en_cascada(valores, formatos):
+    """Prueba cada formato una vez sobre los valores que el anterior no pudo interpretar"""
+    resultado = pd.Series(pd.NaT, index=valores.index, dtype='datetime64[ns]')
+    pendientes = valores.notna() & (valores != '')
+    for formato in formatos:
+        if not pendientes.any():
+            break
+        resultado.loc[pendientes] = pd.to_datetime(valores[pendientes], format=formato, errors='coerce')
+        pendientes = pendientes & resultado.isna()
+    return resultado
+
+def parsear_columna_fechas(columna, formatos, limpiar=None):
+    """
+    Convierte una columna de fechas/horas a datetime64 sin recorrerla fila por fila.
+
+    Cada valor se separa en parte de fecha y parte de hora, y cada parte se reduce a
+    sus valores únicos (pocos días y a lo sumo 86.400 horas distintas). Los únicos se
+    interpretan en bloque con parsear_en_cascada y el resultado se reparte a todas las
+    filas con sus códigos. Las filas que quedan sin interpretar se intentan al final
+    con parseo automático.
+    Output: Serie datetime64 (NaT cuando no se puede interpretar)
+    """
+    if pd.api.types.is_datetime64_any_dtype(columna):
+        return columna
+
+    texto = columna.astype('string').str.strip()
+    partes = texto.str.partition(' ')
+    codigos_fecha, fechas = pd.factorize(partes[0])
+    codigos_hora, horas = pd.factorize(partes[2])
+
+    formatos_fecha = list(dict.fromkeys(f.split(' ', 1)[0] for f in formatos))
+    formatos_hora = list(dict.fromkeys(f.split(' ', 1)[1] for f in formatos if ' ' in f))
+
+    horas = pd.Series(horas, dtype='string').str.strip()
+    if limpiar is not None:
+        horas = limpiar(horas)
+    fechas = parsear_en_cascada(pd.Series(fechas, dtype='string'), formatos_fecha)
+    horas = parsear_en_cascada(horas, formatos_hora)
+
+    # El código -1 (valor nulo) apunta al NaT agregado al final
+    dias = np.append(fechas.to_numpy(), np.datetime64('NaT', 'ns'))
+    desfases = np.append((horas - horas.dt.normalize()).to_numpy(), np.timedelta64('NaT', 'ns'))
+    momentos = pd.Series(dias[codigos_fecha] + desfases[codigos_hora], index=columna.index)
+
+    pendientes = momentos.isna() & texto.notna() & (texto != '')
+    if pendientes.any():
+        # Último intento con parseo automático (solo filas aún sin interpretar)
+        restantes = texto[pendientes]
+        if limpiar is not None:
+            restantes = limpiar(restantes)
+        momentos.loc[pendientes] = pd.to_datetime(
+            restantes, format='mixed', errors='coerce'
+        )
+
+    return momentos
+
+def procesar_fechas_accesspark(columna):
+    """
+    Procesa la columna check_in de ACCESSPARK
+    Input: '2025-02-27 14:23:00.000'
+    Output: datetime64 2025-02-27 14:23:00
+    """
+    return parsear_columna_fechas(columna, FORMATOS_ACCESSPARK)
+
+def procesar_fechas_gopass(columna):
+    """
+    Procesa la columna Fecha de entrada de GOPASS
+    Input: '28/10/2025  2:57:50 p. m.'
+    Output: datetime64 2025-10-28 14:57:50
+    """
+    return parsear_columna_fechas(columna, FORMATOS_GOPASS, limpiar=limpiar_am_pm)
+
+def normalizar_placas(placas):
+    """Normaliza una columna de placas: sin espacios y en mayúsculas (vacías quedan como NaN)"""
+    placas = placas.astype('string').str.strip().str.upper().str.replace(' ', '', regex=False)
+    return placas.mask(placas == '')
+
+def codificar_placas(*normalizadas):
+    """
+    Convierte varias columnas de placas ya normalizadas (ver normalizar_placas; texto
+    o categóricas) en categóricas con un mismo catálogo, de modo que el código entero
+    de una placa es igual en todas las fuentes. Las placas vacías quedan como NaN (código -1).
+    """
+    # Las categóricas aportan sus categorías sin recorrer las filas
+    valores = [
+        pd.Index(placas.cat.categories if isinstance(placas.dtype, pd.CategoricalDtype) else placas.dropna().unique())
+        for placas in normalizadas
+    ]
+    catalogo = pd.CategoricalDtype(valores[0].append(valores[1:]).unique())
+    return [placas.astype(catalogo) for placas in normalizadas]
+
+def segundos_absolutos(momentos):
+    """Convierte una Serie datetime64 en segundos absolutos int64 (NaT queda como INSTANTE_NULO)"""
+    return pd.Series(momentos).to_numpy(dtype='datetime64[ns]').astype('datetime64[s]').astype(np.int64)
+
+def ventana_en_segundos(minutos_tolerancia):
+    """
+    Ventana (desde, hasta) en segundos enteros para GOPASS menos ACCESSPARK
+    minutos_tolerancia: número (±tolerancia) o par (desde, hasta) en minutos;
+    admite fracciones de minuto (0.5 = 30 segundos)
+    """
+    if np.ndim(minutos_tolerancia) == 0:
+        desde, hasta = -minutos_tolerancia, minutos_tolerancia
+    else:
+        desde, hasta = minutos_tolerancia
+    desde, hasta = int(round(desde * 60)), int(round(hasta * 60))
+    if desde > hasta:
+        raise ValueError(f"Ventana de coincidencia inválida: desde ({desde} s) es mayor que hasta ({hasta} s)")
+    return desde, hasta
+
+def formatear_instantes(momentos):
+    """
+    Retorna (fechas 'DD/MM/YYYY', horas 'HH:MM:SS') de una Serie datetime64.
+    Se formatean solo los días y las horas del día distintos (strftime es lento
+    fila por fila) y se expanden con los códigos de factorize; NaT queda como NaN.
+    """
+    dias = momentos.dt.floor('D')
+    codigos_dia, dias_unicos = pd.factorize(dias)
+    codigos_hora, horas_unicas = pd.factorize(momentos - dias)
+    
+    textos_dia = np.append(dias_unicos.strftime('%d/%m/%Y').to_numpy(dtype=object), np.nan)
+    textos_hora = np.append((pd.Timestamp(0) + horas_unicas).strftime('%H:%M:%S').to_numpy(dtype=object), np.nan)
+    return (
+        pd.Series(textos_dia[codigos_dia], index=momentos.index, dtype='string'),
+        pd.Series(textos_hora[codigos_hora], index=momentos.index, dtype='string'),
+    )
+
+def crear_llaves(placas, fechas, horas):
+    """Crea en bloque las llaves 'PLACA|DD/MM/YYYY|HH:MM:SS' (NaN si falta algún componente)"""
+    return placas.astype('string').str.cat([fechas, horas], sep='|')
+
+# Procesador de fechas de cada fuente
+PROCESADORES_FECHAS = {
+    'ACCESSPARK': procesar_fechas_accesspark,
+    'GOPASS': procesar_fechas_gopass,
+}
+
+# ========================================
+# COINCIDENCIAS
+# ========================================
+
+def ordenar_registros(codigos, segundos):
+    """
+    Posiciones de los registros válidos (placa e instante no nulos) ordenadas por placa
+    y segundo. El orden no depende de la ventana, así que se calcula una sola vez
+    (ver indexar_coincidencias) y se reutiliza al cambiarla.
+    """
+    codigos = np.asarray(codigos)
+    segundos = np.asarray(segundos, dtype=np.int64)
+    posiciones = np.flatnonzero((codigos >= 0) & (segundos != INSTANTE_NULO))
+    if len(posiciones) == 0:
+        return posiciones
+    segundos = segundos[posiciones]
+    base = segundos.min()
+    ancho = int(segundos.max() - base) + 1
+    llaves = codigos[posiciones].astype(np.int64) * ancho + (segundos - base)
+    return posiciones[np.argsort(llaves, kind='stable')]
+
+def buscar_coincidencias(codigos_origen, segundos_origen, codigos_destino, segundos_destino,
+                         ventana=(-TOLERANCIA_MINUTOS * 60, TOLERANCIA_MINUTOS * 60), orden_destino=None):
+    """
+    Indica para cada registro de origen si existe algún registro de destino con la
+    misma placa y destino - origen dentro de ventana = (desde, hasta) segundos.
+
+    Recibe los códigos enteros de placa (ver codificar_placas) y los segundos absolutos
+    (ver segundos_absolutos) de cada lado. Los registros de destino se agrupan por placa
+    y se ordenan por segundo en un único arreglo int64 (orden_destino, ver
+    ordenar_registros, se calcula si no se entrega); cada consulta es una búsqueda
+    binaria, así que la memoria es O(filas) y el costo no depende del ancho de la ventana.
+    Retorna un arreglo booleano alineado con el origen.
+    """
+    codigos_origen = np.asarray(codigos_origen)
+    codigos_destino = np.asarray(codigos_destino)
+    segundos_origen = np.asarray(segundos_origen, dtype=np.int64)
+    segundos_destino = np.asarray(segundos_destino, dtype=np.int64)
+    if orden_destino is None:
+        orden_destino = ordenar_registros(codigos_destino, segundos_destino)
+
+    encontrado = np.zeros(len(codigos_origen), dtype=bool)
+    validos_origen = (codigos_origen >= 0) & (segundos_origen != INSTANTE_NULO)
+    if not validos_origen.any() or len(orden_destino) == 0:
+        return encontrado
+
+    desde, hasta = ventana
+    segundos_origen = segundos_origen[validos_origen]
+    segundos_destino = segundos_destino[orden_destino]
+
+    # Llave compuesta placa/segundo: cada placa ocupa un tramo de 'ancho' posiciones,
+    # suficiente para que la ventana de una placa nunca invada el tramo de otra
+    base = min(segundos_origen.min(), segundos_destino.min())
+    tope = max(segundos_origen.max(), segundos_destino.max())
+    margen = max(abs(desde), abs(hasta))
+    ancho = int(tope - base) + 2 * margen + 1
+
+    # Ya quedan ordenadas: el orden por placa y segundo no cambia con el ancho
+    llaves_destino = codigos_destino[orden_destino].astype(np.int64) * ancho + (segundos_destino - base + margen)
+    inicio = codigos_origen[validos_origen].astype(np.int64) * ancho + (segundos_origen - base + margen + desde)
+    fin = inicio + (hasta - desde)
+
+    posiciones = np.searchsorted(llaves_destino, inicio, side='left')
+    dentro = posiciones < len(llaves_destino)
+    siguiente = llaves_destino[np.minimum(posiciones, len(llaves_destino) - 1)]
+    encontrado[validos_origen] = dentro & (siguiente <= fin)
+
+    return encontrado
+
+def emparejar_coincidencias(codigos_accesspark, segundos_accesspark, codigos_gopass, segundos_gopass,
+                            ventana=(-TOLERANCIA_MINUTOS * 60, TOLERANCIA_MINUTOS * 60),
+                            orden_accesspark=None, orden_gopass=None):
+    """
+    Asigna a cada registro como máximo una contraparte de la otra fuente, con la misma
+    placa y GOPASS - ACCESSPARK dentro de ventana = (desde, hasta) segundos, emparejando
+    primero los más cercanos en el tiempo (a igual distancia, el más temprano). Si la
+    ventana no contiene el cero, la cercanía se mide hasta su borde más próximo.
+
+    Ambas fuentes se ordenan juntas por la llave compuesta placa/segundo. En cada ronda
+    cada registro libre elige su contraparte libre más cercana (la anterior o la
+    siguiente del otro lado en el orden) y se emparejan las elecciones mutuas; esos
+    pares son los que tomaría el emparejamiento voraz por cercanía. Los registros sin
+    contraparte posible salen de la ronda siguiente. Cada ronda es lineal sobre los
+    registros que siguen libres; solo se repite mientras haya cadenas de cobros
+    alternados de la misma placa. Con orden_accesspark y orden_gopass (ver
+    ordenar_registros) el orden conjunto es una mezcla de dos tramos ya ordenados.
+    Retorna (pareja_accesspark, pareja_gopass): la posición de la contraparte en la otra
+    fuente, o -1 si no tiene.
+    """
+    codigos_accesspark = np.asarray(codigos_accesspark)
+    codigos_gopass = np.asarray(codigos_gopass)
+    segundos_accesspark = np.asarray(segundos_accesspark, dtype=np.int64)
+    segundos_gopass = np.asarray(segundos_gopass, dtype=np.int64)
+
+    pareja_accesspark = np.full(len(codigos_accesspark), -1, dtype=np.int64)
+    pareja_gopass = np.full(len(codigos_gopass), -1, dtype=np.int64)
+    if orden_accesspark is None:
+        orden_accesspark = ordenar_registros(codigos_accesspark, segundos_accesspark)
+    if orden_gopass is None:
+        orden_gopass = ordenar_registros(codigos_gopass, segundos_gopass)
+    if len(orden_accesspark) == 0 or len(orden_gopass) == 0:
+        return pareja_accesspark, pareja_gopass
+
+    # Ventana sin el cero (p. ej. de 5 a 15 minutos después): se corre GOPASS hasta el
+    # borde más cercano para que la ventana lo contenga
+    desde, hasta = ventana
+    desplazamiento = max(desde, 0) + min(hasta, 0)
+    desde, hasta = desde - desplazamiento, hasta - desplazamiento
+
+    codigos = np.concatenate([codigos_accesspark[orden_accesspark], codigos_gopass[orden_gopass]])
+    segundos = np.concatenate([
+        segundos_accesspark[orden_accesspark], segundos_gopass[orden_gopass] - desplazamiento
+    ])
+    es_gopass = np.repeat([False, True], [len(orden_accesspark), len(orden_gopass)])
+    posiciones = np.concatenate([orden_accesspark, orden_gopass])
+
+    # Llave compuesta placa/segundo: registros de placas distintas quedan siempre fuera
+    # de la ventana, así que nunca se eligen entre sí
+    base = segundos.min()
+    ancho = int(segundos.max() - base) + max(-desde, hasta) + 1
+    llaves = codigos.astype(np.int64) * ancho + (segundos - base)
+    orden = np.argsort(llaves, kind='stable')
+    llaves, es_gopass, posiciones = llaves[orden], es_gopass[orden], posiciones[orden]
+
+    libres = np.arange(len(llaves))
+    sin_contraparte = np.iinfo(np.int64).max
+    # Distancia máxima hacia atrás y hacia adelante en el tiempo según el lado: un
+    # cobro GOPASS puede ir hasta 'hasta' después de su ingreso y hasta '-desde' antes
+    limite_anterior_gopass, limite_siguiente_gopass = hasta, -desde
+    limite_anterior_accesspark, limite_siguiente_accesspark = -desde, hasta
+    while len(libres):
+        llave = llaves[libres]
+        lado = es_gopass[libres]
+        n = len(libres)
+        indices = np.arange(n)
+
+        # Contraparte anterior y siguiente del otro lado en el orden (-1 / n si no hay)
+        ultimo_gopass = np.maximum.accumulate(np.where(lado, indices, -1))
+        ultimo_accesspark = np.maximum.accumulate(np.where(lado, -1, indices))
+        proximo_gopass = np.minimum.accumulate(np.where(lado, indices, n)[::-1])[::-1]
+        proximo_accesspark = np.minimum.accumulate(np.where(lado, n, indices)[::-1])[::-1]
+        anterior = np.where(lado, ultimo_accesspark, ultimo_gopass)
+        siguiente = np.where(lado, proximo_accesspark, proximo_gopass)
+
+        distancia_anterior = np.where(anterior >= 0, llave - llave[np.maximum(anterior, 0)], sin_contraparte)
+        distancia_siguiente = np.where(siguiente < n, llave[np.minimum(siguiente, n - 1)] - llave, sin_contraparte)
+        limite_anterior = np.where(lado, limite_anterior_gopass, limite_anterior_accesspark)
+        limite_siguiente = np.where(lado, limite_siguiente_gopass, limite_siguiente_accesspark)
+        distancia_anterior[distancia_anterior > limite_anterior] = sin_contraparte
+        distancia_siguiente[distancia_siguiente > limite_siguiente] = sin_contraparte
+        elegida = np.where(distancia_anterior <= distancia_siguiente, anterior, siguiente)
+        con_contraparte = np.minimum(distancia_anterior, distancia_siguiente) < sin_contraparte
+
+        mutua = con_contraparte & (elegida[np.clip(elegida, 0, n - 1)] == indices)
+        accesspark = indices[mutua & ~lado]
+        if len(accesspark) == 0:
+            break
+        gopass = elegida[accesspark]
+        pareja_accesspark[posiciones[libres[accesspark]]] = posiciones[libres[gopass]]
+        pareja_gopass[posiciones[libres[gopass]]] = posiciones[libres[accesspark]]
+
+        libres = libres[con_contraparte & ~mutua]
+
+    return pareja_accesspark, pareja_gopass
+
+def indexar_coincidencias(df_accesspark, df_gopass):
+    """
+    Calcula lo que la búsqueda de coincidencias necesita de los DataFrames preparados
+    y no depende de la ventana: códigos de placa con un catálogo común (placas), segundos
+    absolutos y el orden por placa y segundo de cada fuente. Se puede guardar para
+    repetir la búsqueda con otras ventanas sin volver a calcularlo.
+    """
+    placas_accesspark, placas_gopass = codificar_placas(
+        df_accesspark['placa_normalizada'], df_gopass['placa_normalizada']
+    )
+    indice = {
+        'placas': placas_accesspark.cat.categories,
+        'codigos_accesspark': placas_accesspark.cat.codes.to_numpy(),
+        'codigos_gopass': placas_gopass.cat.codes.to_numpy(),
+        'segundos_accesspark': segundos_absolutos(df_accesspark['momento_entrada']),
+        'segundos_gopass': segundos_absolutos(df_gopass['momento_entrada']),
+    }
+    indice['orden_accesspark'] = ordenar_registros(indice['codigos_accesspark'], indice['segundos_accesspark'])
+    indice['orden_gopass'] = ordenar_registros(indice['codigos_gopass'], indice['segundos_gopass'])
+    return indice
+
+def procesos_coincidencias(indice, max_procesos=None):
+    """
+    Procesos para buscar coincidencias con ese índice: 1 (proceso principal) si hay
+    menos de FILAS_MINIMAS_PARALELO filas válidas o un solo núcleo
+    """
+    filas = len(indice['orden_accesspark']) + len(indice['orden_gopass'])
+    if filas < FILAS_MINIMAS_PARALELO:
+        return 1
+    return max(1, max_procesos or os.cpu_count() or 1)
+
+def dividir_en_tramos(codigos_accesspark, codigos_gopass, n_tramos):
+    """
+    Divide los registros válidos de ambas fuentes, con sus códigos de placa ya en el
+    orden de ordenar_registros, en hasta n_tramos rangos contiguos de placas con una
+    cantidad de filas parecida. Una placa nunca queda repartida entre dos tramos, así
+    que cada tramo se puede validar por separado. Se omiten los tramos en los que
+    alguna fuente no tiene registros (no pueden tener coincidencias).
+    Retorna una lista de (inicio_accesspark, fin_accesspark, inicio_gopass, fin_gopass)
+    """
+    n_placas = int(max(codigos_accesspark[-1], codigos_gopass[-1])) + 1
+    acumulado = np.cumsum(
+        np.bincount(codigos_accesspark, minlength=n_placas) + np.bincount(codigos_gopass, minlength=n_placas)
+    )
+    # Cada tramo termina en la placa con la que se alcanza su fracción de las filas
+    fracciones = acumulado[-1] * np.arange(1, n_tramos) / n_tramos
+    limites = np.unique(np.concatenate([[0], np.searchsorted(acumulado, fracciones) + 1, [n_placas]]))
+
+    cortes_accesspark = np.searchsorted(codigos_accesspark, limites)
+    cortes_gopass = np.searchsorted(codigos_gopass, limites)
+    return [
+        (int(cortes_accesspark[i]), int(cortes_accesspark[i + 1]), int(cortes_gopass[i]), int(cortes_gopass[i + 1]))
+        for i in range(len(limites) - 1)
+        if cortes_accesspark[i] < cortes_accesspark[i + 1] and cortes_gopass[i] < cortes_gopass[i + 1]
+    ]
+
+def coincidir_tramo(codigos_accesspark, segundos_accesspark, codigos_gopass, segundos_gopass, ventana, modo):
+    """
+    Busca las coincidencias de un tramo de placas (ver coincidir_en_paralelo). Se ejecuta
+    en un proceso del pool: recibe solo los códigos y segundos de cada fuente, ya
+    ordenados por placa y segundo, y retorna el resultado con posiciones del tramo:
+    (pareja_accesspark, pareja_gopass) en modo 'emparejamiento' o
+    (encontradas_accesspark, encontradas_gopass) en modo 'existencia'
+    """
+    orden_accesspark = np.arange(len(codigos_accesspark))
+    orden_gopass = np.arange(len(codigos_gopass))
+    if modo == 'emparejamiento':
+        return emparejar_coincidencias(
+            codigos_accesspark, segundos_accesspark, codigos_gopass, segundos_gopass,
+            ventana, orden_accesspark, orden_gopass
+        )
+    desde, hasta = ventana
+    return (
+        buscar_coincidencias(
+            codigos_accesspark, segundos_accesspark, codigos_gopass, segundos_gopass, (desde, hasta), orden_gopass
+        ),
+        buscar_coincidencias(
+            codigos_gopass, segundos_gopass, codigos_accesspark, segundos_accesspark, (-hasta, -desde), orden_accesspark
+        ),
+    )
+
+# Pools de coincidir_en_paralelo por cantidad de procesos (ver obtener_pool_coincidencias)
+_pools_coincidencias = {}
+_candado_pools = threading.Lock()
+
+def obtener_pool_coincidencias(procesos):
+    """
+    Pool de procesos de coincidir_en_paralelo. Arrancar procesos 'spawn' cuesta unos
+    segundos (cada uno vuelve a importar pandas), así que el pool se crea una sola vez
+    y se reutiliza entre validaciones.
+    """
+    with _candado_pools:
+        if procesos not in _pools_coincidencias:
+            # 'spawn' evita heredar los hilos del servidor de Streamlit en los procesos hijos
+            contexto = multiprocessing.get_context('spawn')
+            _pools_coincidencias[procesos] = ProcessPoolExecutor(max_workers=procesos, mp_context=contexto)
+        return _pools_coincidencias[procesos]
+
+def descartar_pool_coincidencias(procesos):
+    """Cierra el pool de coincidencias de esa cantidad de procesos; el siguiente uso crea otro"""
+    with _candado_pools:
+        pool = _pools_coincidencias.pop(procesos, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def coincidir_en_paralelo(indice, ventana, modo, procesos):
+    """
+    Busca coincidencias (ver coincidir_tramo) repartiendo el trabajo en un pool de
+    procesos. Como registros de placas distintas nunca coinciden, los registros válidos
+    ordenados por placa y segundo (ver indexar_coincidencias) se cortan en tramos de
+    placas (ver dividir_en_tramos) y cada proceso recibe solo arreglos compactos de
+    códigos y segundos, nunca DataFrames. Los resultados de cada tramo se devuelven a
+    las posiciones originales de cada fuente, así que son idénticos a los de un solo
+    proceso.
+    Retorna lo mismo que emparejar_coincidencias o que las dos búsquedas de
+    marcar_coincidencias, alineado con las filas de cada fuente.
+    """
+    orden_accesspark, orden_gopass = indice['orden_accesspark'], indice['orden_gopass']
+    if modo == 'emparejamiento':
+        resultado_accesspark = np.full(len(indice['codigos_accesspark']), -1, dtype=np.int64)
+        resultado_gopass = np.full(len(indice['codigos_gopass']), -1, dtype=np.int64)
+    else:
+        resultado_accesspark = np.zeros(len(indice['codigos_accesspark']), dtype=bool)
+        resultado_gopass = np.zeros(len(indice['codigos_gopass']), dtype=bool)
+    if len(orden_accesspark) == 0 or len(orden_gopass) == 0:
+        return resultado_accesspark, resultado_gopass
+
+    # Copias contiguas ya ordenadas: cada tramo es una rebanada que se envía tal cual
+    codigos_accesspark = indice['codigos_accesspark'][orden_accesspark]
+    codigos_gopass = indice['codigos_gopass'][orden_gopass]
+    segundos_accesspark = indice['segundos_accesspark'][orden_accesspark]
+    segundos_gopass = indice['segundos_gopass'][orden_gopass]
+    tramos = dividir_en_tramos(codigos_accesspark, codigos_gopass, procesos * TRAMOS_POR_PROCESO)
+
+    pool = obtener_pool_coincidencias(procesos)
+    try:
+        futuros = {
+            pool.submit(
+                coincidir_tramo,
+                codigos_accesspark[inicio_a:fin_a], segundos_accesspark[inicio_a:fin_a],
+                codigos_gopass[inicio_g:fin_g], segundos_gopass[inicio_g:fin_g],
+                ventana, modo
+            ): (inicio_a, fin_a, inicio_g, fin_g)
+            for inicio_a, fin_a, inicio_g, fin_g in tramos
+        }
+        for futuro in as_completed(futuros):
+            inicio_a, fin_a, inicio_g, fin_g = futuros[futuro]
+            tramo_accesspark, tramo_gopass = futuro.result()
+            posiciones_accesspark = orden_accesspark[inicio_a:fin_a]
+            posiciones_gopass = orden_gopass[inicio_g:fin_g]
+            if modo == 'emparejamiento':
+                # La pareja viene como posición dentro del tramo de la otra fuente
+                resultado_accesspark[posiciones_accesspark] = np.where(
+                    tramo_accesspark >= 0, posiciones_gopass[tramo_accesspark], -1
+                )
+                resultado_gopass[posiciones_gopass] = np.where(
+                    tramo_gopass >= 0, posiciones_accesspark[tramo_gopass], -1
+                )
+            else:
+                resultado_accesspark[posiciones_accesspark] = tramo_accesspark
+                resultado_gopass[posiciones_gopass] = tramo_gopass
+    except BrokenProcessPool:
+        # Un proceso murió (p. ej. sin memoria): la próxima validación arranca otro pool
+        descartar_pool_coincidencias(procesos)
+        raise
+    return resultado_accesspark, resultado_gopass
+
+def emparejar_registros(df_accesspark, df_gopass, minutos_tolerancia=TOLERANCIA_MINUTOS, indice=None,
+                        max_procesos=None):
+    """
+    Empareja uno a uno los registros de ACCESSPARK y GOPASS preparados
+    (ver emparejar_coincidencias). indice: resultado de indexar_coincidencias, si ya se tiene
+    max_procesos: con muchas filas se reparte en procesos (ver coincidir_en_paralelo)
+    Retorna (pareja_accesspark, pareja_gopass) con posiciones de la contraparte o -1
+    """
+    if indice is None:
+        indice = indexar_coincidencias(df_accesspark, df_gopass)
+    ventana = ventana_en_segundos(minutos_tolerancia)
+    procesos = procesos_coincidencias(indice, max_procesos)
+    if procesos > 1:
+        return coincidir_en_paralelo(indice, ventana, 'emparejamiento', procesos)
+    return emparejar_coincidencias(
+        indice['codigos_accesspark'], indice['segundos_accesspark'],
+        indice['codigos_gopass'], indice['segundos_gopass'],
+        ventana, indice['orden_accesspark'], indice['orden_gopass']
+    )
+
+def marcar_coincidencias(df_accesspark, df_gopass, minutos_tolerancia=TOLERANCIA_MINUTOS, indice=None,
+                         max_procesos=None):
+    """
+    Busca contraparte para cada registro de ACCESSPARK y GOPASS preparados
+    (momento_entrada y placa_normalizada, ver preparar_archivo).
+    indice: resultado de indexar_coincidencias, si ya se tiene
+    max_procesos: con muchas filas se reparte en procesos (ver coincidir_en_paralelo)
+    Retorna (encontradas_accesspark, encontradas_gopass) como arreglos booleanos
+    """
+    if indice is None:
+        indice = indexar_coincidencias(df_accesspark, df_gopass)
+    desde, hasta = ventana_en_segundos(minutos_tolerancia)
+    procesos = procesos_coincidencias(indice, max_procesos)
+    if procesos > 1:
+        return coincidir_en_paralelo(indice, (desde, hasta), 'existencia', procesos)
+
+    encontradas_accesspark = buscar_coincidencias(
+        indice['codigos_accesspark'], indice['segundos_accesspark'],
+        indice['codigos_gopass'], indice['segundos_gopass'],
+        (desde, hasta), indice['orden_gopass']
+    )
+    # Visto desde GOPASS la ventana se invierte: ACCESSPARK - GOPASS entre -hasta y -desde
+    encontradas_gopass = buscar_coincidencias(
+        indice['codigos_gopass'], indice['segundos_gopass'],
+        indice['codigos_accesspark'], indice['segundos_accesspark'],
+        (-hasta, -desde), indice['orden_accesspark']
+    )
+    return encontradas_accesspark, encontradas_gopass
+
+def canonizar_placas(placas):
+    """Forma canónica de placas normalizadas: los caracteres confundibles (CONFUSIONES_OCR) se igualan"""
+    canonicas = pd.Series(placas, dtype='str')
+    for canonico, confundibles in CONFUSIONES_OCR.items():
+        canonicas = canonicas.str.replace(f"[{confundibles}]", canonico, regex=True)
+    return canonicas
+
+def variantes_placas(codigos, placas):
+    """
+    Vecindario de borrado de cada placa: su forma canónica (ver canonizar_placas,
+    posicion -1) y las que resultan de quitarle el carácter de cada posicion. Dos placas
+    son aproximadas si tienen la misma forma canónica (solo difieren en caracteres
+    confundibles) o si la forma canónica de una es una variante de borrado de la otra
+    (un carácter sobrante o faltante); cruzar por variante da unos pocos candidatos por
+    placa sin comparar todas contra todas.
+    codigos: códigos de placa (ver codificar_placas); placas: el texto de cada código
+    Retorna un DataFrame con las columnas variante, posicion y codigo
+    """
+    canonicas = canonizar_placas(placas)
+    largos = canonicas.str.len().to_numpy()
+    partes = [pd.DataFrame({'variante': canonicas.to_numpy(), 'posicion': -1, 'codigo': codigos})]
+    for i in range(largos.max(initial=0)):
+        con_caracter = largos > i
+        recortadas = canonicas[con_caracter]
+        partes.append(pd.DataFrame({
+            'variante': (recortadas.str.slice(0, i) + recortadas.str.slice(i + 1)).to_numpy(),
+            'posicion': i,
+            'codigo': codigos[con_caracter],
+        }))
+    return pd.concat(partes, ignore_index=True)
+
+def candidatos_aproximados(indice, libres_accesspark, libres_gopass, ventana):
+    """
+    Pares de registros sin contraparte (posiciones libres_* de cada fuente) con placas
+    distintas pero aproximadas (ver variantes_placas) y GOPASS - ACCESSPARK dentro de
+    ventana = (desde, hasta) segundos. El cruce se hace primero entre placas; después
+    cada registro de ACCESSPARK busca, por cada placa candidata, los registros de GOPASS
+    en la ventana con una búsqueda binaria (como buscar_coincidencias) y se queda con
+    los CANDIDATOS_APROXIMADOS más cercanos a cada lado, así que una placa con muchos
+    registros no multiplica los pares. indice: ver indexar_coincidencias
+    Retorna un DataFrame con accesspark y gopass (posiciones en cada fuente) y distancia
+    (como en emparejar_coincidencias), ordenado del par más cercano al más lejano
+    """
+    registros = {}
+    variantes = {}
+    for fuente, libres in (('accesspark', libres_accesspark), ('gopass', libres_gopass)):
+        codigos = indice[f'codigos_{fuente}'][libres]
+        segundos = indice[f'segundos_{fuente}'][libres]
+        validos = (codigos >= 0) & (segundos != INSTANTE_NULO)
+        registros[fuente] = pd.DataFrame({
+            fuente: libres[validos], f'codigo_{fuente}': codigos[validos], f'segundos_{fuente}': segundos[validos]
+        })
+        unicos = np.unique(codigos[validos])
+        placas = indice['placas'][unicos].to_numpy(dtype=object)
+        largas = np.array([len(placa) >= PLACA_MIN_APROXIMADA for placa in placas], dtype=bool)
+        variantes[fuente] = variantes_placas(unicos[largas], placas[largas])
+    
+    # Placas candidatas (ver variantes_placas), distintas: las iguales ya se compararon.
+    # Misma forma canónica, o un carácter sobrante o faltante; nunca un carácter
+    # cambiado por otro que no sea de su clase
+    completas = {fuente: v[v['posicion'] < 0].drop(columns='posicion') for fuente, v in variantes.items()}
+    borradas = {fuente: v[v['posicion'] >= 0].drop(columns='posicion') for fuente, v in variantes.items()}
+    sufijos = ('_accesspark', '_gopass')
+    pares = pd.concat([
+        completas['accesspark'].merge(completas['gopass'], on='variante', suffixes=sufijos),
+        borradas['accesspark'].merge(completas['gopass'], on='variante', suffixes=sufijos),
+        completas['accesspark'].merge(borradas['gopass'], on='variante', suffixes=sufijos),
+    ])
+    pares = pares[['codigo_accesspark', 'codigo_gopass']].drop_duplicates()
+    pares = pares[pares['codigo_accesspark'] != pares['codigo_gopass']]
+    
+    filas = registros['accesspark'].merge(pares, on='codigo_accesspark')
+    gopass = registros['gopass']
+    if len(filas) == 0 or len(gopass) == 0:
+        return pd.DataFrame({'accesspark': [], 'gopass': [], 'distancia': []}, dtype=np.int64)
+    
+    # Llave compuesta placa/segundo de GOPASS (ver buscar_coincidencias): la ventana de
+    # cada fila es un tramo contiguo de las llaves ordenadas
+    desde, hasta = ventana
+    # Fuera del cero, la cercanía se mide hasta el borde más próximo de la ventana
+    desplazamiento = max(desde, 0) + min(hasta, 0)
+    segundos_accesspark = filas['segundos_accesspark'].to_numpy()
+    segundos_gopass = gopass['segundos_gopass'].to_numpy()
+    base = min(segundos_accesspark.min(), segundos_gopass.min())
+    margen = max(abs(desde), abs(hasta))
+    ancho = int(max(segundos_accesspark.max(), segundos_gopass.max()) - base) + 2 * margen + 1
+    llaves_gopass = gopass['codigo_gopass'].to_numpy().astype(np.int64) * ancho + (segundos_gopass - base + margen)
+    orden = np.argsort(llaves_gopass, kind='stable')
+    llaves_gopass = llaves_gopass[orden]
+    llaves = filas['codigo_gopass'].to_numpy().astype(np.int64) * ancho + (segundos_accesspark - base + margen)
+    inicio = np.searchsorted(llaves_gopass, llaves + desde, side='left')
+    fin = np.searchsorted(llaves_gopass, llaves + hasta, side='right')
+    centro = np.searchsorted(llaves_gopass, llaves + desplazamiento, side='left')
+    
+    # Hasta CANDIDATOS_APROXIMADOS a cada lado del instante de referencia, dentro de la ventana
+    vecinos = centro[:, None] + np.arange(-CANDIDATOS_APROXIMADOS, CANDIDATOS_APROXIMADOS)
+    fila, columna = np.nonzero((vecinos >= inicio[:, None]) & (vecinos < fin[:, None]))
+    elegidos = orden[vecinos[fila, columna]]
+    candidatos = pd.DataFrame({
+        'accesspark': filas['accesspark'].to_numpy()[fila],
+        'segundos_accesspark': segundos_accesspark[fila],
+        'gopass': gopass['gopass'].to_numpy()[elegidos],
+    })
+    diferencia = segundos_gopass[elegidos] - segundos_accesspark[fila]
+    candidatos['distancia'] = np.abs(diferencia - desplazamiento)
+    candidatos = candidatos.drop_duplicates(['accesspark', 'gopass']).sort_values(
+        ['distancia', 'segundos_accesspark', 'accesspark', 'gopass'], kind='stable'
+    )
+    return candidatos[['accesspark', 'gopass', 'distancia']].reset_index(drop=True)
+
+def elegir_parejas(candidatos):
+    """
+    Empareja uno a uno los candidatos ordenados del más cercano al más lejano: en cada
+    ronda se aceptan los pares en que cada registro es la mejor opción libre del otro
+    (como en emparejar_coincidencias) y los ya emparejados salen de la ronda siguiente
+    Retorna los candidatos aceptados
+    """
+    aceptados = [candidatos.iloc[:0]]
+    while len(candidatos):
+        mutuos = candidatos[~candidatos['accesspark'].duplicated() & ~candidatos['gopass'].duplicated()]
+        aceptados.append(mutuos)
+        candidatos = candidatos[
+            ~candidatos['accesspark'].isin(mutuos['accesspark']) & ~candidatos['gopass'].isin(mutuos['gopass'])
+        ]
+    return pd.concat(aceptados)
+
+def coincidir_aproximadas(indice, ventana, modo, libres_accesspark, libres_gopass):
+    """
+    Segunda pasada con placas aproximadas sobre los registros que quedaron sin
+    contraparte (posiciones libres_* de cada fuente, ver candidatos_aproximados).
+    modo 'emparejamiento': uno a uno, los más cercanos primero (ver elegir_parejas)
+    modo 'existencia': a cada registro le basta su candidato más cercano
+    Retorna (contraparte_accesspark, contraparte_gopass): la posición de la contraparte
+    aproximada en la otra fuente, o -1 si no tiene
+    """
+    contraparte_accesspark = np.full(len(indice['codigos_accesspark']), -1, dtype=np.int64)
+    contraparte_gopass = np.full(len(indice['codigos_gopass']), -1, dtype=np.int64)
+    candidatos = candidatos_aproximados(indice, libres_accesspark, libres_gopass, ventana)
+    
+    if modo == 'emparejamiento':
+        parejas = elegir_parejas(candidatos)
+        contraparte_accesspark[parejas['accesspark'].to_numpy()] = parejas['gopass'].to_numpy()
+        contraparte_gopass[parejas['gopass'].to_numpy()] = parejas['accesspark'].to_numpy()
+    else:
+        mejores = candidatos.drop_duplicates('accesspark')
+        contraparte_accesspark[mejores['accesspark'].to_numpy()] = mejores['gopass'].to_numpy()
+        mejores = candidatos.drop_duplicates('gopass')
+        contraparte_gopass[mejores['gopass'].to_numpy()] = mejores['accesspark'].to_numpy()
+    return contraparte_accesspark, contraparte_gopass
+
+def detallar_placas(resultado, contraparte, codigos_contraparte, placas):
+    """Agrega matched_plate: placa de la contraparte aproximada (ver coincidir_aproximadas), o vacía"""
+    codigos = np.where(contraparte >= 0, codigos_contraparte[np.maximum(contraparte, 0)], -1)
+    resultado['matched_plate'] = pd.Categorical.from_codes(codigos, dtype=pd.CategoricalDtype(placas))
+    # Solo las placas usadas: el catálogo completo ocuparía espacio en cada archivo exportado
+    resultado['matched_plate'] = resultado['matched_plate'].cat.remove_unused_categories()
+    return resultado
+
+def marcar_resultado(df, encontradas):
+    """Copia (sin duplicar datos) de una fuente preparada con la columna booleana encontrada"""
+    df = df.copy(deep=False)
+    df['encontrada'] = np.asarray(encontradas, dtype=bool)
+    return df
+
+def codigos_estado(df):
+    """
+    Código compacto (int8) del estado de cada registro de una fuente validada:
+    0 encontrada, 1 no encontrada y 2 encontrada con placa aproximada (matched_plate)
+    """
+    codigos = (~df['encontrada'].to_numpy(dtype=bool)).astype(np.int8)
+    if 'matched_plate' in df.columns:
+        codigos[df['matched_plate'].notna().to_numpy()] = 2
+    return codigos
+
+def etiquetar_resultado(df, fuente):
+    """
+    Retorna una copia lista para exportar de una fuente validada: agrega fecha_entrada,
+    hora_entrada, llave_exacta y Estado_Validacion (a partir de encontrada) y quita las
+    columnas de trabajo. Los textos se crean solo aquí, al exportar.
+    """
+    df = df.copy(deep=False)
+    df['fecha_entrada'], df['hora_entrada'] = formatear_instantes(df['momento_entrada'])
+    df['llave_exacta'] = crear_llaves(df['placa_normalizada'], df['fecha_entrada'], df['hora_entrada'])
+    
+    df['Estado_Validacion'] = pd.Categorical.from_codes(codigos_estado(df), categories=list(ETIQUETAS_ESTADO[fuente]))
+    
+    # Eliminar columnas temporales antes de exportar; el detalle de la pareja va al final
+    detalle = [c for c in COLUMNAS_DETALLE if c in df.columns]
+    columnas = [c for c in df.columns if c not in COLUMNAS_TRABAJO and c != 'encontrada' and c not in detalle]
+    return df[columnas + detalle]
+
+def ids_filas(df):
+    """Identificador de cada fila: fila_original si existe (modo por particiones) o el índice"""
+    if 'fila_original' in df.columns:
+        return df['fila_original'].to_numpy(dtype=np.int64)
+    return np.asarray(df.index, dtype=np.int64)
+
+def detallar_parejas(resultado, pareja, df_contraparte, nanos_contraparte, nanos_propios, signo):
+    """
+    Agrega matched_row_id (id de la fila contraparte, ver ids_filas) y delta_minutes
+    (minutos de GOPASS menos ACCESSPARK; signo indica de qué lado está resultado).
+    nanos_*: instantes en nanosegundos int64; se restan antes de pasar a minutos para
+    no perder precisión con valores del orden de la fecha actual
+    """
+    con_pareja = pareja >= 0
+    ids = pd.array(np.zeros(len(pareja), dtype=np.int64), dtype='Int64')
+    delta = np.full(len(pareja), np.nan)
+    if con_pareja.any():
+        ids[con_pareja] = ids_filas(df_contraparte)[pareja[con_pareja]]
+        delta[con_pareja] = signo * (nanos_contraparte[pareja[con_pareja]] - nanos_propios[con_pareja]) / 6e10
+    ids[~con_pareja] = pd.NA
+    resultado['matched_row_id'] = ids
+    resultado['delta_minutes'] = delta
+    return resultado
+
+def validar_coincidencias(df_accesspark, df_gopass, minutos_tolerancia=TOLERANCIA_MINUTOS, modo=MODO_POR_DEFECTO,
+                          indice=None, max_procesos=None, placas_aproximadas=False):
+    """
+    Marca cada registro de ACCESSPARK y GOPASS según tenga contraparte dentro de la
+    ventana de tolerancia (±minutos o par (desde, hasta), ver TOLERANCIA_MINUTOS).
+    Recibe los DataFrames preparados y retorna copias con la columna booleana
+    encontrada (ver marcar_resultado); las etiquetas de texto se agregan al exportar
+    (ver etiquetar_resultado). indice: resultado de indexar_coincidencias para repetir
+    la validación con otra ventana sin recalcular placas, instantes ni orden.
+    max_procesos: tope de procesos para la búsqueda con muchas filas (ver
+    coincidir_en_paralelo); None usa todos los núcleos.
+    placas_aproximadas: los registros sin contraparte se vuelven a buscar admitiendo
+    errores de lectura en la placa (ver coincidir_aproximadas); los encontrados así
+    llevan en matched_plate la placa de la contraparte.
+
+    modo 'emparejamiento': cada registro tiene como máximo una contraparte, la más
+    cercana (ver emparejar_coincidencias), y se agregan matched_row_id y delta_minutes;
+    así un cobro duplicado queda sin contraparte.
+    modo 'existencia': basta con que exista alguna contraparte en la ventana.
+    """
+    if modo not in MODOS_COINCIDENCIA.values():
+        raise ValueError(f"Modo de coincidencia no soportado: {modo}")
+    if indice is None:
+        indice = indexar_coincidencias(df_accesspark, df_gopass)
+    
+    if modo == 'existencia':
+        encontradas_accesspark, encontradas_gopass = marcar_coincidencias(
+            df_accesspark, df_gopass, minutos_tolerancia, indice, max_procesos
+        )
+        if placas_aproximadas:
+            aproximada_accesspark, aproximada_gopass = coincidir_aproximadas(
+                indice, ventana_en_segundos(minutos_tolerancia), modo,
+                np.flatnonzero(~encontradas_accesspark), np.flatnonzero(~encontradas_gopass)
+            )
+            encontradas_accesspark = encontradas_accesspark | (aproximada_accesspark >= 0)
+            encontradas_gopass = encontradas_gopass | (aproximada_gopass >= 0)
+        resultado_accesspark = marcar_resultado(df_accesspark, encontradas_accesspark)
+        resultado_gopass = marcar_resultado(df_gopass, encontradas_gopass)
+    else:
+        pareja_accesspark, pareja_gopass = emparejar_registros(
+            df_accesspark, df_gopass, minutos_tolerancia, indice, max_procesos
+        )
+        if placas_aproximadas:
+            aproximada_accesspark, aproximada_gopass = coincidir_aproximadas(
+                indice, ventana_en_segundos(minutos_tolerancia), modo,
+                np.flatnonzero(pareja_accesspark < 0), np.flatnonzero(pareja_gopass < 0)
+            )
+            pareja_accesspark = np.maximum(pareja_accesspark, aproximada_accesspark)
+            pareja_gopass = np.maximum(pareja_gopass, aproximada_gopass)
+        
+        # Diferencias con precisión completa: se restan los nanosegundos y luego se pasan a minutos
+        momentos_accesspark = df_accesspark['momento_entrada'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        momentos_gopass = df_gopass['momento_entrada'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        
+        resultado_accesspark = detallar_parejas(
+            marcar_resultado(df_accesspark, pareja_accesspark >= 0),
+            pareja_accesspark, df_gopass, momentos_gopass, momentos_accesspark, 1
+        )
+        resultado_gopass = detallar_parejas(
+            marcar_resultado(df_gopass, pareja_gopass >= 0),
+            pareja_gopass, df_accesspark, momentos_accesspark, momentos_gopass, -1
+        )
+    
+    if placas_aproximadas:
+        detallar_placas(resultado_accesspark, aproximada_accesspark, indice['codigos_gopass'], indice['placas'])
+        detallar_placas(resultado_gopass, aproximada_gopass, indice['codigos_accesspark'], indice['placas'])
+    return resultado_accesspark, resultado_gopass
+
+# ========================================
+# CACHÉ DE ARCHIVOS PREPARADOS
+# ========================================
+
+def cache_habilitada():
+    """La caché necesita pyarrow y un tamaño máximo mayor que cero"""
+    return PYARROW_DISPONIBLE and CACHE_MAX_MB > 0
+
+def llave_cache(contenido, fuente, columnas=None):
+    """Llave de caché: hash del contenido más la fuente, las columnas pedidas y la versión"""
+    llave = hashlib.blake2b(contenido, digest_size=20)
+    columnas = '*' if columnas is None else ','.join(sorted(columnas))
+    llave.update(f"|{fuente}|{columnas}|{VERSION_CACHE}".encode('utf-8'))
+    return llave.hexdigest()
+
+def ruta_cache(llave):
+    """Ruta del archivo Parquet de una entrada de la caché"""
+    return os.path.join(DIRECTORIO_CACHE, f"{llave}.parquet")
+
+def leer_cache(llave):
+    """Retorna el DataFrame preparado guardado con esa llave, o None si no está"""
+    if not cache_habilitada():
+        return None
+    ruta = ruta_cache(llave)
+    try:
+        df = pd.read_parquet(ruta)
+        # Marcar el uso para el desalojo por antigüedad (LRU)
+        os.utime(ruta)
+    except Exception:
+        # Entrada ausente, dañada o desalojada por otro proceso
+        return None
+    # Parquet devuelve las categorías de texto como str: se dejan como las de normalizar_placas
+    for columna in df.columns[df.dtypes == 'category']:
+        df[columna] = df[columna].cat.rename_categories(df[columna].cat.categories.astype('string'))
+    return df
+
+def guardar_cache(llave, df):
+    """
+    Guarda un DataFrame preparado; la caché es opcional, así que un fallo se ignora.
+    Las columnas object ya deben estar como texto (ver texto_a_string y
+    preparar_archivo) para que leer_cache devuelva los mismos tipos que una lectura nueva
+    """
+    if not cache_habilitada():
+        return
+    ruta = ruta_cache(llave)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(DIRECTORIO_CACHE, exist_ok=True)
+        texto_a_string(df).to_parquet(temporal, index=False)
+        os.replace(temporal, ruta)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+def podar_cache(max_mb=CACHE_MAX_MB):
+    """Elimina las entradas usadas hace más tiempo hasta que la caché ocupe a lo sumo max_mb"""
+    if not os.path.isdir(DIRECTORIO_CACHE):
+        return
+    entradas = []
+    for nombre in os.listdir(DIRECTORIO_CACHE):
+        if nombre.endswith('.parquet'):
+            ruta = os.path.join(DIRECTORIO_CACHE, nombre)
+            try:
+                estado = os.stat(ruta)
+            except OSError:
+                continue
+            entradas.append((estado.st_mtime, estado.st_size, ruta))
+    
+    total = sum(tamano for _, tamano, _ in entradas)
+    limite = max_mb * 1024 ** 2
+    for _, tamano, ruta in sorted(entradas):
+        if total <= limite:
+            break
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+        total -= tamano
+
+# ========================================
+# LECTURA DE ARCHIVOS
+# ========================================
+
+def detectar_formato_csv(contenido, tamano_muestra=TAMANO_MUESTRA_CSV):
+    """
+    Detecta encoding y separador de un CSV a partir de una muestra del inicio del archivo
+    Retorna (encoding, separador, encabezado); separador es None si no se pudo detectar
+    """
+    muestra = contenido[:tamano_muestra]
+    if len(contenido) > tamano_muestra and b'\n' in muestra:
+        # Cortar en el último salto de línea para no partir un carácter multibyte
+        muestra = muestra[:muestra.rindex(b'\n')]
+    
+    encoding = 'latin-1'
+    for candidato in ['utf-8-sig', 'utf-8', 'cp1252']:
+        try:
+            texto = muestra.decode(candidato)
+            encoding = candidato
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        texto = muestra.decode(encoding)
+    
+    if encoding == 'utf-8-sig' and not muestra.startswith(b'\xef\xbb\xbf'):
+        encoding = 'utf-8'
+    
+    # El separador es el que más se repite en la línea de encabezado
+    encabezado = texto.splitlines()[0] if texto else ''
+    separador = max(SEPARADORES_CSV, key=encabezado.count)
+    if encabezado.count(separador) == 0:
+        return encoding, None, []
+    
+    columnas = next(csv.reader([encabezado], delimiter=separador), [])
+    return encoding, separador, columnas
+
+def tiene_columnas_binarias(df):
+    """Indica si alguna columna quedó como bytes (pyarrow no falla con un encoding incorrecto)"""
+    for columna in df.columns[df.dtypes == object]:
+        valores = df[columna].dropna()
+        if len(valores) and isinstance(valores.iloc[0], bytes):
+            return True
+    return False
+
+def leer_csv(contenido, encoding, separador, usecols):
+    """
+    Lee el CSV en una sola pasada con el motor más rápido disponible (pyarrow o C);
+    con separador None lo detecta el motor de Python
+    Retorna (df, encoding) con el encoding realmente usado: latin-1 si el resto del
+    archivo no se pudo leer con el de la muestra
+    """
+    if PYARROW_DISPONIBLE and separador is not None:
+        try:
+            df = pd.read_csv(
+                io.BytesIO(contenido), sep=separador, encoding=encoding, usecols=usecols, engine='pyarrow'
+            )
+            if not tiene_columnas_binarias(df):
+                return df, encoding
+        except Exception:
+            pass
+    
+    motor = 'python' if separador is None else 'c'
+    try:
+        return pd.read_csv(io.BytesIO(contenido), sep=separador, encoding=encoding, usecols=usecols, engine=motor), encoding
+    except UnicodeDecodeError:
+        # La muestra parecía UTF-8 pero el resto del archivo no lo es
+        return pd.read_csv(
+            io.BytesIO(contenido), sep=separador, encoding='latin-1', usecols=usecols, engine=motor
+        ), 'latin-1'
+
+@contextmanager
+def abrir_hoja_excel(origen, columnas=None):
+    """
+    Abre la primera hoja de un Excel con openpyxl en modo de solo lectura: las filas
+    se recorren sin construir el libro completo. El encabezado se resuelve antes de
+    leer los datos, así que de cada fila solo se copian las celdas pedidas.
+    columnas: nombres (sin espacios alrededor) a leer; None lee todas
+    Entrega (nombres, filas): los nombres de las columnas leídas y un iterador de
+    tuplas con sus valores
+    """
+    workbook = load_workbook(origen, read_only=True, data_only=True)
+    try:
+        filas = workbook.active.iter_rows(values_only=True)
+        encabezado = [str(c).strip() if c is not None else '' for c in next(filas, [])]
+        indices = [i for i, c in enumerate(encabezado) if columnas is None or c in columnas]
+        yield (
+            [encabezado[i] for i in indices],
+            (tuple(fila[i] if i < len(fila) else None for i in indices) for fila in filas)
+        )
+    finally:
+        workbook.close()
+
+def leer_excel(contenido, columnas=None):
+    """
+    Lee la primera hoja de un Excel cargando solo las columnas pedidas (None: todas).
+    Con python-calamine instalado usa su lector nativo; si no, recorre la hoja con
+    abrir_hoja_excel en lugar de pd.read_excel, que convierte todas las celdas.
+    Retorna (df, motor)
+    """
+    if CALAMINE_DISPONIBLE:
+        usecols = None if columnas is None else (lambda c: str(c).strip() in columnas)
+        return pd.read_excel(io.BytesIO(contenido), engine='calamine', usecols=usecols), 'calamine'
+    
+    with abrir_hoja_excel(io.BytesIO(contenido), columnas) as (nombres, filas):
+        filas = list(filas)
+    # Como pd.read_excel: sin las filas vacías del final (celdas con formato pero sin datos)
+    while filas and all(valor is None for valor in filas[-1]):
+        filas.pop()
+    df = pd.DataFrame(filas, columns=nombres, dtype=object).infer_objects()
+    return df, 'openpyxl'
+
+def leer_archivo(nombre, contenido, columnas=None):
+    """
+    Lee un archivo Excel o CSV a partir de su nombre y sus bytes
+    columnas: nombres (sin espacios alrededor) a cargar; None carga todas las columnas
+    Retorna (df, mensaje) donde mensaje describe cómo se leyó el archivo
+    """
+    if nombre.lower().endswith('.csv'):
+        # Detectar encoding y separador con una muestra del inicio
+        encoding, sep, encabezado = detectar_formato_csv(contenido)
+        
+        if sep is not None:
+            usecols = None
+            if columnas is not None:
+                usecols = [c for c in encabezado if c.strip() in columnas] or None
+            df, encoding = leer_csv(contenido, encoding, sep, usecols)
+            mensaje = f"CSV leído con separador '{sep}' y encoding '{encoding}'"
+        else:
+            # Último intento con detección automática
+            df, encoding = leer_csv(contenido, encoding, None, None)
+            mensaje = f"CSV leído con separador detectado automáticamente y encoding '{encoding}'"
+    else:
+        df, motor = leer_excel(contenido, columnas)
+        mensaje = f"Excel leído con {motor}"
+    
+    # Limpiar nombres de columnas
+    df.columns = df.columns.str.strip()
+    return df, mensaje
+
+def columnas_a_cargar(columnas_requeridas, columnas_extra):
+    """Columnas a leer de cada archivo: None (todas) o las requeridas más las extra"""
+    if columnas_extra is None:
+        return None
+    return set(columnas_requeridas) | set(columnas_extra)
+
+def preparar_archivo(nombre, contenido, fuente, columnas=None):
+    """
+    Lee un archivo de ACCESSPARK o GOPASS y agrega sus columnas de trabajo:
+    momento_entrada (datetime64) y placa_normalizada.
+    Se ejecuta en un proceso del pool, por eso no lanza excepciones: los errores
+    quedan en el resultado.
+    Retorna un dict con archivo, df, filas, segundos, mensaje, error, detalle y
+    rendimiento (mediciones de lectura, fechas y placas, ver medir_etapa)
+    """
+    inicio = time.perf_counter()
+    resultado = {
+        'archivo': nombre, 'df': None, 'filas': 0, 'segundos': 0.0,
+        'mensaje': None, 'error': None, 'detalle': None, 'rendimiento': [],
+    }
+    rendimiento = resultado['rendimiento']
+    columna_fecha, columna_placa = COLUMNAS_FUENTE[fuente]
+    
+    try:
+        # Un archivo ya preparado antes se toma de la caché sin leerlo ni parsearlo
+        llave = llave_cache(contenido, fuente, columnas)
+        with medir_etapa(rendimiento, 'lectura', archivo=nombre) as medicion:
+            df = leer_cache(llave)
+            medicion['cache'] = df is not None
+            if df is None:
+                df, resultado['mensaje'] = leer_archivo(nombre, contenido, columnas)
+            medicion['filas'] = len(df)
+        if medicion['cache']:
+            resultado.update(df=df, filas=len(df), mensaje="Leído desde la caché")
+            resultado['segundos'] = time.perf_counter() - inicio
+            return resultado
+        
+        if columna_fecha not in df.columns or columna_placa not in df.columns:
+            resultado['error'] = (
+                f"El archivo de {fuente} debe contener las columnas '{columna_fecha}' y '{columna_placa}'. "
+                f"Columnas actuales: {', '.join(map(str, df.columns))}"
+            )
+        else:
+            with medir_etapa(rendimiento, 'fechas', len(df), archivo=nombre):
+                df['momento_entrada'] = PROCESADORES_FECHAS[fuente](df[columna_fecha])
+            with medir_etapa(rendimiento, 'placas', len(df), archivo=nombre):
+                # Categórica: cada placa distinta se guarda una sola vez
+                df['placa_normalizada'] = normalizar_placas(df[columna_placa]).astype('category')
+            # Las columnas object (texto y números mezclados) quedan como texto, igual que
+            # al leerlas desde la caché (Parquet no guarda columnas mezcladas)
+            df = texto_a_string(df)
+            resultado['df'] = df
+            resultado['filas'] = len(df)
+            guardar_cache(llave, df)
+    except Exception as e:
+        resultado['error'] = f"Error al leer el archivo {nombre}: {str(e)}"
+        resultado['detalle'] = traceback.format_exc()
+    
+    resultado['segundos'] = time.perf_counter() - inicio
+    return resultado
+
+def preparar_archivos(trabajos, max_procesos=None, progreso=None, rendimiento=None):
+    """
+    Prepara varios archivos (ver preparar_archivo) en paralelo en un pool de procesos
+    trabajos: lista de (nombre, contenido, fuente, columnas)
+    Retorna los resultados en el mismo orden de trabajos. Con un solo archivo, un solo
+    núcleo o pocos bytes se leen en el proceso principal para no pagar el arranque del pool.
+    progreso: ver notificar; se informa cada archivo terminado con las filas acumuladas
+    rendimiento: lista a la que se agregan las mediciones de cada archivo (ver medir_etapa)
+    """
+    procesos = min(len(trabajos), max_procesos or os.cpu_count() or 1)
+    total_bytes = sum(len(contenido) for _, contenido, _, _ in trabajos)
+    resultados = [None] * len(trabajos)
+    filas = 0
+    notificar(progreso, 'lectura', 0, len(trabajos))
+    
+    if procesos < 2 or total_bytes < BYTES_MINIMOS_PARALELO:
+        for i, trabajo in enumerate(trabajos):
+            resultados[i] = preparar_archivo(*trabajo)
+            filas += resultados[i]['filas']
+            notificar(progreso, 'lectura', i + 1, len(trabajos), f"{filas:,} filas")
+    else:
+        # 'spawn' evita heredar los hilos del servidor de Streamlit en los procesos hijos
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as pool:
+            futuros = {pool.submit(preparar_archivo, *trabajo): i for i, trabajo in enumerate(trabajos)}
+            for hechos, futuro in enumerate(as_completed(futuros), start=1):
+                resultados[futuros[futuro]] = futuro.result()
+                filas += futuro.result()['filas']
+                notificar(progreso, 'lectura', hechos, len(trabajos), f"{filas:,} filas")
+    
+    if rendimiento is not None:
+        for resultado in resultados:
+            rendimiento.extend(resultado['rendimiento'])
+    podar_cache()
+    return resultados
+
+# ========================================
+# PREPARACIÓN DE BASES
+# ========================================
+
+def armar_trabajos(archivos_accesspark, archivos_gopass, columnas_extra=None):
+    """
+    Arma los trabajos de preparar_archivos a partir de listas de (nombre, contenido)
+    de cada fuente; los de GOPASS van al final
+    """
+    trabajos = [
+        (nombre, contenido, 'ACCESSPARK', columnas_a_cargar(COLUMNAS_ACCESSPARK, columnas_extra))
+        for nombre, contenido in archivos_accesspark
+    ]
+    trabajos.extend(
+        (nombre, contenido, 'GOPASS', columnas_a_cargar(COLUMNAS_GOPASS, columnas_extra))
+        for nombre, contenido in archivos_gopass
+    )
+    return trabajos
+
+def preparar_bases(trabajos, max_procesos=None, progreso=None, rendimiento=None):
+    """
+    Prepara todos los archivos (ver preparar_archivos), une cada fuente una sola vez
+    y calcula su índice de coincidencias (ver indexar_coincidencias).
+    Retorna un dict con resultados (lectura de cada archivo), df_accesspark, df_gopass,
+    indice y error (None, o el mensaje si alguna fuente quedó sin archivos legibles)
+    rendimiento: lista para las mediciones de cada etapa (ver medir_etapa)
+    """
+    resultados = preparar_archivos(trabajos, max_procesos, progreso, rendimiento)
+    bases = {'resultados': resultados, 'df_accesspark': None, 'df_gopass': None, 'indice': None, 'error': None}
+    
+    with medir_etapa(rendimiento, 'indice') as medicion:
+        for fuente in ('ACCESSPARK', 'GOPASS'):
+            dfs = [r['df'] for (_, _, f, _), r in zip(trabajos, resultados) if f == fuente and r['df'] is not None]
+            if not dfs:
+                bases['error'] = f"No se pudo leer ningún archivo de {fuente}"
+                return bases
+            # Unir una sola vez al final
+            bases[f'df_{fuente.lower()}'] = dfs[0] if len(dfs) == 1 else pd.concat(dfs, ignore_index=True)
+        
+        bases['indice'] = indexar_coincidencias(bases['df_accesspark'], bases['df_gopass'])
+        medicion['filas'] = len(bases['df_accesspark']) + len(bases['df_gopass'])
+    return bases
+
+def contar_coincidencias(df_accesspark, df_gopass):
+    """
+    Totales y registros con contraparte de cada fuente validada (columna encontrada);
+    con placas aproximadas, también cuántos de ellos se encontraron así (matched_plate)
+    """
+    resumen = {}
+    for fuente, df in (('ACCESSPARK', df_accesspark), ('GOPASS', df_gopass)):
+        resumen[f'total_{fuente.lower()}'] = len(df)
+        resumen[f'encontradas_{fuente.lower()}'] = int(df['encontrada'].sum())
+        if 'matched_plate' in df.columns:
+            resumen[f'aproximadas_{fuente.lower()}'] = int(df['matched_plate'].notna().sum())
+    return resumen
+
+# ========================================
+# ESTADÍSTICAS
+# ========================================
+
+def resumir_fuente(df, top_placas=TOP_PLACAS_SIN_CONTRAPARTE):
+    """
+    Estadísticas de una fuente validada en una sola pasada vectorizada sobre el código
+    de estado (ver codigos_estado): cada desglose es un conteo (bincount) del estado
+    combinado con el día, la hora o el código de placa, sin textos ni agrupaciones.
+    Retorna un dict pequeño con total, encontradas (incluye las de placa aproximada),
+    aproximadas, no_encontradas, sin_fecha, por_estado (Serie con ESTADOS_RESUMEN),
+    por_dia y por_hora (DataFrames con una columna por estado) y placas_sin_contraparte
+    (placa y registros de las top_placas placas con más registros sin contraparte)
+    """
+    estados = codigos_estado(df)
+    n_estados = len(ESTADOS_RESUMEN)
+    conteo = np.bincount(estados, minlength=n_estados)
+    
+    segundos = segundos_absolutos(df['momento_entrada'])
+    con_fecha = segundos != INSTANTE_NULO
+    segundos, estados_con_fecha = segundos[con_fecha], estados[con_fecha]
+    dias = segundos // 86400
+    primer_dia = dias.min(initial=0)
+    n_dias = int(dias.max(initial=primer_dia) - primer_dia) + 1
+    por_dia = np.bincount(
+        (dias - primer_dia) * n_estados + estados_con_fecha, minlength=n_dias * n_estados
+    ).reshape(n_dias, n_estados)
+    fechas = pd.to_datetime(primer_dia + np.arange(len(por_dia)), unit='D')
+    por_dia = pd.DataFrame(por_dia, index=pd.Index(fechas, name='Fecha'), columns=ESTADOS_RESUMEN)
+    por_hora = np.bincount(
+        segundos // 3600 % 24 * n_estados + estados_con_fecha, minlength=24 * n_estados
+    ).reshape(24, n_estados)
+    por_hora = pd.DataFrame(por_hora, index=pd.RangeIndex(24, name='Hora'), columns=ESTADOS_RESUMEN)
+    
+    placas = df['placa_normalizada'].astype('category')
+    codigos = placas.cat.codes.to_numpy()
+    sin_contraparte = np.bincount(codigos[(estados == 1) & (codigos >= 0)], minlength=len(placas.cat.categories))
+    top = np.argsort(-sin_contraparte, kind='stable')[:top_placas]
+    top = top[sin_contraparte[top] > 0]
+    
+    return {
+        'total': len(df),
+        'encontradas': int(conteo[0] + conteo[2]),
+        'aproximadas': int(conteo[2]),
+        'no_encontradas': int(conteo[1]),
+        'sin_fecha': int((~con_fecha).sum()),
+        'por_estado': pd.Series(conteo, index=ESTADOS_RESUMEN),
+        # Solo los días con registros (una fecha mal parseada no agrega años vacíos)
+        'por_dia': por_dia[por_dia.sum(axis=1) > 0],
+        'por_hora': por_hora,
+        'placas_sin_contraparte': pd.DataFrame({
+            'placa': placas.cat.categories[top].astype(str), 'registros': sin_contraparte[top]
+        }),
+    }
+
+def resumir_validacion(df_accesspark, df_gopass, top_placas=TOP_PLACAS_SIN_CONTRAPARTE):
+    """Estadísticas de ambas fuentes validadas (ver resumir_fuente), por fuente"""
+    return {
+        'ACCESSPARK': resumir_fuente(df_accesspark, top_placas),
+        'GOPASS': resumir_fuente(df_gopass, top_placas),
+    }
+
+def combinar_resumenes(resumenes, top_placas=TOP_PLACAS_SIN_CONTRAPARTE):
+    """
+    Une las estadísticas de varias particiones (ver resumir_validacion). Los conteos se
+    suman; como cada placa queda en una sola partición, las placas sin contraparte
+    de la unión salen de las mejores de cada partición.
+    """
+    combinado = {}
+    for fuente in ('ACCESSPARK', 'GOPASS'):
+        partes = [resumen[fuente] for resumen in resumenes]
+        combinado[fuente] = {
+            clave: sum(parte[clave] for parte in partes)
+            for clave in ('total', 'encontradas', 'aproximadas', 'no_encontradas', 'sin_fecha')
+        }
+        combinado[fuente]['por_dia'] = pd.concat([parte['por_dia'] for parte in partes]).groupby(level=0).sum()
+        combinado[fuente]['por_estado'] = sum(parte['por_estado'] for parte in partes)
+        combinado[fuente]['por_hora'] = sum(parte['por_hora'] for parte in partes)
+        combinado[fuente]['placas_sin_contraparte'] = pd.concat(
+            [parte['placas_sin_contraparte'] for parte in partes], ignore_index=True
+        ).nlargest(top_placas, 'registros', keep='first').reset_index(drop=True)
+    return combinado
+
+# ========================================
+# EXPORTACIÓN
+# ========================================
+
+def aplicar_formato_validacion(workbook, worksheet, df, nombre_columna):
+    """
+    Aplica color verde a encontradas, amarillo a las de placa aproximada y rojo a no
+    encontradas como reglas de formato condicional sobre la columna completa (sin
+    recorrer las celdas una por una)
+    """
+    if nombre_columna not in df.columns or df.empty:
+        return
+    
+    # Colores para el formato condicional
+    verde_fmt = workbook.add_format({'bg_color': '#C6EFCE'})
+    rojo_fmt = workbook.add_format({'bg_color': '#FFC7CE'})
+    amarillo_fmt = workbook.add_format({'bg_color': '#FFEB9C'})
+    
+    col_idx = df.columns.get_loc(nombre_columna)
+    ultima_fila = len(df)
+    
+    # Las primeras reglas tienen prioridad: 'NO encontrada' y 'Placa aproximada
+    # encontrada' también contienen 'encontrada en'
+    worksheet.conditional_format(1, col_idx, ultima_fila, col_idx, {
+        'type': 'text', 'criteria': 'containing', 'value': 'NO encontrada', 'format': rojo_fmt
+    })
+    worksheet.conditional_format(1, col_idx, ultima_fila, col_idx, {
+        'type': 'text', 'criteria': 'containing', 'value': 'aproximada', 'format': amarillo_fmt
+    })
+    worksheet.conditional_format(1, col_idx, ultima_fila, col_idx, {
+        'type': 'text', 'criteria': 'containing', 'value': 'encontrada en', 'format': verde_fmt
+    })
+
+def iterar_filas(df, filas_por_bloque=FILAS_POR_BLOQUE):
+    """Recorre las filas de un DataFrame como tuplas (NaN/NaT como None) por bloques acotados"""
+    for inicio in range(0, len(df), filas_por_bloque):
+        bloque = df.iloc[inicio:inicio + filas_por_bloque].astype(object)
+        bloque = bloque.where(bloque.notna(), None)
+        yield from bloque.itertuples(index=False, name=None)
+
+def escribir_hojas(workbook, df, nombre_hoja, filas_por_hoja=FILAS_MAX_EXCEL, avance=None):
+    """
+    Escribe un DataFrame fila por fila (modo de memoria constante) y lo reparte en
+    hojas nombre_hoja_1, nombre_hoja_2, ... cuando supera el límite de filas de Excel
+    avance: función llamada con la cantidad de filas escritas de cada bloque
+    """
+    n_hojas = max(1, -(-len(df) // filas_por_hoja))
+    columnas = [str(columna) for columna in df.columns]
+    
+    for parte in range(n_hojas):
+        nombre = nombre_hoja if n_hojas == 1 else f"{nombre_hoja}_{parte + 1}"
+        bloque = df.iloc[parte * filas_por_hoja:(parte + 1) * filas_por_hoja]
+        
+        worksheet = workbook.add_worksheet(nombre)
+        worksheet.write_row(0, 0, columnas)
+        for fila, valores in enumerate(iterar_filas(bloque), start=1):
+            worksheet.write_row(fila, 0, valores)
+            if avance is not None and fila % FILAS_POR_BLOQUE == 0:
+                avance(FILAS_POR_BLOQUE)
+        if avance is not None:
+            avance(len(bloque) % FILAS_POR_BLOQUE)
+        
+        aplicar_formato_validacion(workbook, worksheet, bloque, "Estado_Validacion")
+
+def crear_excel_resultado(df_accesspark, df_gopass, progreso=None):
+    """
+    Crea el archivo Excel con las hojas procesadas en una sola pasada y memoria constante
+    progreso: ver notificar; se informan las filas escritas
+    """
+    output = io.BytesIO()
+    total = len(df_accesspark) + len(df_gopass)
+    escritas = [0]
+    
+    def avance(filas):
+        escritas[0] += filas
+        notificar(progreso, 'exportacion', escritas[0], total, f"{escritas[0]:,} de {total:,} filas")
+    
+    workbook = xlsxwriter.Workbook(output, OPCIONES_EXCEL)
+    escribir_hojas(workbook, df_accesspark, "ACCESSPARK_Procesado", avance=avance)
+    escribir_hojas(workbook, df_gopass, "GOPASS_Procesado", avance=avance)
+    workbook.close()
+    
+    return output.getvalue()
+
+def crear_csv_gz(df):
+    """Crea un CSV comprimido con gzip (separador ';', UTF-8 con BOM para Excel)"""
+    output = io.BytesIO()
+    df.to_csv(output, sep=';', index=False, encoding='utf-8-sig', compression='gzip')
+    return output.getvalue()
+
+def texto_a_string(df):
+    """Convierte las columnas object (p. ej. texto y números mezclados) a texto para Parquet"""
+    columnas = df.columns[df.dtypes == object]
+    if len(columnas) == 0:
+        return df
+    return df.astype({columna: 'string' for columna in columnas})
+
+def crear_parquet(df):
+    """Crea un archivo Parquet; las columnas de texto mixto se guardan como texto"""
+    output = io.BytesIO()
+    texto_a_string(df).to_parquet(output, index=False)
+    return output.getvalue()
+
+def fechar_nombre(nombre_archivo, fecha_actual=None):
+    """
+    Agrega la fecha y hora (por defecto, las actuales) al nombre de un archivo de
+    descarga antes de su extensión: validacion_gopass.csv.gz ->
+    validacion_gopass_20251001_093000.csv.gz
+    """
+    fecha_actual = fecha_actual or datetime.now().strftime("%Y%m%d_%H%M%S")
+    base, punto, extension = nombre_archivo.partition('.')
+    return f"{base}_{fecha_actual}{punto}{extension}"
+
+def crear_archivos_descarga(df_accesspark, df_gopass, formato, progreso=None, fechar=True):
+    """
+    Genera los archivos de descarga de las bases validadas en el formato elegido
+    (las etiquetas se crean aquí, ver etiquetar_resultado)
+    Retorna una lista de (nombre_archivo, datos, mime): un único libro para Excel,
+    o un archivo por base para CSV.gz y Parquet
+    progreso: ver notificar
+    fechar: agregar la fecha actual a los nombres (ver fechar_nombre); sin ella, quien
+    guarda los archivos en una caché les pone la fecha al entregarlos
+    """
+    extension, mime = FORMATOS_DESCARGA[formato]
+    fecha_actual = datetime.now().strftime("%Y%m%d_%H%M%S")
+    nombrar = (lambda nombre: fechar_nombre(nombre, fecha_actual)) if fechar else (lambda nombre: nombre)
+    
+    if extension == 'xlsx':
+        datos = crear_excel_resultado(
+            etiquetar_resultado(df_accesspark, 'ACCESSPARK'), etiquetar_resultado(df_gopass, 'GOPASS'), progreso
+        )
+        return [(nombrar("validacion_accesspark.xlsx"), datos, mime)]
+    
+    crear = crear_csv_gz if extension == 'csv.gz' else crear_parquet
+    archivos = []
+    escritos = 0
+    for fuente, df in (('ACCESSPARK', df_accesspark), ('GOPASS', df_gopass)):
+        # Una base etiquetada a la vez
+        datos = crear(etiquetar_resultado(df, fuente))
+        archivos.append((nombrar(f"validacion_{fuente.lower()}.{extension}"), datos, mime))
+        escritos += len(archivos[-1][1])
+        notificar(progreso, 'exportacion', len(archivos), 2, f"{escritos / 1024 ** 2:,.1f} MB escritos")
+    return archivos
+
+# ========================================
+# CONSULTA DE RESULTADOS
+# ========================================
+
+def indexar_consulta(df, fuente):
+    """
+    Índice en memoria de una fuente validada para filtrarla sin recorrer textos ni
+    copiar filas (ver filtrar_consulta): código de estado de cada registro (ver
+    codigos_estado), posiciones ordenadas por momento de entrada (un rango de fechas es
+    una búsqueda binaria), catálogo de placas ordenado con el código de cada registro en
+    ese orden (un prefijo de placa es un rango del catálogo) y delta_minutes si existe.
+    Retorna un dict con el DataFrame, la fuente, esos arreglos y los límites de fechas
+    (primera y ultima, None sin fechas válidas) y de delta_minutes (rango_delta) para
+    armar los filtros.
+    """
+    segundos = segundos_absolutos(df['momento_entrada'])
+    orden = np.argsort(segundos, kind='stable')
+    segundos_ordenados = segundos[orden]
+    con_fecha = segundos_ordenados[segundos_ordenados != INSTANTE_NULO]
+    
+    placas = df['placa_normalizada'].astype('category')
+    placas = placas.cat.set_categories(placas.cat.categories.sort_values())
+    
+    consulta = {
+        'df': df,
+        'fuente': fuente,
+        'estados': codigos_estado(df),
+        'orden': orden,
+        'segundos_ordenados': segundos_ordenados,
+        'placas': np.asarray(placas.cat.categories, dtype=object),
+        'codigos_placa': placas.cat.codes.to_numpy(),
+        'delta': None,
+        'primera': pd.Timestamp(con_fecha[0], unit='s') if len(con_fecha) else None,
+        'ultima': pd.Timestamp(con_fecha[-1], unit='s') if len(con_fecha) else None,
+        'rango_delta': None,
+    }
+    if 'delta_minutes' in df.columns:
+        consulta['delta'] = df['delta_minutes'].to_numpy(dtype=float)
+        if not np.isnan(consulta['delta']).all():
+            consulta['rango_delta'] = (float(np.nanmin(consulta['delta'])), float(np.nanmax(consulta['delta'])))
+    return consulta
+
+def filtrar_consulta(consulta, estados=None, prefijo_placa=None, desde=None, hasta=None,
+                     delta_minimo=None, delta_maximo=None):
+    """
+    Posiciones de los registros de una fuente indexada (ver indexar_consulta) que
+    cumplen todos los filtros indicados (los que son None no se aplican), ordenadas por
+    momento de entrada; los registros sin fecha van al principio.
+    estados: lista de ESTADOS_RESUMEN; prefijo_placa: inicio de la placa normalizada;
+    desde/hasta: instantes (inclusive) del momento de entrada; delta_minimo/delta_maximo:
+    rango de delta_minutes (los registros sin pareja quedan fuera)
+    """
+    orden = consulta['orden']
+    if desde is not None or hasta is not None:
+        segundos = consulta['segundos_ordenados']
+        # Con un rango de fechas los registros sin fecha (INSTANTE_NULO, al principio) quedan fuera
+        inicio = np.searchsorted(segundos, INSTANTE_NULO, side='right')
+        if desde is not None:
+            inicio = max(inicio, np.searchsorted(segundos, pd.Timestamp(desde).value // 10 ** 9, side='left'))
+        fin = len(segundos)
+        if hasta is not None:
+            fin = np.searchsorted(segundos, pd.Timestamp(hasta).value // 10 ** 9, side='right')
+        orden = orden[inicio:max(inicio, fin)]
+    
+    seleccion = np.ones(len(orden), dtype=bool)
+    if estados is not None:
+        permitidos = np.isin(ESTADOS_RESUMEN, estados)
+        seleccion &= permitidos[consulta['estados'][orden]]
+    if prefijo_placa:
+        prefijo = prefijo_placa.strip().upper().replace(' ', '')
+        primera = np.searchsorted(consulta['placas'], prefijo, side='left')
+        # Toda placa que empieza por el prefijo es menor que el prefijo seguido del último carácter
+        ultima = np.searchsorted(consulta['placas'], prefijo + '\U0010ffff', side='left')
+        codigos = consulta['codigos_placa'][orden]
+        seleccion &= (codigos >= primera) & (codigos < ultima)
+    if consulta['delta'] is not None and (delta_minimo is not None or delta_maximo is not None):
+        delta = consulta['delta'][orden]
+        seleccion &= ~np.isnan(delta)
+        if delta_minimo is not None:
+            seleccion &= delta >= delta_minimo
+        if delta_maximo is not None:
+            seleccion &= delta <= delta_maximo
+    return orden[seleccion]
+
+def pagina_consulta(consulta, posiciones, pagina, filas_por_pagina=FILAS_POR_PAGINA):
+    """
+    Registros de una página (desde 0) de las posiciones filtradas (ver
+    filtrar_consulta), etiquetados como al exportar (ver etiquetar_resultado); solo
+    esas filas se convierten a texto
+    """
+    bloque = posiciones[pagina * filas_por_pagina:(pagina + 1) * filas_por_pagina]
+    return etiquetar_resultado(consulta['df'].iloc[bloque], consulta['fuente'])
+
+def crear_archivo_consulta(consulta, posiciones, formato):
+    """
+    Datos del archivo de descarga, en el formato elegido, con solo los registros
+    filtrados de una fuente (ver filtrar_consulta) en su orden original; fila_original
+    conserva el id de cada registro (el que usa matched_row_id de la otra fuente)
+    """
+    extension, _ = FORMATOS_DESCARGA[formato]
+    df = consulta['df'].iloc[np.sort(posiciones)]
+    if 'fila_original' not in df.columns:
+        df = df.assign(fila_original=ids_filas(df))
+    df = etiquetar_resultado(df, consulta['fuente'])
+    
+    if extension == 'xlsx':
+        output = io.BytesIO()
+        workbook = xlsxwriter.Workbook(output, OPCIONES_EXCEL)
+        escribir_hojas(workbook, df, f"{consulta['fuente']}_Filtrado")
+        workbook.close()
+        return output.getvalue()
+    return crear_csv_gz(df) if extension == 'csv.gz' else crear_parquet(df)
+
+# ========================================
+# CONCILIACIÓN EN MEMORIA
+# ========================================
+
+def conciliar_archivos(trabajos, minutos_tolerancia=TOLERANCIA_MINUTOS, modo=MODO_POR_DEFECTO,
+                       formato='Excel (.xlsx)', max_procesos=None, bases=None, progreso=None,
+                       rendimiento=None, placas_aproximadas=False):
+    """
+    Ejecuta la conciliación completa en memoria: prepara las bases (ver preparar_bases;
+    se omite si se reciben bases ya preparadas), valida las coincidencias y genera los
+    archivos de descarga. No depende de Streamlit; sirve para la interfaz, la línea de
+    comandos y los trabajos en segundo plano.
+    Retorna un dict con bases, resumen (ver contar_coincidencias), estadisticas (ver
+    resumir_validacion) y archivos (ver crear_archivos_descarga); si alguna fuente no
+    se pudo leer, bases['error'] tiene el mensaje y no hay resumen ni archivos.
+    rendimiento: lista para las mediciones de cada etapa (ver medir_etapa)
+    placas_aproximadas: segunda pasada con errores de lectura de placa (ver validar_coincidencias)
+    """
+    if bases is None:
+        bases = preparar_bases(trabajos, max_procesos, progreso, rendimiento)
+    conciliacion = {'bases': bases, 'resumen': None, 'estadisticas': None, 'archivos': []}
+    if bases['error']:
+        return conciliacion
+    filas = len(bases['df_accesspark']) + len(bases['df_gopass'])
+    
+    notificar(progreso, 'coincidencias', 0, 1)
+    with medir_etapa(rendimiento, 'coincidencias', filas, modo=modo):
+        df_accesspark, df_gopass = validar_coincidencias(
+            bases['df_accesspark'], bases['df_gopass'], minutos_tolerancia, modo, bases['indice'], max_procesos,
+            placas_aproximadas
+        )
+    with medir_etapa(rendimiento, 'resumen', filas):
+        conciliacion['resumen'] = contar_coincidencias(df_accesspark, df_gopass)
+        conciliacion['estadisticas'] = resumir_validacion(df_accesspark, df_gopass)
+    notificar(progreso, 'coincidencias', 1, 1)
+    
+    with medir_etapa(rendimiento, 'exportacion', filas, formato=formato):
+        conciliacion['archivos'] = crear_archivos_descarga(df_accesspark, df_gopass, formato, progreso)
+    return conciliacion
+
+# ========================================
+# CONCILIACIÓN POR LOTES
+# ========================================
+
+def detallar_grupos(resultado_gopass, inicios, nombres):
+    """
+    En GOPASS validado contra los ingresos de todos los grupos de un lote (ver
+    conciliar_lote), convierte matched_row_id en la fila de la contraparte dentro de su
+    grupo y agrega matched_group con el nombre de ese grupo
+    inicios: primera fila de cada grupo en la base de ACCESSPARK del lote
+    """
+    con_pareja = resultado_gopass['matched_row_id'].notna().to_numpy()
+    filas = resultado_gopass['matched_row_id'].to_numpy(dtype=np.int64, na_value=-1)
+    grupos = np.where(con_pareja, np.searchsorted(inicios, filas, side='right') - 1, -1)
+    ids = pd.array(filas - inicios[np.maximum(grupos, 0)], dtype='Int64')
+    ids[~con_pareja] = pd.NA
+    resultado_gopass['matched_row_id'] = ids
+    resultado_gopass['matched_group'] = pd.Categorical.from_codes(grupos, categories=nombres)
+    return resultado_gopass
+
+def placas_aproximadas_de(resultado, placas):
+    """
+    Código (en el catálogo placas, ver indexar_coincidencias) de la placa de la
+    contraparte aproximada de cada registro validado (ver detallar_placas), o -1
+    """
+    if 'matched_plate' not in resultado.columns:
+        return np.full(len(resultado), -1, dtype=np.int64)
+    categorica = resultado['matched_plate'].cat
+    # El -1 final traduce las filas sin placa aproximada (código -1)
+    mapa = np.append(placas.get_indexer(categorica.categories), -1)
+    return mapa[categorica.codes.to_numpy()]
+
+def encontradas_en_grupo(indice, inicio, fin, ventana, aproximadas_gopass):
+    """
+    Cobros de GOPASS (modo existencia) con contraparte entre los ingresos inicio:fin del
+    lote (ver conciliar_lote): con la misma placa o, si se encontraron con placa
+    aproximada, con esa placa (aproximadas_gopass, ver placas_aproximadas_de) dentro de
+    ventana = (desde, hasta) segundos
+    Retorna un arreglo booleano alineado con GOPASS
+    """
+    desde, hasta = ventana
+    codigos_grupo = indice['codigos_accesspark'][inicio:fin]
+    segundos_grupo = indice['segundos_accesspark'][inicio:fin]
+    # El orden del lote, restringido a las filas del grupo, sigue ordenado por placa y segundo
+    orden = indice['orden_accesspark']
+    orden_grupo = orden[(orden >= inicio) & (orden < fin)] - inicio
+    return np.logical_or.reduce([
+        buscar_coincidencias(
+            codigos, indice['segundos_gopass'], codigos_grupo, segundos_grupo, (-hasta, -desde), orden_grupo
+        )
+        for codigos in (indice['codigos_gopass'], aproximadas_gopass)
+    ])
+
+def conciliar_lote(grupos, archivos_gopass, minutos_tolerancia=TOLERANCIA_MINUTOS, modo=MODO_POR_DEFECTO,
+                   formato='Excel (.xlsx)', columnas_extra=None, max_procesos=None, progreso=None,
+                   rendimiento=None, placas_aproximadas=False, consolidado=False):
+    """
+    Concilia varios grupos de archivos de ACCESSPARK (un sitio, un mes...) contra los
+    mismos archivos de GOPASS leyendo cada archivo una sola vez: todos se preparan en un
+    único pool (ver preparar_archivos), GOPASS se une e indexa una sola vez y los
+    ingresos de todos los grupos se validan juntos en una misma búsqueda (ver
+    validar_coincidencias; con muchas filas se reparte en procesos por tramos de placas).
+    En el modo emparejamiento un cobro de GOPASS paga a lo sumo un ingreso de todo el
+    lote; su matched_group indica el grupo de la contraparte y matched_row_id su fila
+    dentro de ese grupo.
+
+    grupos: lista de (nombre_grupo, [(nombre, contenido), ...]); nombres sin repetir
+    archivos_gopass: lista de (nombre, contenido)
+    consolidado: generar también los archivos del lote completo (ACCESSPARK con la
+    columna grupo y todos los cobros de GOPASS)
+    Retorna un dict con:
+    - resultados: lectura de los archivos de GOPASS
+    - grupos: un dict por grupo con nombre, resultados (lectura de sus archivos), error,
+      resumen (ver contar_coincidencias), estadisticas (ver resumir_validacion) y
+      archivos (ver crear_archivos_descarga, con el nombre del grupo como prefijo). Sus
+      bases son los ingresos del grupo y los cobros de GOPASS con contraparte en ellos
+      (también con placa aproximada) más los cobros sin contraparte de sus placas; un
+      cobro que encontró su contraparte en otro grupo no se incluye ni se cuenta.
+      fila_original es la fila del cobro en GOPASS.
+    - resumen y estadisticas de todo el lote; resumen['gopass_sin_grupo'] cuenta los
+      cobros sin contraparte de placas que no aparecen en ningún grupo
+    - archivos: los del lote completo, si se pidió consolidado
+    - error: None, o el mensaje si no se pudo leer GOPASS o ningún grupo
+    progreso: ver notificar; rendimiento: lista para las mediciones (ver medir_etapa)
+    placas_aproximadas: segunda pasada con errores de lectura de placa (ver validar_coincidencias)
+    """
+    nombres = [nombre for nombre, _ in grupos]
+    if len(set(nombres)) != len(nombres):
+        raise ValueError("Los nombres de los grupos del lote no se pueden repetir")
+    
+    archivos_accesspark = [archivo for _, archivos in grupos for archivo in archivos]
+    trabajos = armar_trabajos(archivos_accesspark, archivos_gopass, columnas_extra)
+    resultados = preparar_archivos(trabajos, max_procesos, progreso, rendimiento)
+    lote = {
+        'resultados': resultados[len(archivos_accesspark):], 'grupos': [],
+        'resumen': None, 'estadisticas': None, 'archivos': [], 'error': None,
+    }
+    
+    with medir_etapa(rendimiento, 'indice', grupos=len(grupos)) as medicion:
+        dfs_accesspark = []
+        inicio = 0
+        for nombre, archivos in grupos:
+            lecturas = resultados[inicio:inicio + len(archivos)]
+            inicio += len(archivos)
+            grupo = {
+                'nombre': nombre, 'resultados': lecturas, 'error': None,
+                'resumen': None, 'estadisticas': None, 'archivos': [],
+            }
+            dfs = [r['df'] for r in lecturas if r['df'] is not None]
+            if dfs:
+                dfs_accesspark.append(dfs[0] if len(dfs) == 1 else pd.concat(dfs, ignore_index=True))
+            else:
+                grupo['error'] = f"No se pudo leer ningún archivo de ACCESSPARK del grupo {nombre}"
+            lote['grupos'].append(grupo)
+        
+        dfs_gopass = [r['df'] for r in lote['resultados'] if r['df'] is not None]
+        if not dfs_gopass:
+            lote['error'] = "No se pudo leer ningún archivo de GOPASS"
+            return lote
+        if not dfs_accesspark:
+            lote['error'] = "No se pudo leer ningún archivo de ACCESSPARK"
+            return lote
+        
+        # Los grupos legibles, uno tras otro: el grupo k ocupa las filas inicios[k]:finales[k]
+        validos = [grupo for grupo in lote['grupos'] if grupo['error'] is None]
+        finales = np.cumsum([len(df) for df in dfs_accesspark])
+        inicios = finales - [len(df) for df in dfs_accesspark]
+        df_accesspark = pd.concat(dfs_accesspark, ignore_index=True)
+        df_gopass = dfs_gopass[0] if len(dfs_gopass) == 1 else pd.concat(dfs_gopass, ignore_index=True)
+        indice = indexar_coincidencias(df_accesspark, df_gopass)
+        medicion['filas'] = filas = len(df_accesspark) + len(df_gopass)
+    
+    notificar(progreso, 'coincidencias', 0, 1)
+    with medir_etapa(rendimiento, 'coincidencias', filas, modo=modo, grupos=len(validos)):
+        resultado_accesspark, resultado_gopass = validar_coincidencias(
+            df_accesspark, df_gopass, minutos_tolerancia, modo, indice, max_procesos, placas_aproximadas
+        )
+        if modo == 'emparejamiento':
+            detallar_grupos(resultado_gopass, inicios, [grupo['nombre'] for grupo in validos])
+    notificar(progreso, 'coincidencias', 1, 1)
+    
+    # Cobros sin contraparte y placa de cada cobro; el último lugar de las marcas por
+    # placa queda en False para los códigos -1 (sin placa)
+    codigos_gopass = indice['codigos_gopass']
+    aproximadas_gopass = placas_aproximadas_de(resultado_gopass, indice['placas'])
+    sin_contraparte = ~resultado_gopass['encontrada'].to_numpy()
+    en_algun_grupo = np.zeros(len(resultado_gopass), dtype=bool)
+    
+    for k, grupo in enumerate(validos):
+        filas_grupo = int(finales[k] - inicios[k])
+        with medir_etapa(rendimiento, 'resumen', filas_grupo, grupo=grupo['nombre']):
+            placas_grupo = np.zeros(len(indice['placas']) + 1, dtype=bool)
+            placas_grupo[indice['codigos_accesspark'][inicios[k]:finales[k]]] = True
+            placas_grupo[-1] = False
+            # Cobros con contraparte en este grupo (en el emparejamiento, la de
+            # matched_group) y cobros sin contraparte de sus placas
+            if modo == 'emparejamiento':
+                propios = resultado_gopass['matched_group'].cat.codes.to_numpy() == k
+            else:
+                propios = encontradas_en_grupo(
+                    indice, inicios[k], finales[k], ventana_en_segundos(minutos_tolerancia), aproximadas_gopass
+                )
+            del_grupo = propios | (sin_contraparte & placas_grupo[codigos_gopass])
+            en_algun_grupo |= del_grupo
+            
+            grupo_accesspark = resultado_accesspark.iloc[inicios[k]:finales[k]].reset_index(drop=True)
+            grupo_gopass = resultado_gopass[del_grupo]
+            grupo_gopass = grupo_gopass.assign(fila_original=grupo_gopass.index.to_numpy(dtype=np.int64))
+            grupo['resumen'] = contar_coincidencias(grupo_accesspark, grupo_gopass)
+            grupo['estadisticas'] = resumir_validacion(grupo_accesspark, grupo_gopass)
+        
+        with medir_etapa(rendimiento, 'exportacion', filas_grupo + len(grupo_gopass), formato=formato,
+                         grupo=grupo['nombre']):
+            grupo['archivos'] = [
+                (f"{grupo['nombre']}_{nombre_archivo}", datos, mime)
+                for nombre_archivo, datos, mime in crear_archivos_descarga(grupo_accesspark, grupo_gopass, formato, progreso)
+            ]
+    
+    with medir_etapa(rendimiento, 'resumen', filas):
+        lote['resumen'] = contar_coincidencias(resultado_accesspark, resultado_gopass)
+        lote['resumen']['grupos'] = len(validos)
+        lote['resumen']['gopass_sin_grupo'] = int((~en_algun_grupo).sum())
+        lote['estadisticas'] = resumir_validacion(resultado_accesspark, resultado_gopass)
+    
+    if consolidado:
+        with medir_etapa(rendimiento, 'exportacion', filas, formato=formato, grupo='lote'):
+            resultado_accesspark['grupo'] = pd.Categorical.from_codes(
+                np.repeat(np.arange(len(validos)), finales - inicios), categories=[grupo['nombre'] for grupo in validos]
+            )
+            lote['archivos'] = [
+                (f"lote_{nombre_archivo}", datos, mime)
+                for nombre_archivo, datos, mime in crear_archivos_descarga(resultado_accesspark, resultado_gopass, formato, progreso)
+            ]
+    return lote
+
+# ========================================
+# CONCILIACIÓN POR PARTICIONES
+# ========================================
+
+def tamano_origen(origen):
+    """Tamaño en bytes de una ruta o de un archivo binario abierto"""
+    if isinstance(origen, (str, os.PathLike)):
+        return os.path.getsize(origen)
+    posicion = origen.tell()
+    origen.seek(0, os.SEEK_END)
+    tamano = origen.tell()
+    origen.seek(posicion)
+    return tamano
+
+def leer_muestra(origen, tamano_muestra=TAMANO_MUESTRA_CSV):
+    """Lee los primeros bytes de una ruta o archivo binario sin consumirlo"""
+    if isinstance(origen, (str, os.PathLike)):
+        with open(origen, 'rb') as f:
+            return f.read(tamano_muestra + 1)
+    origen.seek(0)
+    muestra = origen.read(tamano_muestra + 1)
+    origen.seek(0)
+    return muestra
+
+def verificar_encoding(origen, encoding, tamano_bloque=TAMANO_BLOQUE_ENCODING):
+    """
+    Confirma que todo el archivo se puede leer con el encoding detectado en la muestra
+    (ver detectar_formato_csv) decodificándolo por bloques, sin parsearlo. Retorna ese
+    encoding o latin-1 (que lee cualquier byte), igual que leer_csv.
+    origen: ruta o archivo abierto en modo binario (queda al inicio)
+    """
+    if encoding == 'latin-1':
+        return encoding
+    decodificador = codecs.getincrementaldecoder(encoding)()
+    archivo = open(origen, 'rb') if isinstance(origen, (str, os.PathLike)) else origen
+    try:
+        archivo.seek(0)
+        while bloque := archivo.read(tamano_bloque):
+            decodificador.decode(bloque)
+        decodificador.decode(b'', final=True)
+        return encoding
+    except UnicodeDecodeError:
+        # La muestra parecía UTF-8 pero el resto del archivo no lo es
+        return 'latin-1'
+    finally:
+        if archivo is origen:
+            archivo.seek(0)
+        else:
+            archivo.close()
+
+def iterar_lotes(nombre, origen, columnas=None, filas_por_lote=FILAS_POR_LOTE):
+    """
+    Recorre un archivo CSV o Excel en lotes de a lo sumo filas_por_lote filas sin
+    cargarlo completo. Las columnas se leen como texto para que todos los lotes
+    tengan el mismo esquema.
+    origen: ruta o archivo abierto en modo binario
+    """
+    if nombre.lower().endswith('.csv'):
+        encoding, sep, encabezado = detectar_formato_csv(leer_muestra(origen))
+        # Los lotes ya entregados no se pueden releer: el encoding se decide antes de empezar
+        encoding = verificar_encoding(origen, encoding)
+        usecols = None
+        if columnas is not None:
+            usecols = [c for c in encabezado if c.strip() in columnas] or None
+        
+        lector = pd.read_csv(
+            origen, sep=sep, encoding=encoding, usecols=usecols,
+            dtype=str, chunksize=filas_por_lote, engine='python' if sep is None else 'c'
+        )
+        with lector:
+            for lote in lector:
+                lote.columns = lote.columns.str.strip()
+                yield lote
+        return
+    
+    # Excel en modo de solo lectura y solo con las columnas pedidas (ver abrir_hoja_excel)
+    with abrir_hoja_excel(origen, columnas) as (nombres, filas):
+        bloque = []
+        for fila in filas:
+            bloque.append(fila)
+            if len(bloque) == filas_por_lote:
+                yield pd.DataFrame(bloque, columns=nombres, dtype=object).astype('string')
+                bloque = []
+        if bloque:
+            yield pd.DataFrame(bloque, columns=nombres, dtype=object).astype('string')
+
+def asignar_particiones(placas, n_particiones):
+    """Partición de cada fila según el hash de su placa (estable entre lotes y archivos)"""
+    return pd.util.hash_pandas_object(placas, index=False).to_numpy() % n_particiones
+
+def agregar_parquet(escritores, ruta, df):
+    """Agrega un DataFrame al Parquet de ruta, abriendo su escritor la primera vez"""
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    if ruta not in escritores:
+        escritores[ruta] = pq.ParquetWriter(ruta, tabla.schema)
+    escritores[ruta].write_table(tabla.cast(escritores[ruta].schema))
+
+def cerrar_escritores(escritores):
+    """Cierra todos los escritores Parquet abiertos"""
+    for escritor in escritores.values():
+        escritor.close()
+    escritores.clear()
+
+def volcar_fuente(origenes, fuente, directorio, n_particiones, columnas=None, filas_por_lote=FILAS_POR_LOTE,
+                  progreso=None):
+    """
+    Lee por lotes los archivos de una fuente, prepara cada lote (momento_entrada,
+    placa_normalizada y fila_original) y agrega sus filas al Parquet de su partición.
+    Todos los archivos se alinean a las columnas del primero.
+    Retorna la cantidad de filas volcadas. progreso: ver notificar (filas por lote)
+    """
+    columna_fecha, columna_placa = COLUMNAS_FUENTE[fuente]
+    escritores = {}
+    columnas_fuente = None
+    filas = 0
+    
+    try:
+        for nombre, origen in origenes:
+            for lote in iterar_lotes(nombre, origen, columnas, filas_por_lote):
+                if columnas_fuente is None:
+                    if columna_fecha not in lote.columns or columna_placa not in lote.columns:
+                        raise ValueError(
+                            f"El archivo de {fuente} debe contener las columnas '{columna_fecha}' y '{columna_placa}'"
+                        )
+                    columnas_fuente = list(lote.columns)
+                lote = lote.reindex(columns=columnas_fuente).astype('string')
+                
+                lote['momento_entrada'] = PROCESADORES_FECHAS[fuente](lote[columna_fecha])
+                lote['placa_normalizada'] = normalizar_placas(lote[columna_placa])
+                lote['fila_original'] = np.arange(filas, filas + len(lote), dtype=np.int64)
+                filas += len(lote)
+                
+                particiones = asignar_particiones(lote['placa_normalizada'], n_particiones)
+                for particion in np.unique(particiones):
+                    ruta = os.path.join(directorio, f"{fuente}_{particion}.parquet")
+                    agregar_parquet(escritores, ruta, lote[particiones == particion])
+                notificar(progreso, 'lectura', filas, None, f"{fuente}: {filas:,} filas leídas de {nombre}")
+    finally:
+        cerrar_escritores(escritores)
+    
+    return filas
+
+def leer_particion(directorio, fuente, particion):
+    """Carga una partición volcada; si la fuente no tiene filas en ella retorna None"""
+    ruta = os.path.join(directorio, f"{fuente}_{particion}.parquet")
+    if not os.path.exists(ruta):
+        return None
+    return pd.read_parquet(ruta)
+
+def particion_vacia():
+    """DataFrame sin filas con las columnas de trabajo de una fuente preparada"""
+    return pd.DataFrame({
+        'momento_entrada': pd.Series(dtype='datetime64[ns]'),
+        'placa_normalizada': pd.Series(dtype='category'),
+    })
+
+def agregar_resultado(escritores, ruta, df, extension):
+    """Agrega el resultado de una partición al archivo de salida (Parquet o CSV.gz)"""
+    if extension == 'parquet':
+        agregar_parquet(escritores, ruta, df)
+        return
+    # Cada partición es un miembro gzip independiente; los lectores los concatenan
+    nuevo = not os.path.exists(ruta)
+    with gzip.open(ruta, 'ab') as f:
+        df.to_csv(f, sep=';', index=False, header=nuevo, encoding='utf-8-sig' if nuevo else 'utf-8')
+
+def conciliar_por_particiones(origenes_accesspark, origenes_gopass, directorio_salida, extension='parquet',
+                              memoria_mb=MEMORIA_MB_POR_DEFECTO, filas_por_lote=FILAS_POR_LOTE,
+                              minutos_tolerancia=TOLERANCIA_MINUTOS, columnas_extra=None,
+                              modo=MODO_POR_DEFECTO, progreso=None, rendimiento=None, max_procesos=None):
+    """
+    Concilia fuentes más grandes que la memoria disponible.
+
+    Ambas fuentes se leen por lotes y se reparten en disco por hash de placa; como dos
+    placas distintas nunca coinciden, cada partición se valida de forma independiente
+    (ver validar_coincidencias, con el modo indicado) y su resultado se agrega a los
+    archivos de salida; matched_row_id apunta a la fila_original de la contraparte. La
+    cantidad de particiones se elige para que cada una quepa en memoria_mb, así que el
+    pico de memoria depende del tamaño de partición y no del volumen total.
+
+    origenes_*: listas de (nombre, origen), con origen ruta o archivo binario
+    extension: 'parquet' o 'csv.gz'. Las filas salen agrupadas por partición; la
+    columna fila_original permite recuperar el orden de lectura.
+    Retorna un dict con rutas de salida, particiones, conteos de coincidencias y
+    estadisticas (ver resumir_validacion; None si no hubo registros).
+    progreso: ver notificar (filas leídas, particiones validadas y bytes escritos)
+    rendimiento: lista para las mediciones del volcado de cada fuente y de cada partición
+    max_procesos: tope de procesos para la búsqueda en cada partición con muchas filas
+    (ver coincidir_en_paralelo); None usa todos los núcleos
+    """
+    if not PYARROW_DISPONIBLE:
+        raise RuntimeError("El modo por particiones requiere pyarrow")
+    if extension not in ('parquet', 'csv.gz'):
+        raise ValueError(f"Formato no soportado en el modo por particiones: {extension}")
+    
+    bytes_entrada = sum(tamano_origen(o) for _, o in list(origenes_accesspark) + list(origenes_gopass))
+    n_particiones = max(1, math.ceil(bytes_entrada * FACTOR_EXPANSION_MEMORIA / (memoria_mb * 1024 ** 2)))
+    
+    rutas = {
+        'ACCESSPARK': os.path.join(directorio_salida, f"ACCESSPARK_Procesado.{extension}"),
+        'GOPASS': os.path.join(directorio_salida, f"GOPASS_Procesado.{extension}"),
+    }
+    for ruta in rutas.values():
+        if os.path.exists(ruta):
+            os.remove(ruta)
+    
+    resumen = {
+        'rutas': rutas, 'particiones': n_particiones,
+        'total_accesspark': 0, 'encontradas_accesspark': 0,
+        'total_gopass': 0, 'encontradas_gopass': 0,
+        'estadisticas': None,
+    }
+    estadisticas = []
+    
+    with tempfile.TemporaryDirectory(prefix='particiones_', dir=directorio_salida) as directorio:
+        for fuente, origenes, columnas in (('ACCESSPARK', origenes_accesspark, COLUMNAS_ACCESSPARK),
+                                           ('GOPASS', origenes_gopass, COLUMNAS_GOPASS)):
+            with medir_etapa(rendimiento, 'volcado', fuente=fuente) as medicion:
+                medicion['filas'] = resumen[f'total_{fuente.lower()}'] = volcar_fuente(
+                    origenes, fuente, directorio, n_particiones,
+                    columnas_a_cargar(columnas, columnas_extra), filas_por_lote, progreso
+                )
+        
+        escritores = {}
+        try:
+            for particion in range(n_particiones):
+                notificar(progreso, 'coincidencias', particion, n_particiones, f"Partición {particion + 1} de {n_particiones}")
+                df_accesspark = leer_particion(directorio, 'ACCESSPARK', particion)
+                df_gopass = leer_particion(directorio, 'GOPASS', particion)
+                if df_accesspark is None and df_gopass is None:
+                    continue
+                
+                filas = sum(len(df) for df in (df_accesspark, df_gopass) if df is not None)
+                with medir_etapa(rendimiento, 'coincidencias', filas, particion=particion, modo=modo):
+                    resultado_accesspark, resultado_gopass = validar_coincidencias(
+                        particion_vacia() if df_accesspark is None else df_accesspark,
+                        particion_vacia() if df_gopass is None else df_gopass,
+                        minutos_tolerancia, modo, max_procesos=max_procesos
+                    )
+                
+                with medir_etapa(rendimiento, 'exportacion', filas, particion=particion, formato=extension):
+                    for fuente, df, resultado in (('ACCESSPARK', df_accesspark, resultado_accesspark),
+                                                  ('GOPASS', df_gopass, resultado_gopass)):
+                        if df is not None:
+                            agregar_resultado(escritores, rutas[fuente], etiquetar_resultado(resultado, fuente), extension)
+                            resumen[f'encontradas_{fuente.lower()}'] += int(resultado['encontrada'].sum())
+                    estadisticas.append(resumir_validacion(resultado_accesspark, resultado_gopass))
+                
+                escritos = sum(os.path.getsize(ruta) for ruta in rutas.values() if os.path.exists(ruta))
+                notificar(progreso, 'exportacion', escritos, None, f"{escritos / 1024 ** 2:,.1f} MB escritos")
+            notificar(progreso, 'coincidencias', n_particiones, n_particiones)
+        finally:
+            cerrar_escritores(escritores)
+    
+    if estadisticas:
+        resumen['estadisticas'] = combinar_resumenes(estadisticas)
+    return resumen
+
+# ========================================
+# CONCILIACIÓN INCREMENTAL
+# ========================================
+
+def directorio_estado(nombre):
+    """Directorio de una conciliación incremental a partir de su nombre"""
+    return os.path.join(DIRECTORIO_ESTADOS, re.sub(r'[^\w\-]', '_', nombre.strip()) or 'conciliacion')
+
+def dias_de(momentos):
+    """Día (YYYY-MM-DD) de cada instante; los instantes nulos van al grupo 'sin_fecha'"""
+    return momentos.dt.strftime('%Y-%m-%d').fillna('sin_fecha')
+
+def dias_en_ventana(momentos, minutos_tolerancia):
+    """Días que alcanza la ventana de tolerancia alrededor de cada instante"""
+    validos = momentos.dropna()
+    margen = pd.Timedelta(seconds=max(abs(s) for s in ventana_en_segundos(minutos_tolerancia)))
+    dias = set(dias_de(momentos[momentos.isna()]).unique())
+    inicios = (validos - margen).dt.normalize()
+    fines = (validos + margen).dt.normalize()
+    for dia in pd.concat([inicios, fines, validos.dt.normalize()]).unique():
+        dias.add(pd.Timestamp(dia).strftime('%Y-%m-%d'))
+    return dias
+
+def ruta_dia(directorio, fuente, dia):
+    return os.path.join(directorio, fuente, f"{dia}.parquet")
+
+def cargar_dias(directorio, fuente, dias):
+    """Carga los eventos indexados de una fuente en los días indicados (None: todos)"""
+    carpeta = os.path.join(directorio, fuente)
+    if dias is None:
+        dias = [n[:-len('.parquet')] for n in os.listdir(carpeta)] if os.path.isdir(carpeta) else []
+    partes = [pd.read_parquet(ruta_dia(directorio, fuente, dia)) for dia in sorted(dias)
+              if os.path.exists(ruta_dia(directorio, fuente, dia))]
+    if not partes:
+        return None
+    return partes[0] if len(partes) == 1 else pd.concat(partes, ignore_index=True)
+
+def guardar_dias(directorio, fuente, df):
+    """Reescribe el archivo de cada día presente en df con sus eventos"""
+    os.makedirs(os.path.join(directorio, fuente), exist_ok=True)
+    for dia, eventos in df.groupby(dias_de(df['momento_entrada']), sort=False):
+        ruta = ruta_dia(directorio, fuente, dia)
+        texto_a_string(eventos).to_parquet(f"{ruta}.tmp", index=False)
+        os.replace(f"{ruta}.tmp", ruta)
+
+def huellas_archivo(contenido, fuente):
+    """
+    Identidad de un archivo incorporado a una conciliación (ver conciliar_incremental):
+    hash de su contenido más la fuente, sin la versión de la caché, que cambia con el
+    formato de la caché y no con el archivo.
+    Retorna (huella, llaves_anteriores): las llaves con que lo registraban los estados
+    guardados antes (llave_cache con cada versión de caché hasta la actual)
+    """
+    contenido_hash = hashlib.blake2b(contenido, digest_size=20)
+    huella = contenido_hash.copy()
+    huella.update(f"|{fuente}".encode('utf-8'))
+    llaves_anteriores = []
+    for version in range(1, VERSION_CACHE + 1):
+        llave = contenido_hash.copy()
+        llave.update(f"|{fuente}|*|{version}".encode('utf-8'))
+        llaves_anteriores.append(llave.hexdigest())
+    return huella.hexdigest(), llaves_anteriores
+
+def cargar_indice_archivos(directorio):
+    """Archivos ya incorporados a la conciliación: {huella: {archivo, fuente, filas}} (ver huellas_archivo)"""
+    ruta = os.path.join(directorio, 'archivos.json')
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+def guardar_indice_archivos(directorio, indice):
+    ruta = os.path.join(directorio, 'archivos.json')
+    with open(f"{ruta}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(indice, f, ensure_ascii=False, indent=1)
+    os.replace(f"{ruta}.tmp", ruta)
+
+def modo_guardado(directorio, indice):
+    """
+    Modo de coincidencia de una conciliación incremental (ver conciliar_incremental), o
+    None si todavía no tiene archivos. Las guardadas antes de registrar el modo solo
+    marcaban la existencia de contraparte.
+    """
+    ruta = os.path.join(directorio, 'conciliacion.json')
+    if os.path.exists(ruta):
+        with open(ruta, encoding='utf-8') as f:
+            return json.load(f)['modo']
+    return 'existencia' if indice else None
+
+def guardar_modo(directorio, modo):
+    ruta = os.path.join(directorio, 'conciliacion.json')
+    with open(f"{ruta}.tmp", 'w', encoding='utf-8') as f:
+        json.dump({'modo': modo}, f)
+    os.replace(f"{ruta}.tmp", ruta)
+
+def eventos_vacios(modo):
+    """Eventos sin filas de una fuente, con las columnas de estado del modo"""
+    vacio = particion_vacia().assign(encontrada=pd.Series(dtype=bool))
+    if modo == 'emparejamiento':
+        vacio = vacio.assign(
+            fila_original=pd.Series(dtype=np.int64), matched_row_id=pd.Series(dtype='Int64'),
+            delta_minutes=pd.Series(dtype=float)
+        )
+    return vacio
+
+def unir_eventos(anteriores, nuevos, modo=MODO_POR_DEFECTO, primer_id=0):
+    """
+    Une eventos indexados y nuevos; los nuevos empiezan sin contraparte. En el modo
+    emparejamiento cada evento nuevo recibe su fila_original (identificador permanente,
+    desde primer_id en el orden de llegada) y sin pareja en matched_row_id
+    """
+    if nuevos is not None:
+        nuevos = nuevos.assign(encontrada=False)
+        if modo == 'emparejamiento':
+            nuevos = nuevos.assign(
+                fila_original=np.arange(primer_id, primer_id + len(nuevos), dtype=np.int64),
+                matched_row_id=pd.array([pd.NA] * len(nuevos), dtype='Int64'), delta_minutes=np.nan
+            )
+    partes = [df for df in (anteriores, nuevos) if df is not None]
+    if not partes:
+        return None
+    return partes[0] if len(partes) == 1 else pd.concat(partes, ignore_index=True)
+
+def emparejar_dias(df_accesspark, df_gopass, minutos_tolerancia):
+    """
+    Vuelve a emparejar los eventos cargados de los días afectados (ver
+    validar_coincidencias): un evento nuevo más cercano puede tomar la contraparte de
+    uno anterior, como en una conciliación completa. Los que tienen la contraparte en
+    un día que no se cargó conservan su pareja.
+    Actualiza encontrada, matched_row_id (fila_original de la contraparte) y
+    delta_minutes en los DataFrames recibidos
+    """
+    libres = [
+        df['matched_row_id'].isna().to_numpy() | df['matched_row_id'].isin(otra['fila_original']).to_numpy()
+        for df, otra in ((df_accesspark, df_gopass), (df_gopass, df_accesspark))
+    ]
+    resultados = validar_coincidencias(
+        df_accesspark[libres[0]], df_gopass[libres[1]], minutos_tolerancia, 'emparejamiento'
+    )
+    for df, libre, resultado in zip((df_accesspark, df_gopass), libres, resultados):
+        for columna in ('encontrada', 'matched_row_id', 'delta_minutes'):
+            valores = df[columna].array.copy()
+            valores[libre] = resultado[columna].array
+            df[columna] = valores
+
+def conciliar_incremental(directorio, trabajos, minutos_tolerancia=TOLERANCIA_MINUTOS, progreso=None,
+                          rendimiento=None, modo=MODO_POR_DEFECTO):
+    """
+    Agrega archivos nuevos a una conciliación persistida sin recalcular lo anterior.
+
+    Los eventos de cada fuente se guardan por día con su estado (columna encontrada y,
+    en el modo emparejamiento, fila_original, matched_row_id y delta_minutes). Solo se
+    cargan los días que alcanza la ventana ±tolerancia de los registros nuevos; ahí se
+    vuelven a validar juntos anteriores y nuevos con el modo de la conciliación (ver
+    validar_coincidencias y emparejar_dias): en el modo existencia los anteriores sin
+    contraparte que ahora la encuentran cambian de estado, en el emparejamiento además
+    pueden cambiar de pareja. Los archivos ya incorporados (mismo contenido) se omiten.
+
+    trabajos: lista de (nombre, contenido, fuente, columnas), como en preparar_archivos
+    modo: ver MODOS_COINCIDENCIA; debe ser el mismo con que se empezó la conciliación
+    Retorna (resultados de lectura, resumen con nuevos y actualizados por fuente:
+    anteriores que cambiaron de estado o de contraparte)
+    rendimiento: lista para las mediciones de cada etapa (ver medir_etapa)
+    """
+    if modo not in MODOS_COINCIDENCIA.values():
+        raise ValueError(f"Modo de coincidencia no soportado: {modo}")
+    os.makedirs(directorio, exist_ok=True)
+    indice = cargar_indice_archivos(directorio)
+    guardado = modo_guardado(directorio, indice)
+    if guardado not in (None, modo):
+        raise ValueError(
+            f"La conciliación se guardó con el modo '{guardado}'; no se le pueden agregar archivos con el modo '{modo}'"
+        )
+    
+    llaves = []
+    for _, contenido, fuente, _ in trabajos:
+        huella, llaves_anteriores = huellas_archivo(contenido, fuente)
+        # Los estados guardados con la llave de caché pasan a la huella sin versión
+        for llave in llaves_anteriores:
+            if llave in indice and huella not in indice:
+                indice[huella] = indice.pop(llave)
+        llaves.append(huella)
+    pendientes = [(t, llave) for t, llave in zip(trabajos, llaves) if llave not in indice]
+    resultados = preparar_archivos([t for t, _ in pendientes], progreso=progreso, rendimiento=rendimiento) if pendientes else []
+    
+    resumen = {'omitidos': len(trabajos) - len(pendientes)}
+    nuevos = {}
+    for fuente in ('ACCESSPARK', 'GOPASS'):
+        dfs = [r['df'] for (t, _), r in zip(pendientes, resultados) if t[2] == fuente and r['df'] is not None]
+        nuevos[fuente] = None if not dfs else dfs[0] if len(dfs) == 1 else pd.concat(dfs, ignore_index=True)
+        resumen[f'nuevos_{fuente.lower()}'] = 0 if nuevos[fuente] is None else len(nuevos[fuente])
+        resumen[f'actualizados_{fuente.lower()}'] = 0
+    
+    if nuevos['ACCESSPARK'] is not None or nuevos['GOPASS'] is not None:
+        # Días que pueden tener contraparte para algún registro nuevo
+        momentos_nuevos = pd.concat([df['momento_entrada'] for df in nuevos.values() if df is not None])
+        dias = dias_en_ventana(momentos_nuevos, minutos_tolerancia)
+        
+        with medir_etapa(rendimiento, 'carga_dias', dias=len(dias)) as medicion:
+            eventos = {}
+            for fuente in ('ACCESSPARK', 'GOPASS'):
+                # Los identificadores siguen a los de los eventos ya incorporados de la fuente
+                primer_id = sum(a['filas'] for a in indice.values() if a['fuente'] == fuente)
+                df = unir_eventos(cargar_dias(directorio, fuente, dias), nuevos[fuente], modo, primer_id)
+                eventos[fuente] = eventos_vacios(modo) if df is None else df
+            medicion['filas'] = sum(len(df) for df in eventos.values())
+        notificar(progreso, 'coincidencias', 0, 1, f"{len(dias)} día(s) afectados")
+        anteriores = {fuente: df.copy(deep=False) for fuente, df in eventos.items()}
+        with medir_etapa(rendimiento, 'coincidencias', medicion['filas'], modo=modo):
+            if modo == 'emparejamiento':
+                emparejar_dias(eventos['ACCESSPARK'], eventos['GOPASS'], minutos_tolerancia)
+            else:
+                resultados_fuentes = validar_coincidencias(
+                    eventos['ACCESSPARK'], eventos['GOPASS'], minutos_tolerancia, modo
+                )
+                for fuente, resultado in zip(('ACCESSPARK', 'GOPASS'), resultados_fuentes):
+                    # Los que ya tenían contraparte en un día que no se cargó la conservan
+                    eventos[fuente]['encontrada'] = (
+                        eventos[fuente]['encontrada'].to_numpy() | resultado['encontrada'].to_numpy()
+                    )
+        
+        with medir_etapa(rendimiento, 'guardado', medicion['filas'], dias=len(dias)):
+            for fuente, df in eventos.items():
+                if len(df) == 0:
+                    continue
+                n_anteriores = len(df) - resumen[f'nuevos_{fuente.lower()}']
+                cambios = df['encontrada'].to_numpy() != anteriores[fuente]['encontrada'].to_numpy()
+                if modo == 'emparejamiento':
+                    cambios |= (
+                        df['matched_row_id'].to_numpy(dtype=np.int64, na_value=-1)
+                        != anteriores[fuente]['matched_row_id'].to_numpy(dtype=np.int64, na_value=-1)
+                    )
+                resumen[f'actualizados_{fuente.lower()}'] = int(cambios[:n_anteriores].sum())
+                guardar_dias(directorio, fuente, df)
+        notificar(progreso, 'coincidencias', 1, 1, f"{len(dias)} día(s) afectados")
+    
+    for (trabajo, llave), resultado in zip(pendientes, resultados):
+        if resultado['df'] is not None:
+            indice[llave] = {'archivo': trabajo[0], 'fuente': trabajo[2], 'filas': resultado['filas']}
+    guardar_indice_archivos(directorio, indice)
+    if indice and guardado is None:
+        guardar_modo(directorio, modo)
+    
+    return resultados, resumen
+
+def cargar_conciliacion(directorio):
+    """
+    Carga todos los eventos de una conciliación incremental con su estado (columna
+    encontrada), listos para crear_archivos_descarga y contar_coincidencias. En el modo
+    emparejamiento quedan en el orden de llegada (fila_original), al que apunta
+    matched_row_id
+    Retorna (df_accesspark, df_gopass); una fuente sin eventos queda vacía
+    """
+    modo = modo_guardado(directorio, cargar_indice_archivos(directorio))
+    resultado = []
+    for fuente in ('ACCESSPARK', 'GOPASS'):
+        df = cargar_dias(directorio, fuente, None)
+        if df is None:
+            df = eventos_vacios(modo)
+        elif 'fila_original' in df.columns:
+            df = df.sort_values('fila_original', ignore_index=True)
+        resultado.append(df)
+    return tuple(resultado)
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import procesamiento
+
+
+@pytest.fixture(autouse=True)
+def sin_cache(monkeypatch):
+    """Las pruebas no leen ni escriben la caché de archivos preparados del usuario"""
+    monkeypatch.setattr(procesamiento, 'CACHE_MAX_MB', 0)
+
+
+def base_preparada(fuente, registros):
+    """
+    DataFrame preparado (ver preparar_archivo) a partir de pares (placa, 'YYYY-MM-DD HH:MM:SS');
+    placa o momento None quedan nulos
+    """
+    columna_fecha, columna_placa = procesamiento.COLUMNAS_FUENTE[fuente]
+    placas = [placa for placa, _ in registros]
+    momentos = [momento for _, momento in registros]
+    df = pd.DataFrame({columna_fecha: momentos, columna_placa: placas})
+    df['momento_entrada'] = pd.to_datetime(pd.Series(momentos, dtype='object')).astype('datetime64[ns]')
+    df['placa_normalizada'] = procesamiento.normalizar_placas(df[columna_placa]).astype('category')
+    return df
@@ -0,0 +1,22 @@
+import pandas as pd
+import pytest
+
+import benchmark
+import procesamiento
+from procesamiento import preparar_archivo
+
+
+@pytest.mark.parametrize('entrada', ['csv', 'xlsx'])
+def test_cache_devuelve_la_misma_base_que_una_lectura_nueva(tmp_path, monkeypatch, entrada):
+    monkeypatch.setattr(procesamiento, 'DIRECTORIO_CACHE', str(tmp_path))
+    monkeypatch.setattr(procesamiento, 'CACHE_MAX_MB', 100)
+    df_accesspark, _ = benchmark.generar_bases(500, semilla=3)
+    # Números y texto en una misma columna (en Excel queda como object)
+    df_accesspark['referencia'] = [1, 'A-7'] * 250
+    contenido = benchmark.serializar(df_accesspark, entrada)
+
+    nueva = preparar_archivo(f"accesspark.{entrada}", contenido, 'ACCESSPARK')
+    desde_cache = preparar_archivo(f"accesspark.{entrada}", contenido, 'ACCESSPARK')
+    assert nueva['error'] is None
+    assert desde_cache['mensaje'] == "Leído desde la caché"
+    pd.testing.assert_frame_equal(desde_cache['df'], nueva['df'])
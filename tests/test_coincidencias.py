@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from procesamiento import ventana_en_segundos, validar_coincidencias
+
+from conftest import base_preparada
+
+VENTANAS = [10, 0.5, (0, 15), (5, 15), (-15, -5)]
+
+
+def registros_al_azar(rng, filas, placas):
+    """Pares (placa, momento) de pocas placas en unas horas, con algunas placas y momentos nulos"""
+    segundos = rng.integers(0, 4 * 3600, filas)
+    registros = [
+        (str(rng.choice(placas)), (np.datetime64('2025-03-01T00:00:00') + np.timedelta64(int(s), 's')).astype(str))
+        for s in segundos
+    ]
+    registros[0] = (None, registros[0][1])
+    registros[1] = (registros[1][0], None)
+    return registros
+
+
+def validos(registros):
+    return [
+        (i, placa, np.datetime64(momento).astype('datetime64[s]').astype(np.int64))
+        for i, (placa, momento) in enumerate(registros) if placa is not None and momento is not None
+    ]
+
+
+def existencia_por_fuerza_bruta(registros_accesspark, registros_gopass, ventana):
+    """Para cada registro de cada fuente, si algún registro de la otra tiene su placa y GOPASS - ACCESSPARK en la ventana"""
+    desde, hasta = ventana_en_segundos(ventana)
+    encontradas_accesspark = np.zeros(len(registros_accesspark), dtype=bool)
+    encontradas_gopass = np.zeros(len(registros_gopass), dtype=bool)
+    for i, placa_a, segundo_a in validos(registros_accesspark):
+        for j, placa_g, segundo_g in validos(registros_gopass):
+            if placa_a == placa_g and desde <= segundo_g - segundo_a <= hasta:
+                encontradas_accesspark[i] = encontradas_gopass[j] = True
+    return encontradas_accesspark, encontradas_gopass
+
+
+@pytest.fixture(params=range(3))
+def registros(request):
+    rng = np.random.default_rng(request.param)
+    placas = ['ABC123', 'XYZ987', 'KLM456', 'JHG321', 'MVC867', 'MSN210', 'QWE741', 'RTY852']
+    return registros_al_azar(rng, 150, placas), registros_al_azar(rng, 130, placas)
+
+
+@pytest.mark.parametrize('ventana', VENTANAS)
+def test_existencia_igual_a_fuerza_bruta(registros, ventana):
+    registros_accesspark, registros_gopass = registros
+    resultado_accesspark, resultado_gopass = validar_coincidencias(
+        base_preparada('ACCESSPARK', registros_accesspark), base_preparada('GOPASS', registros_gopass),
+        ventana, 'existencia'
+    )
+    esperadas_accesspark, esperadas_gopass = existencia_por_fuerza_bruta(registros_accesspark, registros_gopass, ventana)
+    assert (resultado_accesspark['encontrada'].to_numpy() == esperadas_accesspark).all()
+    assert (resultado_gopass['encontrada'].to_numpy() == esperadas_gopass).all()
+
+
+def emparejamiento_por_fuerza_bruta(registros_accesspark, registros_gopass, ventana):
+    """
+    Emparejamiento voraz: de todos los pares con la misma placa y GOPASS - ACCESSPARK en
+    la ventana, se acepta primero el más cercano (al borde de la ventana si no contiene
+    el cero) mientras ninguno de sus registros tenga pareja
+    """
+    desde, hasta = ventana_en_segundos(ventana)
+    desplazamiento = max(desde, 0) + min(hasta, 0)
+    candidatos = sorted(
+        (abs(segundo_g - segundo_a - desplazamiento), i, j)
+        for i, placa_a, segundo_a in validos(registros_accesspark)
+        for j, placa_g, segundo_g in validos(registros_gopass)
+        if placa_a == placa_g and desde <= segundo_g - segundo_a <= hasta
+    )
+    pareja_accesspark = np.full(len(registros_accesspark), -1)
+    pareja_gopass = np.full(len(registros_gopass), -1)
+    for _, i, j in candidatos:
+        if pareja_accesspark[i] < 0 and pareja_gopass[j] < 0:
+            pareja_accesspark[i], pareja_gopass[j] = j, i
+    return pareja_accesspark, pareja_gopass
+
+
+@pytest.mark.parametrize('ventana', VENTANAS)
+def test_emparejamiento_igual_a_fuerza_bruta(registros, ventana):
+    registros_accesspark, registros_gopass = registros
+    resultado_accesspark, resultado_gopass = validar_coincidencias(
+        base_preparada('ACCESSPARK', registros_accesspark), base_preparada('GOPASS', registros_gopass),
+        ventana, 'emparejamiento'
+    )
+    esperada_accesspark, esperada_gopass = emparejamiento_por_fuerza_bruta(registros_accesspark, registros_gopass, ventana)
+    assert (resultado_accesspark['matched_row_id'].to_numpy(dtype=np.int64, na_value=-1) == esperada_accesspark).all()
+    assert (resultado_gopass['matched_row_id'].to_numpy(dtype=np.int64, na_value=-1) == esperada_gopass).all()
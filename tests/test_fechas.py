@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+from procesamiento import procesar_fechas_accesspark, procesar_fechas_gopass
+
+
+@pytest.mark.parametrize('texto, esperado', [
+    ('2025-02-27 14:23:00.000', '2025-02-27 14:23:00'),
+    ('2025-02-27 14:23:05', '2025-02-27 14:23:05'),
+    ('2025-02-27 14:23', '2025-02-27 14:23:00'),
+    ('2025-02-27 00:00:00.000', '2025-02-27 00:00:00'),
+    ('  2025-02-27 14:23:00.000 ', '2025-02-27 14:23:00'),
+])
+def test_fechas_accesspark(texto, esperado):
+    assert procesar_fechas_accesspark(pd.Series([texto]))[0] == pd.Timestamp(esperado)
+
+
+@pytest.mark.parametrize('texto, esperado', [
+    ('28/10/2025  2:57:50 p. m.', '2025-10-28 14:57:50'),
+    ('28/10/2025 2:57:50 a. m.', '2025-10-28 02:57:50'),
+    ('28/10/2025 12:05:00 a. m.', '2025-10-28 00:05:00'),
+    ('28/10/2025 12:30:00 p. m.', '2025-10-28 12:30:00'),
+    ('28/10/2025 2:57:50 P. M.', '2025-10-28 14:57:50'),
+    ('28/10/2025 2:57:50 PM', '2025-10-28 14:57:50'),
+    ('28/10/2025 14:57:50', '2025-10-28 14:57:50'),
+    ('28/10/2025 2:57 p. m.', '2025-10-28 14:57:00'),
+    ('28/10/2025 14:57', '2025-10-28 14:57:00'),
+    ('03/04/2025 08:00:00', '2025-04-03 08:00:00'),  # día primero
+])
+def test_fechas_gopass(texto, esperado):
+    assert procesar_fechas_gopass(pd.Series([texto]))[0] == pd.Timestamp(esperado)
+
+
+@pytest.mark.parametrize('procesar', [procesar_fechas_accesspark, procesar_fechas_gopass])
+def test_fechas_vacias_o_invalidas_quedan_nulas(procesar):
+    momentos = procesar(pd.Series([None, '', 'sin fecha', '2025-13-45 99:00', '45/13/2025 9:00:00 a. m.'], dtype=object))
+    assert momentos.isna().all()
+
+
+def test_mismo_instante_en_ambos_formatos():
+    # Columnas completas con valores repetidos, nulos y formatos mezclados (se parsean por valores únicos)
+    accesspark = pd.Series(['2025-10-28 14:57:50.000', None, '2025-10-28 00:05:00', '2025-10-28 14:57:50.000'] * 50)
+    gopass = pd.Series(['28/10/2025  2:57:50 p. m.', '', '28/10/2025 00:05:00', '28/10/2025 2:57:50 p. m.'] * 50)
+    momentos_accesspark = procesar_fechas_accesspark(accesspark)
+    momentos_gopass = procesar_fechas_gopass(gopass)
+    pd.testing.assert_series_equal(momentos_accesspark, momentos_gopass)
+    assert momentos_accesspark.dtype == 'datetime64[ns]'
+    assert momentos_accesspark.isna().sum() == 50
+
+
+def test_columnas_ya_convertidas_no_cambian():
+    # Excel entrega fechas ya convertidas
+    momentos = pd.Series(pd.to_datetime(['2025-10-28 14:57:50', None]))
+    pd.testing.assert_series_equal(procesar_fechas_gopass(momentos), momentos)
+    pd.testing.assert_series_equal(procesar_fechas_accesspark(momentos), momentos)
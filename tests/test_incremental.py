@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmark
+from procesamiento import (
+    armar_trabajos, cargar_conciliacion, conciliar_incremental, preparar_bases, procesar_fechas_accesspark,
+    procesar_fechas_gopass, validar_coincidencias,
+)
+
+
+@pytest.fixture(scope='module')
+def archivos_por_dia():
+    """Archivos de tres días de cada fuente, con ingresos y cobros que cruzan la medianoche"""
+    df_accesspark, df_gopass = benchmark.generar_bases(3_000, semilla=11, dias=3, tasa_medianoche=0.05)
+    dia_accesspark = procesar_fechas_accesspark(df_accesspark['check_in']).dt.date
+    dia_gopass = procesar_fechas_gopass(df_gopass['Fecha de entrada']).dt.date
+    return [
+        (
+            [(f"accesspark_{dia}.csv", benchmark.serializar(df_accesspark[dia_accesspark == dia], 'csv'))],
+            [(f"gopass_{dia}.csv", benchmark.serializar(df_gopass[dia_gopass == dia], 'csv'))],
+        )
+        for dia in sorted(set(dia_accesspark) | set(dia_gopass))
+    ]
+
+
+def conciliacion_completa(archivos_por_dia, modo):
+    archivos_accesspark = [archivo for accesspark, _ in archivos_por_dia for archivo in accesspark]
+    archivos_gopass = [archivo for _, gopass in archivos_por_dia for archivo in gopass]
+    bases = preparar_bases(armar_trabajos(archivos_accesspark, archivos_gopass))
+    return validar_coincidencias(bases['df_accesspark'], bases['df_gopass'], 10, modo, bases['indice'])
+
+
+def conciliacion_por_dias(directorio, archivos_por_dia, modo):
+    for archivos_accesspark, archivos_gopass in archivos_por_dia:
+        conciliar_incremental(str(directorio), armar_trabajos(archivos_accesspark, archivos_gopass), 10, modo=modo)
+    return cargar_conciliacion(str(directorio))
+
+
+def test_emparejamiento_igual_a_la_conciliacion_completa(tmp_path, archivos_por_dia):
+    completas = conciliacion_completa(archivos_por_dia, 'emparejamiento')
+    incrementales = conciliacion_por_dias(tmp_path, archivos_por_dia, 'emparejamiento')
+    for completa, incremental in zip(completas, incrementales):
+        assert (incremental['fila_original'].to_numpy() == np.arange(len(completa))).all()
+        assert (incremental['encontrada'].to_numpy() == completa['encontrada'].to_numpy()).all()
+        pd.testing.assert_series_equal(incremental['matched_row_id'], completa['matched_row_id'].reset_index(drop=True))
+        np.testing.assert_allclose(incremental['delta_minutes'], completa['delta_minutes'])
+
+
+def test_existencia_igual_a_la_conciliacion_completa(tmp_path, archivos_por_dia):
+    completas = conciliacion_completa(archivos_por_dia, 'existencia')
+    incrementales = conciliacion_por_dias(tmp_path, archivos_por_dia, 'existencia')
+    for completa, incremental in zip(completas, incrementales):
+        columnas = ['placa_normalizada', 'momento_entrada', 'encontrada']
+        assert sorted(map(tuple, completa[columnas].astype(str).to_numpy())) == sorted(
+            map(tuple, incremental[columnas].astype(str).to_numpy())
+        )
+
+
+def test_no_mezcla_modos(tmp_path, archivos_por_dia):
+    archivos_accesspark, archivos_gopass = archivos_por_dia[0]
+    conciliar_incremental(str(tmp_path), armar_trabajos(archivos_accesspark, archivos_gopass), modo='existencia')
+    archivos_accesspark, archivos_gopass = archivos_por_dia[1]
+    with pytest.raises(ValueError, match='existencia'):
+        conciliar_incremental(str(tmp_path), armar_trabajos(archivos_accesspark, archivos_gopass))
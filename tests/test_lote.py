@@ -0,0 +1,52 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmark
+from procesamiento import armar_trabajos, conciliar_archivos, conciliar_lote
+
+FORMATO = 'Parquet (.parquet)'
+
+
+@pytest.fixture(scope='module')
+def lote_mezclado():
+    """Tres grupos con placas compartidas (los ingresos se reparten al azar) y un GOPASS común"""
+    df_accesspark, df_gopass = benchmark.generar_bases(3_000, semilla=7, dias=2)
+    grupo = np.random.default_rng(7).integers(0, 3, len(df_accesspark))
+    grupos = [
+        (f"sitio{k}", [(f"sitio{k}.csv", benchmark.serializar(df_accesspark[grupo == k], 'csv'))])
+        for k in range(3)
+    ]
+    return grupos, [('gopass.csv', benchmark.serializar(df_gopass, 'csv'))]
+
+
+def base_exportada(grupo, posicion):
+    _, datos, _ = grupo['archivos'][posicion]
+    return pd.read_parquet(io.BytesIO(datos))
+
+
+@pytest.mark.parametrize('placas_aproximadas', [False, True])
+def test_emparejamiento_cuenta_cada_cobro_en_su_grupo(lote_mezclado, placas_aproximadas):
+    grupos, archivos_gopass = lote_mezclado
+    lote = conciliar_lote(grupos, archivos_gopass, formato=FORMATO, placas_aproximadas=placas_aproximadas)
+    assert lote['error'] is None
+
+    encontradas = sum(grupo['resumen']['encontradas_gopass'] for grupo in lote['grupos'])
+    assert encontradas == lote['resumen']['encontradas_gopass']
+    for grupo in lote['grupos']:
+        # Uno a uno: los cobros encontrados del grupo son los pares de sus ingresos
+        assert grupo['resumen']['encontradas_gopass'] == grupo['resumen']['encontradas_accesspark']
+        gopass = base_exportada(grupo, 1)
+        con_pareja = gopass[gopass['matched_group'].notna()]
+        assert (con_pareja['matched_group'] == grupo['nombre']).all()
+
+
+def test_existencia_igual_a_cada_grupo_por_separado(lote_mezclado):
+    grupos, archivos_gopass = lote_mezclado
+    lote = conciliar_lote(grupos, archivos_gopass, modo='existencia', formato=FORMATO)
+    for (nombre, archivos), grupo in zip(grupos, lote['grupos']):
+        separado = conciliar_archivos(armar_trabajos(archivos, archivos_gopass), modo='existencia', formato=FORMATO)
+        for clave in ('total_accesspark', 'encontradas_accesspark', 'encontradas_gopass'):
+            assert grupo['resumen'][clave] == separado['resumen'][clave], (nombre, clave)
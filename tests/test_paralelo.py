@@ -0,0 +1,55 @@
+import io
+
+import pandas as pd
+import pytest
+
+import benchmark
+import procesamiento
+from procesamiento import armar_trabajos, conciliar_por_particiones, preparar_bases, validar_coincidencias
+
+
+@pytest.fixture(scope='module')
+def bases():
+    df_accesspark, df_gopass = benchmark.generar_bases(5_000, semilla=5, dias=2)
+    trabajos = armar_trabajos(
+        [('accesspark.csv', benchmark.serializar(df_accesspark, 'csv'))],
+        [('gopass.csv', benchmark.serializar(df_gopass, 'csv'))],
+    )
+    yield preparar_bases(trabajos, max_procesos=1)
+    procesamiento.descartar_pool_coincidencias(2)
+
+
+@pytest.fixture
+def siempre_en_paralelo(monkeypatch):
+    """Reparte la búsqueda en procesos aunque haya pocas filas y registra los procesos usados"""
+    monkeypatch.setattr(procesamiento, 'FILAS_MINIMAS_PARALELO', 0)
+    llamadas = []
+    original = procesamiento.coincidir_en_paralelo
+
+    def coincidir_en_paralelo(indice, ventana, modo, procesos):
+        llamadas.append(procesos)
+        return original(indice, ventana, modo, procesos)
+
+    monkeypatch.setattr(procesamiento, 'coincidir_en_paralelo', coincidir_en_paralelo)
+    return llamadas
+
+
+@pytest.mark.parametrize('modo', ['emparejamiento', 'existencia'])
+@pytest.mark.parametrize('ventana', [10, (0, 15)])
+def test_paralelo_igual_a_un_proceso(bases, siempre_en_paralelo, modo, ventana):
+    argumentos = (bases['df_accesspark'], bases['df_gopass'], ventana, modo, bases['indice'])
+    paralelos = validar_coincidencias(*argumentos, max_procesos=2)
+    assert siempre_en_paralelo == [2]
+    seriales = validar_coincidencias(*argumentos, max_procesos=1)
+    for paralelo, serial in zip(paralelos, seriales):
+        pd.testing.assert_frame_equal(paralelo, serial)
+
+
+def test_particiones_respetan_max_procesos(tmp_path, siempre_en_paralelo):
+    df_accesspark, df_gopass = benchmark.generar_bases(2_000, semilla=5, dias=2)
+    origenes = [
+        [(f"{fuente}.csv", io.BytesIO(benchmark.serializar(df, 'csv')))]
+        for fuente, df in (('accesspark', df_accesspark), ('gopass', df_gopass))
+    ]
+    conciliar_por_particiones(*origenes, str(tmp_path), memoria_mb=1, max_procesos=2)
+    assert siempre_en_paralelo and set(siempre_en_paralelo) == {2}
@@ -0,0 +1,38 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmark
+from procesamiento import (
+    armar_trabajos, conciliar_por_particiones, etiquetar_resultado, preparar_bases, validar_coincidencias,
+)
+
+
+@pytest.fixture(scope='module')
+def contenidos():
+    df_accesspark, df_gopass = benchmark.generar_bases(4_000, semilla=9, dias=3)
+    return benchmark.serializar(df_accesspark, 'csv'), benchmark.serializar(df_gopass, 'csv')
+
+
+@pytest.mark.parametrize('modo', ['emparejamiento', 'existencia'])
+def test_particiones_igual_a_memoria(tmp_path, contenidos, modo):
+    contenido_accesspark, contenido_gopass = contenidos
+    resumen = conciliar_por_particiones(
+        [('accesspark.csv', io.BytesIO(contenido_accesspark))], [('gopass.csv', io.BytesIO(contenido_gopass))],
+        str(tmp_path), memoria_mb=1, filas_por_lote=500, modo=modo
+    )
+    assert resumen['particiones'] > 1
+
+    bases = preparar_bases(armar_trabajos([('accesspark.csv', contenido_accesspark)], [('gopass.csv', contenido_gopass)]))
+    validadas = validar_coincidencias(bases['df_accesspark'], bases['df_gopass'], modo=modo, indice=bases['indice'])
+    for fuente, validada in zip(('ACCESSPARK', 'GOPASS'), validadas):
+        esperada = etiquetar_resultado(validada, fuente)
+        particionada = pd.read_parquet(resumen['rutas'][fuente]).sort_values('fila_original', ignore_index=True)
+        assert (particionada['fila_original'].to_numpy() == np.arange(len(esperada))).all()
+        assert resumen[f'encontradas_{fuente.lower()}'] == int(validada['encontrada'].sum())
+        assert (particionada['Estado_Validacion'].astype(str) == esperada['Estado_Validacion'].astype(str)).all()
+        if modo == 'emparejamiento':
+            pd.testing.assert_series_equal(particionada['matched_row_id'], esperada['matched_row_id'], check_names=False)
+            np.testing.assert_allclose(particionada['delta_minutes'], esperada['delta_minutes'])
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import procesamiento
+from procesamiento import validar_coincidencias
+
+from conftest import base_preparada
+
+
+def conciliar_aproximadas(placa_accesspark, placa_gopass, modo='emparejamiento'):
+    """Valida un ingreso y un cobro con un minuto de diferencia y placas aproximadas"""
+    df_accesspark = base_preparada('ACCESSPARK', [(placa_accesspark, '2025-03-01 08:00:00')])
+    df_gopass = base_preparada('GOPASS', [(placa_gopass, '2025-03-01 08:01:00')])
+    return validar_coincidencias(df_accesspark, df_gopass, 10, modo, placas_aproximadas=True)
+
+
+@pytest.mark.parametrize('modo', ['emparejamiento', 'existencia'])
+@pytest.mark.parametrize('placa_accesspark, placa_gopass', [
+    ('ABC108', 'A8C1O8'),   # B/8 y 0/O
+    ('MSN210', 'MSN2I0'),   # 1/I
+    ('MVC867', 'MVC86'),    # carácter faltante
+    ('MVC867', 'MVC8677'),  # carácter sobrante
+    ('MV0867', 'MVO86'),    # faltante más un carácter confundible
+])
+def test_errores_de_lectura_coinciden(modo, placa_accesspark, placa_gopass):
+    resultado_accesspark, resultado_gopass = conciliar_aproximadas(placa_accesspark, placa_gopass, modo)
+    assert resultado_accesspark['encontrada'].tolist() == [True]
+    assert resultado_gopass['encontrada'].tolist() == [True]
+    assert resultado_accesspark['matched_plate'].tolist() == [placa_gopass]
+    assert resultado_gopass['matched_plate'].tolist() == [placa_accesspark]
+
+
+@pytest.mark.parametrize('modo', ['emparejamiento', 'existencia'])
+@pytest.mark.parametrize('placa_accesspark, placa_gopass', [
+    ('MVC867', 'MVU867'),   # C y U no se confunden: son vehículos distintos
+    ('MSN210', 'MTN210'),
+    ('KLM345', 'KLM346'),
+    ('MVC867', 'MVU86'),    # faltante, pero el resto no coincide
+    ('MVC867', 'MUC8677'),  # sobrante y además un carácter distinto
+    ('ABC12', 'ABC1'),      # muy corta para admitir un faltante
+])
+def test_placas_distintas_no_coinciden(modo, placa_accesspark, placa_gopass):
+    resultado_accesspark, resultado_gopass = conciliar_aproximadas(placa_accesspark, placa_gopass, modo)
+    assert resultado_accesspark['encontrada'].tolist() == [False]
+    assert resultado_gopass['encontrada'].tolist() == [False]
+
+
+def test_candidatos_acotados_por_registro():
+    # Una placa muy frecuente en ambas fuentes no multiplica los pares candidatos
+    filas = 2_000
+    momentos = [f'2025-03-01 {8 + i // 600:02d}:{i // 10 % 60:02d}:{i % 10 * 6:02d}' for i in range(filas)]
+    df_accesspark = base_preparada('ACCESSPARK', [('ABC108', momento) for momento in momentos])
+    df_gopass = base_preparada('GOPASS', [('A8C108', momento) for momento in momentos])
+    indice = procesamiento.indexar_coincidencias(df_accesspark, df_gopass)
+    candidatos = procesamiento.candidatos_aproximados(
+        indice, np.arange(filas), np.arange(filas), procesamiento.ventana_en_segundos(10)
+    )
+    assert len(candidatos) <= filas * 2 * procesamiento.CANDIDATOS_APROXIMADOS
+    aproximada_accesspark, aproximada_gopass = procesamiento.coincidir_aproximadas(
+        indice, procesamiento.ventana_en_segundos(10), 'emparejamiento', np.arange(filas), np.arange(filas)
+    )
+    # Cada ingreso con el cobro del mismo instante
+    assert (aproximada_accesspark == np.arange(filas)).all()
+    assert (aproximada_gopass == np.arange(filas)).all()